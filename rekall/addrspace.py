@@ -30,10 +30,25 @@
    Alias for all address spaces
 
 """
+from rekall import config
 from rekall import registry
 from rekall import utils
 
 
+config.DeclareOption(
+    "--block_cache_size", default=32 * 1024 * 1024, action=config.IntParser,
+    help="The most image data (in bytes) kept in memory by the block cache.")
+
+config.DeclareOption(
+    "--block_cache_chunk_size", default=32 * 1024, action=config.IntParser,
+    help="The size of the blocks the block cache reads from the image.")
+
+config.DeclareOption(
+    "--block_cache_readahead", default=4, action=config.IntParser,
+    help="How many blocks to read at once when the image is read "
+    "sequentially.")
+
+
 class BaseAddressSpace(object):
     """ This is the base class of all Address Spaces. """
 
@@ -102,6 +117,42 @@ class BaseAddressSpace(object):
 
         return "\x00" * length
 
+    def read_into(self, addr, buf, offset=0, length=None):
+        """Read data from addr directly into a writable buffer.
+
+        Address spaces which can avoid intermediate strings override this.
+
+        Args:
+          addr: The address to read from.
+          buf: A writable buffer (e.g. a bytearray or a memoryview of one).
+          offset: Where in buf to start writing.
+          length: How much to read (default to the end of buf).
+
+        Returns:
+          The number of bytes filled in. Unreadable data is filled with zeros,
+          like read() pads its result.
+        """
+        if length is None:
+            length = len(buf) - offset
+
+        data = self.read(addr, length) or ""
+        available = min(len(data), length)
+        buf[offset:offset + available] = buffer(data, 0, available)
+        if available < length:
+            buf[offset + available:offset + length] = "\x00" * (
+                length - available)
+
+        return length
+
+    def read_view(self, addr, length):
+        """Returns a read only buffer with the data at addr.
+
+        Where possible the buffer refers to the underlying storage without
+        copying it (and is then only valid while the address space is
+        open). The default is to just return read().
+        """
+        return self.read(addr, length)
+
     def get_available_addresses(self):
         """Generates address ranges (offset, phys_offset, size) for this AS.
 
@@ -145,6 +196,8 @@ class BaseAddressSpace(object):
             # Try to get this from the cache.
             for x in self.cache.Get("Ranges"):
                 yield x
+
+            return
         except KeyError:
             pass
 
@@ -245,6 +298,30 @@ class BufferAddressSpace(BaseAddressSpace):
         data = self.data[offset: offset + length]
         return data + "\x00" * (length - len(data))
 
+    def read_into(self, addr, buf, offset=0, length=None):
+        if length is None:
+            length = len(buf) - offset
+
+        data_offset = addr - self.base_offset
+        available = 0
+        if data_offset >= 0:
+            available = max(0, min(length, len(self.data) - data_offset))
+            buf[offset:offset + available] = buffer(
+                self.data, data_offset, available)
+
+        if available < length:
+            buf[offset + available:offset + length] = "\x00" * (
+                length - available)
+
+        return length
+
+    def read_view(self, addr, length):
+        offset = addr - self.base_offset
+        if 0 <= offset and offset + length <= len(self.data):
+            return buffer(self.data, offset, length)
+
+        return self.read(addr, length)
+
     def write(self, addr, data):
         self.data = self.data[:addr] + data + self.data[addr + len(data):]
         return True
@@ -269,47 +346,223 @@ class BufferAddressSpace(BaseAddressSpace):
         return self.base_offset + len(self.data)
 
 
-class CachingAddressSpaceMixIn(object):
-    # The size of chunks we cache. This should be large enough to make file
-    # reads efficient.
+class BlockCache(utils.FastStore):
+    """An LRU cache of image blocks, bounded by the total size of the blocks.
+
+    One cache is kept in the session for each image (see GetBlockCache()) so
+    all the address spaces reading from the image share it.
+    """
+
+    # The defaults when not set in the session.
+    MAX_BYTES = 32 * 1024 * 1024
     CHUNK_SIZE = 32 * 1024
-    CACHE_SIZE = 1000
 
-    def __init__(self, **kwargs):
-        super(CachingAddressSpaceMixIn, self).__init__(**kwargs)
-        self._cache = utils.FastStore(self.CACHE_SIZE)
+    # How many chunks we read at once when access is sequential.
+    READAHEAD = 4
+
+    def __init__(self, max_bytes=None, chunk_size=None, readahead=None):
+        super(BlockCache, self).__init__(max_size=None)
+        self.max_bytes = max_bytes or self.MAX_BYTES
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.readahead = max(1, readahead or self.READAHEAD)
+
+        # The chunk read last - used to detect sequential access.
+        self.last_chunk = None
+
+        self.total_bytes = 0
+        self.hits = self.misses = self.reads = self.readahead_chunks = 0
+
+    @utils.Synchronized
+    def Expire(self):
+        while self.total_bytes > self.max_bytes and self._age:
+            self.ExpireObject(self._age.PopLeft())
+
+    @utils.Synchronized
+    def Put(self, key, item):
+        old = self._hash.get(key)
+        if old is not None:
+            self.total_bytes -= len(old[1])
+
+        self.total_bytes += len(item)
+        return super(BlockCache, self).Put(key, item)
+
+    def Get(self, key):
+        # This is called for every read so avoids the lock (block caches are
+        # not thread safe) and relinking the most recently used chunk.
+        node, item = self._hash[key]
+        age = self._age
+        if age.prev is not node:
+            age.Unlink(node)
+            age.AppendNode(node)
+
+        return item
+
+    @utils.Synchronized
+    def ExpireObject(self, key):
+        item = super(BlockCache, self).ExpireObject(key)
+        if item is not None:
+            self.total_bytes -= len(item)
+
+        return item
+
+    def __str__(self):
+        return ("<BlockCache %d chunks (%d bytes): %d hits, %d misses, "
+                "%d reads, %d chunks read ahead>" % (
+                    len(self._hash), self.total_bytes, self.hits, self.misses,
+                    self.reads, self.readahead_chunks))
+
+
+class BlockCaches(dict):
+    """The block caches stored in the session."""
+
+    def __str__(self):
+        return "<%d block caches>" % len(self)
+
+
+def GetBlockCache(session, key=None):
+    """Returns the block cache for key, creating it if needed.
+
+    Address spaces on the same image should use the same key so they share
+    the cache. If key is None a new, private cache is returned.
+    """
+    chunk_size = (session.GetParameter("block_cache_chunk_size") or
+                  BlockCache.CHUNK_SIZE)
+    if key is not None:
+        key = key + (chunk_size,)
+        if session.block_caches is None:
+            session.block_caches = BlockCaches()
+
+        result = session.block_caches.get(key)
+        if result is not None:
+            return result
+
+    result = BlockCache(
+        max_bytes=session.GetParameter("block_cache_size"),
+        chunk_size=chunk_size,
+        readahead=session.GetParameter("block_cache_readahead"))
+
+    if key is not None:
+        session.block_caches[key] = result
+
+    return result
+
+
+class CachingAddressSpaceMixIn(object):
+    """Caches the reads of the address space in a BlockCache.
+
+    This is meant for the bottom address spaces, where reads are expensive
+    (e.g. file reads or decompression). The cache is shared by all the address
+    spaces on the same file, so the kernel and process address spaces stacked
+    on the image do not each re-read the same pages.
+    """
+
+    # Set to False to disable the cache (e.g. for live memory).
+    cache_blocks = True
+
+    _block_cache = None
+
+    @property
+    def block_cache(self):
+        if self._block_cache is None:
+            key = None
+            fname = getattr(self, "fname", None)
+            if fname:
+                key = (self.__class__.__name__, fname)
+
+            self._block_cache = GetBlockCache(self.session, key)
+
+        return self._block_cache
 
     def read(self, addr, length):
-        result = ""
+        if not self.cache_blocks:
+            return super(CachingAddressSpaceMixIn, self).read(addr, length)
+
+        # Most reads are small and fall within a single chunk.
+        cache = self._block_cache or self.block_cache
+        chunk_number, chunk_offset = divmod(addr, cache.chunk_size)
+        if chunk_offset + length <= cache.chunk_size:
+            return self._get_chunk(cache, chunk_number)[
+                chunk_offset:chunk_offset + length]
+
+        result = []
         while length > 0:
             data = self.read_partial(addr, length)
             if not data:
                 break
 
-            result += data
+            result.append(data)
             length -= len(data)
             addr += len(data)
 
-        return result
+        return "".join(result)
 
-    def read_partial(self, addr, length):
-        if addr == None:
-            return addr
+    def read_into(self, addr, buf, offset=0, length=None):
+        if not self.cache_blocks:
+            return super(CachingAddressSpaceMixIn, self).read_into(
+                addr, buf, offset, length)
+
+        if length is None:
+            length = len(buf) - offset
+
+        end = offset + length
+        while offset < end:
+            data = self.read_partial(addr, end - offset)
+            if not data:
+                buf[offset:end] = "\x00" * (end - offset)
+                break
+
+            buf[offset:offset + len(data)] = data
+            offset += len(data)
+            addr += len(data)
+
+        return length
+
+    def _read_chunk(self, cache, chunk_number):
+        chunk_size = cache.chunk_size
+
+        # Read ahead only when the previous chunk was just read.
+        count = 1
+        if cache.last_chunk == chunk_number - 1:
+            count = cache.readahead
 
-        chunk_number = addr / self.CHUNK_SIZE
-        chunk_offset = addr % self.CHUNK_SIZE
-        available_length = min(length, self.CHUNK_SIZE - chunk_offset)
+        data = super(CachingAddressSpaceMixIn, self).read(
+            chunk_number * chunk_size, chunk_size * count)
+        cache.reads += 1
+        cache.readahead_chunks += count - 1
 
+        for i in xrange(1, count):
+            cache.Put(chunk_number + i,
+                      data[i * chunk_size:(i + 1) * chunk_size])
+
+        data = data[:chunk_size]
+        cache.Put(chunk_number, data)
+
+        return data
+
+    def _get_chunk(self, cache, chunk_number):
         try:
-            data = self._cache.Get(chunk_number)
+            data = cache.Get(chunk_number)
+            cache.hits += 1
         except KeyError:
-            # Just read the data from the real class.
-            data = super(CachingAddressSpaceMixIn, self).read(
-                chunk_number * self.CHUNK_SIZE, self.CHUNK_SIZE)
+            cache.misses += 1
+            data = self._read_chunk(cache, chunk_number)
 
-            self._cache.Put(chunk_number, data)
+        cache.last_chunk = chunk_number
+        return data
 
-        return data[chunk_offset:chunk_offset+available_length]
+    def read_partial(self, addr, length):
+        if addr == None:
+            return addr
+
+        cache = self._block_cache or self.block_cache
+        chunk_number, chunk_offset = divmod(addr, cache.chunk_size)
+        available_length = min(length, cache.chunk_size - chunk_offset)
+
+        data = self._get_chunk(cache, chunk_number)
+        if chunk_offset == 0 and available_length == len(data):
+            return data
+
+        return data[chunk_offset:chunk_offset + available_length]
 
 
 class PagedReader(BaseAddressSpace):
@@ -338,6 +591,20 @@ class PagedReader(BaseAddressSpace):
 
         return self.base.read(paddr, to_read)
 
+    def _read_chunk_into(self, vaddr, buf, offset, length):
+        """Like _read_chunk() but copies the data into buf at offset.
+
+        Returns:
+          The number of bytes copied.
+        """
+        to_read = min(length, self.PAGE_SIZE - (vaddr % self.PAGE_SIZE))
+        paddr = self.vtop(vaddr)
+        if paddr is None:
+            buf[offset:offset + to_read] = "\x00" * to_read
+            return to_read
+
+        return self.base.read_into(paddr, buf, offset, to_read)
+
     def read(self, vaddr, length):
         """
         Read 'length' bytes from the virtual address 'vaddr'.
@@ -347,18 +614,41 @@ class PagedReader(BaseAddressSpace):
 
         vaddr, length = int(vaddr), int(length)
 
-        result = ''
+        result = []
 
         while length > 0:
             buf = self._read_chunk(vaddr, length)
             if not buf:
                 break
 
-            result += buf
+            result.append(buf)
             vaddr += len(buf)
             length -= len(buf)
 
-        return result
+        return "".join(result)
+
+    def read_into(self, vaddr, buf, offset=0, length=None):
+        """Read from the virtual address directly into buf.
+
+        Each page is copied straight from the physical address space into
+        buf, without building intermediate strings.
+        """
+        if length is None:
+            length = len(buf) - offset
+
+        vaddr, length = int(vaddr), int(length)
+        end = offset + length
+
+        while offset < end:
+            copied = self._read_chunk_into(vaddr, buf, offset, end - offset)
+            if not copied:
+                buf[offset:end] = "\x00" * (end - offset)
+                break
+
+            vaddr += copied
+            offset += copied
+
+        return length
 
     def is_valid_address(self, addr):
         vaddr = self.vtop(addr)
@@ -399,6 +689,24 @@ class RunBasedAddressSpace(PagedReader):
         else:
             return self.base.read(file_offset, min(length, available_length))
 
+    def _read_chunk_into(self, addr, buf, offset, length):
+        file_offset, available_length = self._get_available_buffer(addr, length)
+
+        # Mapping not valid. We need to pad until the next run.
+        if file_offset is None:
+            pad_length = length
+            try:
+                virt_addr, _, _ = self.runs.find_gt(addr)
+                pad_length = min(length, (virt_addr - addr))
+            except ValueError:
+                pass
+
+            buf[offset:offset + pad_length] = "\x00" * pad_length
+            return pad_length
+
+        return self.base.read_into(
+            file_offset, buf, offset, min(length, available_length))
+
     def vtop(self, addr):
         file_offset, _ = self._get_available_buffer(addr, 1)
         return file_offset
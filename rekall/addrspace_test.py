@@ -55,5 +55,88 @@ class RunBasedTest(unittest.TestCase):
         self.assertEqual(self.contiguous_as.read(2000, 10),
                          "\x00" * 10)
 
+    def testReadInto(self):
+        # read_into() must fill the buffer exactly as read() returns data.
+        for address_space in (self.contiguous_as, self.discontiguous_as):
+            for addr, length in ((0, 20), (1000, 30), (1005, 10), (1025, 10),
+                                 (2000, 10)):
+                buf = bytearray("X" * (length + 4))
+                self.assertEqual(
+                    address_space.read_into(addr, buf, 2, length), length)
+
+                self.assertEqual(
+                    str(buf), "XX" + address_space.read(addr, length) + "XX")
+
+    def testBufferReadView(self):
+        buffer_as = addrspace.BufferAddressSpace(
+            data="0123456789", base_offset=100, session=self.session)
+
+        self.assertEqual(str(buffer_as.read_view(102, 5)), "23456")
+
+        # Partially outside the buffer the view is padded like read().
+        self.assertEqual(str(buffer_as.read_view(105, 10)),
+                         "56789" + "\x00" * 5)
+
+        buf = bytearray(8)
+        buffer_as.read_into(108, buf)
+        self.assertEqual(str(buf), "89" + "\x00" * 6)
+
+
+class CachedBufferAddressSpace(addrspace.CachingAddressSpaceMixIn,
+                               addrspace.BufferAddressSpace):
+    """A buffer address space read through the block cache."""
+
+    def __init__(self, **kwargs):
+        super(CachedBufferAddressSpace, self).__init__(**kwargs)
+        self.fname = "image"
+
+
+class BlockCacheTest(unittest.TestCase):
+    """Test the shared block cache."""
+
+    def setUp(self):
+        self.session = session.Session()
+        self.session.SetParameter("block_cache_chunk_size", 0x10)
+        self.session.SetParameter("block_cache_size", 0x40)
+        self.session.SetParameter("block_cache_readahead", 2)
+        self.data = "".join(chr(x) for x in range(256))
+
+    def testRead(self):
+        address_space = CachedBufferAddressSpace(
+            session=self.session, data=self.data)
+
+        for addr, length in ((0, 5), (0xe, 4), (0x30, 0x25), (0xf0, 0x20)):
+            self.assertEqual(address_space.read(addr, length),
+                             self.data[addr:addr + length].ljust(
+                                 length, "\x00"))
+
+            buf = bytearray("X" * (length + 2))
+            address_space.read_into(addr, buf, 1, length)
+            self.assertEqual(str(buf), "X" + address_space.read(
+                addr, length) + "X")
+
+        # The cache never holds more than its limit.
+        cache = address_space.block_cache
+        self.assertTrue(cache.total_bytes <= 0x40)
+        self.assertTrue(cache.hits and cache.misses and cache.readahead_chunks)
+
+    def testShared(self):
+        first = CachedBufferAddressSpace(session=self.session, data=self.data)
+        second = CachedBufferAddressSpace(session=self.session, data=self.data)
+        self.assertTrue(first.block_cache is second.block_cache)
+
+        first.read(0x20, 4)
+        misses = first.block_cache.misses
+        second.read(0x22, 4)
+        self.assertEqual(second.block_cache.misses, misses)
+
+        # Sequential reads are read ahead.
+        cache = first.block_cache
+        reads = cache.reads
+        first.read(0x30, 0x20)
+        self.assertEqual(cache.reads, reads + 1)
+        self.assertEqual(cache.readahead_chunks, 1)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,244 @@
+# Rekall Memory Forensics
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+
+"""A persistent on-disk cache.
+
+Many things Rekall calculates are expensive but do not change between runs
+(e.g. parsed profiles). These can be stored in a local cache directory so the
+next invocation does not need to recalculate them.
+
+Entries are pickled python objects (or JSON, which is faster to load for large
+plain data), stored in namespaces under the directory specified by the
+cache_dir parameter. Each entry is stored together with its full key and the
+cache version, so a stale or colliding entry is never returned. If no cache_dir
+is set, the cache is disabled.
+"""
+
+__author__ = "Michael Cohen <scudette@gmail.com>"
+
+import cPickle
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from rekall import config
+from rekall import constants
+
+
+config.DeclareOption(
+    "--cache_dir", default=(config.GetHomeDir() and os.path.join(
+        config.GetHomeDir(), ".rekall_cache")),
+    help="Location of the local cache directory. Set to an empty string "
+    "to disable the on disk cache.")
+
+config.DeclareOption(
+    "--no_image_state", default=False, action="store_true",
+    help="Do not remember facts about the image (e.g. the profile and DTB) "
+    "between sessions.")
+
+
+# Increment this when the format of any cached data changes.
+CACHE_VERSION = 2
+
+
+class DiskCache(object):
+    """A versioned on-disk cache of python objects."""
+
+    def __init__(self, session=None, cache_dir=None):
+        """Create the cache.
+
+        Args:
+          session: The session. The cache directory is taken from the
+            cache_dir session parameter.
+          cache_dir: If specified, overrides the session parameter.
+        """
+        self.session = session
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_dir(self):
+        if self._cache_dir is not None:
+            return self._cache_dir
+
+        if self.session:
+            return self.session.GetParameter("cache_dir", None)
+
+    def _GetPath(self, namespace, key):
+        cache_dir = self.cache_dir
+        if not cache_dir:
+            return
+
+        return os.path.join(
+            cache_dir, namespace, hashlib.sha1(repr(key)).hexdigest())
+
+    def _Version(self):
+        # Stored as a string so it compares the same after a JSON round trip.
+        return repr((constants.VERSION, CACHE_VERSION))
+
+    def Get(self, namespace, key, use_json=False):
+        """Fetch the object stored under the key.
+
+        Args:
+          use_json: The entry was stored with use_json.
+
+        Raises:
+          KeyError: If the object is not present in the cache.
+        """
+        path = self._GetPath(namespace, key)
+        if path is None:
+            raise KeyError(key)
+
+        try:
+            with open(path, "rb") as fd:
+                if use_json:
+                    version, stored_key, value = json.load(fd)
+                else:
+                    version, stored_key, value = cPickle.load(fd)
+
+        # A missing or corrupted cache entry is just a cache miss.
+        except (IOError, EOFError, ValueError, TypeError, AttributeError,
+                ImportError, IndexError, cPickle.UnpicklingError):
+            raise KeyError(key)
+
+        if version != self._Version() or stored_key != repr(key):
+            raise KeyError(key)
+
+        return value
+
+    def Put(self, namespace, key, value, use_json=False):
+        """Store the value in the cache.
+
+        Failing to write to the cache is not fatal - we just log it.
+
+        Args:
+          use_json: Store the value as JSON. This is only possible for plain
+            data (which comes back with unicode strings and lists instead of
+            tuples), but large data loads faster than from a pickle.
+        """
+        path = self._GetPath(namespace, key)
+        if path is None:
+            return
+
+        dirname = os.path.dirname(path)
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+
+            # Write to a temporary file and rename it into place, so concurrent
+            # readers never see a partial entry.
+            fd, tmp_path = tempfile.mkstemp(dir=dirname)
+        except (IOError, OSError) as e:
+            logging.debug("Unable to write cache entry %s: %s", path, e)
+            return
+
+        try:
+            entry = (self._Version(), repr(key), value)
+            with os.fdopen(fd, "wb") as out_fd:
+                if use_json:
+                    json.dump(entry, out_fd)
+                else:
+                    cPickle.dump(entry, out_fd, cPickle.HIGHEST_PROTOCOL)
+
+            os.rename(tmp_path, path)
+
+        except (IOError, OSError, TypeError, ValueError,
+                cPickle.PicklingError) as e:
+            logging.debug("Unable to write cache entry %s: %s", path, e)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def Expire(self, namespace, key):
+        """Remove the key from the cache."""
+        path = self._GetPath(namespace, key)
+        if path is None:
+            return
+
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def ImageFingerprint(filename, samples=16, sample_size=0x1000):
+    """A cheap fingerprint of an image file.
+
+    We use the size and mtime of the file and a hash of a few blocks sampled
+    across it, so we do not need to read the whole image.
+
+    Returns:
+      A tuple identifying the image, or None if the file is not a regular file
+      (e.g. a live memory device whose contents keep changing).
+    """
+    try:
+        stat = os.stat(filename)
+    except (OSError, TypeError):
+        return
+
+    if not os.path.isfile(filename):
+        return
+
+    digest = hashlib.sha1()
+    try:
+        with open(filename, "rb") as fd:
+            for i in range(samples + 1):
+                fd.seek(max(0, stat.st_size * i / samples - sample_size))
+                digest.update(fd.read(sample_size))
+
+    except IOError:
+        return
+
+    return (os.path.abspath(filename), stat.st_size, stat.st_mtime,
+            digest.hexdigest())
+
+
+class ImageState(object):
+    """Facts about an image which are remembered across sessions.
+
+    The facts are stored in the disk cache keyed by the image fingerprint, so
+    they are forgotten as soon as the image changes.
+    """
+
+    NAMESPACE = "image_state"
+
+    def __init__(self, disk_cache, fingerprint):
+        self.disk_cache = disk_cache
+        self.fingerprint = fingerprint
+        try:
+            self.facts = disk_cache.Get(self.NAMESPACE, fingerprint)
+        except KeyError:
+            self.facts = {}
+
+    def Get(self, name):
+        """Returns the stored fact.
+
+        Raises:
+          KeyError: If the fact is not known.
+        """
+        return self.facts[name]
+
+    def Put(self, name, value):
+        self.facts[name] = value
+        self.disk_cache.Put(self.NAMESPACE, self.fingerprint, self.facts)
+
+    def Expire(self, name):
+        if self.facts.pop(name, None) is not None:
+            self.disk_cache.Put(self.NAMESPACE, self.fingerprint, self.facts)
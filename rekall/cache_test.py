@@ -0,0 +1,282 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from rekall import cache
+from rekall import io_manager
+from rekall import addrspace
+from rekall import kb
+from rekall import obj
+from rekall import session
+from rekall.plugins.overlays import basic
+from rekall.plugins.overlays.windows import kernel
+
+
+class ImageStateTestHook(kb.ParameterHook):
+    """A persistent hook which counts how often it is calculated."""
+
+    name = "image_state_test"
+
+    persistent = True
+
+    calls = 0
+
+    def calculate(self):
+        ImageStateTestHook.calls += 1
+        return 42
+
+
+class ProfileImageStateTestHook(kb.ProfileSpecificHookMixin,
+                                kb.ParameterHook):
+    """A persistent hook which is only valid with the same profile."""
+
+    name = "profile_image_state_test"
+
+    persistent = True
+
+    calls = 0
+
+    def calculate(self):
+        ProfileImageStateTestHook.calls += 1
+        return self.session.profile.name
+
+
+class CompiledTypesTestProfile(basic.Profile32Bits):
+    """A profile with an overlay."""
+
+    @classmethod
+    def Initialize(cls, profile):
+        super(CompiledTypesTestProfile, cls).Initialize(profile)
+        profile.add_overlay({
+            "_A": [None, {
+                "Field1": [None, ["unsigned short"]],
+                }]})
+
+
+class DiskCacheTest(unittest.TestCase):
+    """Test the on-disk cache."""
+
+    def setUp(self):
+        self.temp_directory = tempfile.mkdtemp()
+        self.cache = cache.DiskCache(
+            cache_dir=self.temp_directory + "/cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_directory)
+
+    def testGetPut(self):
+        self.assertRaises(KeyError, self.cache.Get, "test", "foo")
+
+        self.cache.Put("test", ("foo", 1), dict(hello=[1, 2, 3]))
+        self.assertEqual(self.cache.Get("test", ("foo", 1)),
+                         dict(hello=[1, 2, 3]))
+
+        # Keys in different namespaces are distinct.
+        self.assertRaises(KeyError, self.cache.Get, "other", ("foo", 1))
+
+        self.cache.Expire("test", ("foo", 1))
+        self.assertRaises(KeyError, self.cache.Get, "test", ("foo", 1))
+
+    def testDisabledCache(self):
+        disabled_cache = cache.DiskCache(session=session.Session())
+        disabled_cache.Put("test", "foo", "bar")
+        self.assertRaises(KeyError, disabled_cache.Get, "test", "foo")
+
+    def testJSON(self):
+        self.cache.Put("test", ("foo", 1), dict(hello=(1, 2)), use_json=True)
+        self.assertEqual(self.cache.Get("test", ("foo", 1), use_json=True),
+                         dict(hello=[1, 2]))
+        self.assertRaises(KeyError, self.cache.Get, "test", ("foo", 2),
+                          use_json=True)
+
+    def testProfileCache(self):
+        path = os.path.join(self.temp_directory, "profile.json")
+        container = io_manager.DirectoryIOManager(self.temp_directory)
+
+        def WriteProfile(address):
+            with open(path, "wb") as fd:
+                json.dump({
+                    "$METADATA": dict(ProfileClass="Profile32Bits"),
+                    "$CONSTANTS": dict(Symbol=address),
+                    "$ENUMS": dict(Enum={"1": "One"}),
+                    "$STRUCTS": {"_A": [4, {
+                        "Field": [0, ["unsigned int"]],
+                        }]}}, fd)
+
+            return container.CacheKey("profile.json")
+
+        def LoadProfile():
+            return session.Session(
+                cache_dir=self.temp_directory + "/cache").LoadProfile(path)
+
+        key = WriteProfile(0x1000)
+        profile = LoadProfile()
+        self.assertEqual(self.cache.Get("profiles", key, use_json=True),
+                         json.loads(json.dumps(profile.GetSetupState())))
+
+        # The next session loads the same profile from the cached state.
+        profile = LoadProfile()
+        self.assertEqual(profile.get_constant("Symbol"), 0x1000)
+        self.assertEqual(profile.get_constant_by_address(0x1000), "Symbol")
+        self.assertEqual(profile.get_enum("Enum", "1"), "One")
+        self.assertEqual(profile._A(vm=addrspace.BufferAddressSpace(
+            data="\x01\x00\x00\x00", session=profile.session)).Field, 1)
+
+        # The profile is not parsed if it is in the cache.
+        state = self.cache.Get("profiles", key, use_json=True)
+        state["constants"]["Symbol"] = 0x2000
+        self.cache.Put("profiles", key, state, use_json=True)
+        self.assertEqual(LoadProfile().get_constant("Symbol"), 0x2000)
+
+        # Changing the profile invalidates the cache.
+        self.assertNotEqual(WriteProfile(0x123456), key)
+        self.assertEqual(LoadProfile().get_constant("Symbol"), 0x123456)
+
+
+class ImageStateTest(unittest.TestCase):
+    """Test remembering facts about images."""
+
+    def setUp(self):
+        self.temp_directory = tempfile.mkdtemp()
+        self.image = os.path.join(self.temp_directory, "image")
+        with open(self.image, "wb") as fd:
+            fd.write("\x00" * 0x100000 + "data" * 0x1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_directory)
+
+    def MakeSession(self):
+        return session.Session(
+            filename=self.image, no_autodetect=True,
+            cache_dir=self.temp_directory + "/cache")
+
+    def testFingerprint(self):
+        fingerprint = cache.ImageFingerprint(self.image)
+        self.assertEqual(fingerprint, cache.ImageFingerprint(self.image))
+
+        # Changing a sampled block changes the fingerprint.
+        stat = os.stat(self.image)
+        with open(self.image, "r+b") as fd:
+            fd.write("changed")
+
+        os.utime(self.image, (stat.st_atime, stat.st_mtime))
+        self.assertNotEqual(fingerprint, cache.ImageFingerprint(self.image))
+
+        self.assertEqual(cache.ImageFingerprint(self.temp_directory), None)
+
+    def testPersistentHook(self):
+        ImageStateTestHook.calls = 0
+        self.assertEqual(self.MakeSession().GetParameter("image_state_test"),
+                         42)
+        self.assertEqual(ImageStateTestHook.calls, 1)
+
+        # A new session remembers the result.
+        self.assertEqual(self.MakeSession().GetParameter("image_state_test"),
+                         42)
+        self.assertEqual(ImageStateTestHook.calls, 1)
+
+        # The physical address space stack is also remembered.
+        test_session = self.MakeSession()
+        test_session.plugins.load_as().GetPhysicalAddressSpace()
+        self.assertEqual(test_session.GetImageState().Get("pas_spec"),
+                         "FileAddressSpace")
+
+        # But not once the image changes.
+        os.utime(self.image, (1, 1))
+        self.assertEqual(self.MakeSession().GetParameter("image_state_test"),
+                         42)
+        self.assertEqual(ImageStateTestHook.calls, 2)
+
+    def testProfileSpecificHook(self):
+        ProfileImageStateTestHook.calls = 0
+
+        def GetParameter(profile_name):
+            test_session = self.MakeSession()
+            test_session.profile = basic.Profile32Bits(
+                name=profile_name, session=test_session)
+            return test_session.GetParameter("profile_image_state_test")
+
+        self.assertEqual(GetParameter("a"), "a")
+        self.assertEqual(GetParameter("a"), "a")
+        self.assertEqual(ProfileImageStateTestHook.calls, 1)
+
+        # The value remembered with another profile is not used.
+        self.assertEqual(GetParameter("b"), "b")
+        self.assertEqual(ProfileImageStateTestHook.calls, 2)
+
+        # A remembered kernel base is also checked for the kernel image.
+        test_session = self.MakeSession()
+        test_session.profile = basic.Profile32Bits(
+            name="a", session=test_session)
+        test_session.kernel_address_space = addrspace.BufferAddressSpace(
+            data="\x00" * 0x2000, session=test_session)
+
+        hook = kernel.KernelBaseHook(test_session)
+        data = hook.Serialize(0x1000)
+        self.assertEqual(data, dict(profile="a", value=0x1000))
+        self.assertEqual(hook.Deserialize(data), None)
+
+
+class CompiledTypesTest(unittest.TestCase):
+    """Test storing compiled profile types in the disk cache."""
+
+    def setUp(self):
+        self.temp_directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_directory, "profile.json")
+        with open(self.path, "wb") as fd:
+            json.dump({
+                "$METADATA": dict(ProfileClass="CompiledTypesTestProfile"),
+                "$STRUCTS": {
+                    "_A": [8, {
+                        "Field1": [0, ["unsigned int"]],
+                        "Field2": [4, ["unsigned int"]],
+                        }],
+                    "_B": [4, {
+                        "Field": [0, ["unsigned int"]],
+                        }],
+                    }}, fd)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_directory)
+
+    def MakeSession(self):
+        return session.Session(
+            no_autodetect=True, cache_compiled_types=True,
+            cache_dir=self.temp_directory + "/cache")
+
+    def testCompiledTypes(self):
+        test_session = self.MakeSession()
+        profile = test_session.profile = test_session.LoadProfile(self.path)
+        address_space = addrspace.BufferAddressSpace(
+            data="\x01\x02\x03\x04\x05\x06\x07\x08", session=test_session)
+
+        # Members are only resolved when they are accessed.
+        test_obj = profile._A(offset=0, vm=address_space)
+        self.assertTrue(isinstance(test_obj.members["Field2"], obj.LazyMember))
+        self.assertEqual(test_obj.Field1, 0x0201)
+        self.assertEqual(test_obj.members["Field1"][0], 0)
+        self.assertFalse(isinstance(test_obj.members["Field1"], obj.LazyMember))
+        self.assertEqual(profile.get_obj_offset("_A", "Field2"), 4)
+
+        self.assertTrue("_A" in profile.compile_times)
+        self.assertFalse("_B" in profile.compile_times)
+
+        # Only types with overlays are stored.
+        test_session.StoreCompiledTypes()
+        self.assertEqual(profile.precompiled_types.keys(), ["_A"])
+
+        # The next session uses the stored type without applying overlays.
+        test_session = self.MakeSession()
+        profile = test_session.LoadProfile(self.path)
+        self.assertEqual(profile.precompiled_types.keys(), ["_A"])
+
+        profile._apply_type_overlay = None
+        test_obj = profile._A(offset=0, vm=address_space)
+        self.assertEqual(test_obj.Field1, 0x0201)
+        self.assertEqual(test_obj.Field2, 0x08070605)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -107,6 +107,16 @@ class IOManager(object):
         except IOManagerError:
             return None
 
+    def CacheKey(self, name):
+        """A key for caching what is derived from the container member.
+
+        The key must change when the member changes, and must be cheap to
+        obtain (i.e. without reading the member).
+
+        Returns:
+          A tuple, or None if the member should not be cached.
+        """
+
     def StoreData(self, name, data, **options):
         """Stores the data in the named container member.
 
@@ -180,6 +190,15 @@ class DirectoryIOManager(IOManager):
         except IOError:
             return gzip.open(path + ".gz")
 
+    def CacheKey(self, name):
+        path = self._GetAbsolutePathName(name)
+        for candidate in (path, path + ".gz"):
+            try:
+                stat = os.stat(candidate)
+                return (candidate, stat.st_size, stat.st_mtime)
+            except OSError:
+                pass
+
     def __str__(self):
         return "Directory:%s" % self.dump_dir
 
@@ -280,6 +299,15 @@ class ZipFileManager(IOManager):
         except KeyError as e:
             raise IOManagerError(e)
 
+    def CacheKey(self, name):
+        # The zip directory has the CRC so we do not need to read the member.
+        try:
+            info = self.zip.getinfo(name)
+        except KeyError:
+            return
+
+        return (self.file_name, name, info.CRC, info.file_size)
+
     def __enter__(self):
         self._outstanding_writers.add(self)
         return self
@@ -364,6 +392,13 @@ class URLManager(IOManager):
         url = self.url._replace(path="%s/%s" % (self.url.path, name))
         return urlparse.urlunparse(url)
 
+    def CacheKey(self, name):
+        # Checking the server for changes would be as slow as fetching the
+        # member. Profile repositories are pinned to a revision (see
+        # constants.SUPPORTED_PROFILE_REPOSITORY) and changed profiles get new
+        # names, so we trust the cache. Remove the cache_dir to refetch.
+        return (self._GetURL(name),)
+
     def Open(self, name):
         url = self._GetURL(name)
 
@@ -68,6 +68,77 @@ class SymbolAddresses(SortedAddresses):
             pass
 
 
+class SymbolIndex(object):
+    """An index of a profile's constants by address and by name.
+
+    The addresses are kept in a sorted list, so the nearest symbol to an
+    address is found by bisection. The names are also kept sorted, so all the
+    names with a common prefix are found by bisection as well.
+
+    The index is built from the profile's constant_addresses. Profiles replace
+    this collection when constants are added, so the index is stale when its
+    source is no longer the profile's collection.
+    """
+
+    # Characters which end the literal prefix of a search pattern.
+    PATTERN_SPECIAL = re.compile(r"[\\.^$*+?{}\[\]|()]")
+
+    def __init__(self, profile):
+        self.source = profile.constant_addresses
+
+        # The (address, name) tuples and their addresses.
+        self.items = list(self.source)
+        self.addresses = [address for address, _ in self.items]
+
+        # The names are only sorted when they are first searched.
+        self.constants = profile.constants
+        self.names = None
+
+    def IsValidFor(self, profile):
+        return self.source is profile.constant_addresses
+
+    def FindNearest(self, address):
+        """Returns the (address, name) at or below the address (or None)."""
+        i = bisect.bisect_right(self.addresses, address)
+        if i:
+            return self.items[i - 1]
+
+    def Lookup(self, address):
+        """Returns the name of the constant at the address (or None)."""
+        result = self.FindNearest(address)
+        if result and result[0] == address:
+            return result[1]
+
+    def FindNamesWithPrefix(self, prefix):
+        """Yields all the names starting with the prefix."""
+        if self.names is None:
+            self.names = sorted(self.constants)
+
+        i = bisect.bisect_left(self.names, prefix)
+        while i < len(self.names) and self.names[i].startswith(prefix):
+            yield self.names[i]
+            i += 1
+
+    def Search(self, pattern):
+        """Returns all the names matching the regular expression pattern.
+
+        Only names starting with the literal prefix of the pattern are checked.
+        """
+        regex = re.compile(pattern)
+        prefix = self.PATTERN_SPECIAL.split(pattern, 1)[0]
+
+        # A quantifier applies to the last literal character.
+        if len(prefix) < len(pattern) and pattern[len(prefix)] in "*?{":
+            prefix = prefix[:-1]
+
+        # Alternatives may start with anything, so all names are checked.
+        if "|" in pattern:
+            prefix = ""
+
+        return [name for name in self.FindNamesWithPrefix(prefix)
+                if regex.match(name)]
+
+
 class ParameterHook(object):
     """A mechanism for automatically calculating a parameter.
 
@@ -97,6 +168,11 @@ class ParameterHook(object):
     # physical_address_space.metadata("live") == True.
     expiry = None
 
+    # If set, the parameter is remembered in the image state (see
+    # cache.ImageState), so later sessions on the same image need not calculate
+    # it again.
+    persistent = False
+
     @classmethod
     def is_active(cls, session):
         _ = session
@@ -108,6 +184,41 @@ class ParameterHook(object):
     def calculate(self):
         """Derive the value of the parameter."""
 
+    def Serialize(self, value):
+        """Returns a simple (picklable) version of the value to remember."""
+        return value
+
+    def Deserialize(self, data):
+        """Recreates the value from Serialize().
+
+        Returns None if the remembered value is no longer valid, in which case
+        the value is calculated again.
+        """
+        return data
+
+
+class ProfileSpecificHookMixin(object):
+    """Remembers a persistent hook's value with the name of the profile.
+
+    Values like the kernel base or the offset of a kernel struct are only
+    meaningful with the profile they were found with. If a later session on the
+    same image uses another profile (e.g. one given on the command line), the
+    remembered value is ignored and calculated again.
+    """
+
+    def Serialize(self, value):
+        return dict(profile=self.session.profile.name,
+                    value=super(ProfileSpecificHookMixin, self).Serialize(
+                        value))
+
+    def Deserialize(self, data):
+        profile = self.session.profile
+        if (not profile or not isinstance(data, dict) or
+                data.get("profile") != profile.name):
+            return
+
+        return super(ProfileSpecificHookMixin, self).Deserialize(data["value"])
+
 
 class AddressResolver(object):
     """Wrapper around a profile which allows addresses to be resolved in it."""
@@ -188,6 +299,38 @@ class AddressResolver(object):
         self.modules = None
         self.modules_by_name = {}
         self.profiles = {}
+        self.symbol_indexes = {}
+
+    def GetSymbolIndex(self, profile):
+        """Returns the SymbolIndex for the profile, building it if needed."""
+        index = self.symbol_indexes.get(profile.name)
+        if index is None or not index.IsValidFor(profile):
+            index = self.symbol_indexes[profile.name] = SymbolIndex(profile)
+
+        return index
+
+    def _GetNearestConstant(self, profile, address):
+        """Like profile.get_nearest_constant_by_address() but uses the index.
+
+        Returns:
+          (address, name) or None if there is no constant below the address.
+        """
+        # This is GetSymbolIndex() inlined since it is called for every
+        # address we format.
+        index = self.symbol_indexes.get(profile.name)
+        if index is None or index.source is not profile.constant_addresses:
+            index = self.GetSymbolIndex(profile)
+
+        # Windows profiles keep constants relative to the module's base.
+        get_image_base = getattr(profile, "GetImageBase", None)
+        if get_image_base is None:
+            return index.FindNearest(address)
+
+        image_base = get_image_base()
+        if address >= image_base:
+            result = index.FindNearest(address - image_base)
+            if result:
+                return result[0] + image_base, result[1]
 
     def get_constant_object(self, name, target, **kwargs):
         """Instantiate the named constant with these args."""
@@ -222,8 +365,8 @@ class AddressResolver(object):
 
         if self.vad is None and hasattr(self.session.plugins, "vad"):
             # Hold on to the vad plugin for resolving process address
-            # spaces. The vad plugin maintains its own per-process cache so we
-            # do not need to reset it here.
+            # spaces. The per-process VAD indexes are kept in the session so we
+            # do not need to reset them here.
             self.vad = self.session.plugins.vad()
 
     def _LoadProfile(self, module_name, profile):
@@ -268,19 +411,44 @@ class AddressResolver(object):
                 session=self.session)
             result.image_base = module_base
 
+        # Symbols from the profile take precedence over exports. Constants
+        # are relative to the image base, just like the RVAs.
+        constants = {}
+        index = SymbolIndex(result)
+        for name, rva in self.GetExports(module, guid).iteritems():
+            if index.Lookup(rva) is None:
+                constants[name] = rva
+
+        result.add_constants(constants_are_addresses=True, **constants)
+
+        self.profiles[module_name] = result
+
+        return result
+
+    def GetExports(self, module, guid=None):
+        """Returns a dict of the module's exports and their RVAs.
+
+        Parsing the export table is slow, so if the module's GUID is known the
+        exports are kept in the disk cache.
+        """
+        key = (self._NormalizeModuleName(module), str(guid or ""))
+        if guid:
+            try:
+                return self.session.disk_cache.Get("exports", key)
+            except KeyError:
+                pass
+
+        module_base = module.base
         peinfo = self.session.plugins.peinfo(image_base=module_base,
                                              address_space=module.obj_vm)
 
-        constants = {}
+        result = {}
         for _, func, name, _ in peinfo.pe_helper.ExportDirectory():
             self.session.report_progress("Merging export table: %s", name)
-            func_offset = func.v()
-            if not result.get_constant_by_address(func_offset):
-                constants[str(name or "")] = func_offset - module_base
+            result[str(name or "")] = func.v() - module_base
 
-        result.add_constants(constants_are_addresses=True, **constants)
-
-        self.profiles[module_name] = result
+        if guid:
+            self.session.disk_cache.Put("exports", key, result)
 
         return result
 
@@ -382,9 +550,9 @@ class AddressResolver(object):
             module_profile = self.LoadProfileForName(module_name)
 
             if module_profile:
-                constant = module_profile.get_constant_by_address(address)
-                if constant:
-                    return "%s!%s" % (module_name, constant)
+                constant = self._GetNearestConstant(module_profile, address)
+                if constant and constant[0] == address:
+                    return "%s!%s" % (module_name, constant[1])
             else:
                 return module_name
 
@@ -408,9 +576,9 @@ class AddressResolver(object):
 
             # Try to load the module profile.
             profile = self.LoadProfileForName(module_name)
-            if profile:
-                offset, name = profile.get_nearest_constant_by_address(
-                    address)
+            constant = profile and self._GetNearestConstant(profile, address)
+            if constant:
+                offset, name = constant
 
                 # The profile's constant is closer than the module.
                 if address - offset < address - nearest_offset:
@@ -429,15 +597,10 @@ class AddressResolver(object):
     def search_symbol(self, pattern):
         # Currently we only allow searching in the same module.
         self._EnsureInitialized()
-        result = []
 
         components = self._ParseAddress(pattern)
         profile = self.LoadProfileForName(components["module"])
 
         # Match all symbols.
-        symbol_regex = re.compile(components["symbol"].replace("*", ".*"))
-        for constant in profile.constants:
-            if symbol_regex.match(constant):
-                result.append(constant)
-
-        return result
+        return self.GetSymbolIndex(profile).Search(
+            components["symbol"].replace("*", ".*"))
@@ -0,0 +1,75 @@
+import unittest
+
+from rekall import kb
+from rekall import obj
+from rekall import session
+
+# Import and register all the plugins.
+from rekall import plugins  # pylint: disable=unused-import
+
+
+class SymbolIndexTest(unittest.TestCase):
+    """Test the symbol index."""
+
+    def setUp(self):
+        self.session = session.Session()
+        self.profile = obj.Profile.classes["BasicPEProfile"](
+            session=self.session)
+        self.profile.image_base = 0x10000
+        self.profile.add_constants(
+            constants_are_addresses=True,
+            PsGetProcessId=0x100, PsGetThreadId=0x200, KeBugCheck=0x300,
+            Ps=0x50)
+
+    def testIndex(self):
+        index = kb.SymbolIndex(self.profile)
+        self.assertEqual(index.FindNearest(0x10), None)
+        self.assertEqual(index.FindNearest(0x150), (0x100, "PsGetProcessId"))
+        self.assertEqual(index.FindNearest(0x1000), (0x300, "KeBugCheck"))
+        self.assertEqual(index.Lookup(0x200), "PsGetThreadId")
+        self.assertEqual(index.Lookup(0x201), None)
+
+        self.assertEqual(index.Search("PsGet.*"),
+                         ["PsGetProcessId", "PsGetThreadId"])
+        self.assertEqual(index.Search("Ps?G"), ["PsGetProcessId",
+                                                "PsGetThreadId"])
+        self.assertEqual(index.Search(".*Id"), ["PsGetProcessId",
+                                                "PsGetThreadId"])
+        self.assertEqual(index.Search("Ps$"), ["Ps"])
+
+        # Alternatives match like re.match().
+        self.assertEqual(index.Search("KeBug|PsGet.*"), [
+            "KeBugCheck", "PsGetProcessId", "PsGetThreadId"])
+        self.assertEqual(index.Search("Ps.*|Ke.*"), [
+            "KeBugCheck", "Ps", "PsGetProcessId", "PsGetThreadId"])
+
+        # Adding constants invalidates the index.
+        self.assertTrue(index.IsValidFor(self.profile))
+        self.profile.add_constants(constants_are_addresses=True, Foo=0x400)
+        self.assertFalse(index.IsValidFor(self.profile))
+
+    def testResolver(self):
+        resolver = kb.AddressResolver(self.session)
+
+        # The resolver takes the image base into account like the profile.
+        for address in (0x100, 0x10150, 0x10350):
+            expected = self.profile.get_nearest_constant_by_address(address)
+            if address < self.profile.image_base:
+                self.assertEqual(
+                    resolver._GetNearestConstant(self.profile, address), None)
+            else:
+                self.assertEqual(
+                    resolver._GetNearestConstant(self.profile, address),
+                    expected)
+
+        index = resolver.GetSymbolIndex(self.profile)
+        self.assertTrue(resolver.GetSymbolIndex(self.profile) is index)
+
+        self.profile.add_constants(constants_are_addresses=True, Foo=0x400)
+        self.assertEqual(
+            resolver._GetNearestConstant(self.profile, 0x10400),
+            (0x10400, "Foo"))
+
+
+if __name__ == "__main__":
+    unittest.main()
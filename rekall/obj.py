@@ -36,6 +36,7 @@ import logging
 import operator
 import os
 import struct
+import time
 
 import copy
 from rekall import addrspace
@@ -68,6 +69,10 @@ class ProfileLog(object):
     def __init__(self):
         self.data = {}
         self.filename = os.environ.get(self.ENVIRONMENT_VAR)
+
+        # Hot code paths check this attribute before calling LogFieldAccess()
+        # so that logging costs nothing when it is disabled.
+        self.active = bool(self.filename)
         if self.filename:
             # Ensure we update the object access log when we exit.
             atexit.register(self._DumpData)
@@ -101,7 +106,7 @@ class ProfileLog(object):
 
     def LogFieldAccess(self, profile, obj_type, field_name):
         # Do nothing unless the environment is set.
-        if self.is_active():
+        if self.active:
             profile = self.data.setdefault(profile, {})
             fields = profile.setdefault(obj_type, set())
             if field_name:
@@ -110,6 +115,11 @@ class ProfileLog(object):
     def LogConstant(self, profile, name):
         self.LogFieldAccess(profile, "Constants", name)
 
+    def LogCompileTime(self, profile, obj_type, seconds):
+        if self.active:
+            profile = self.data.setdefault(profile, {})
+            profile.setdefault("$COMPILE_TIMES", {})[obj_type] = seconds
+
     @staticmethod
     def is_active():
         return bool(os.environ.get(ProfileLog.ENVIRONMENT_VAR))
@@ -590,8 +600,17 @@ class NativeType(BaseObject, NumericProxyMixIn):
         self.format_string = format_string
         self.value = value
 
+        # Remember the value once read if the profile memoizes members.
+        self._memoize = (
+            value is None and self.obj_profile is not None and
+            self.obj_profile.memoize_members and
+            not getattr(self.obj_vm, "writeable", False))
+
     def write(self, data):
         """Writes the data back into the address space"""
+        if self._memoize:
+            self.value = None
+
         output = struct.pack(self.format_string, data)
         return self.obj_vm.write(self.obj_offset, output)
 
@@ -617,6 +636,8 @@ class NativeType(BaseObject, NumericProxyMixIn):
                     self.size(), self.obj_offset))
 
         (val,) = struct.unpack(self.format_string, data)
+        if self._memoize:
+            self.value = val
 
         return val
 
@@ -1124,6 +1145,10 @@ class Struct(BaseAddressComparisonMixIn, BaseObject):
     Structs have members at various fixed relative offsets from our own base
     offset.
     """
+
+    # A cache of member objects, used when the profile memoizes members.
+    _member_cache = None
+
     def __init__(self, members=None, struct_size=0, **kwargs):
         """ This must be instantiated with a dict of members. The keys
         are the offsets, the values are Curried Object classes that
@@ -1137,7 +1162,9 @@ class Struct(BaseAddressComparisonMixIn, BaseObject):
            struct_size: The size of this struct if known (Can be None).
         """
         super(Struct, self).__init__(**kwargs)
-        ACCESS_LOG.LogFieldAccess(self.obj_profile.name, self.obj_type, None)
+        if ACCESS_LOG.active:
+            ACCESS_LOG.LogFieldAccess(
+                self.obj_profile.name, self.obj_type, None)
 
         if not members:
             # Warn rather than raise an error, since some types (_HARDWARE_PTE,
@@ -1149,6 +1176,12 @@ class Struct(BaseAddressComparisonMixIn, BaseObject):
         self.members = members
         self.struct_size = struct_size
 
+        # Member objects can only be reused if the underlying memory can not
+        # change under us.
+        if (self.obj_profile.memoize_members and
+                not getattr(self.obj_vm, "writeable", False)):
+            self._member_cache = {}
+
     def __hash__(self):
         return self.obj_offset + hash(self.obj_vm)
 
@@ -1214,7 +1247,16 @@ class Struct(BaseAddressComparisonMixIn, BaseObject):
 
         To access a field which has been renamed in different OS versions.
         """
-        ACCESS_LOG.LogFieldAccess(self.obj_profile.name, self.obj_type, attr)
+        if ACCESS_LOG.active:
+            ACCESS_LOG.LogFieldAccess(
+                self.obj_profile.name, self.obj_type, attr)
+
+        member_cache = self._member_cache
+        if member_cache is not None:
+            try:
+                return member_cache[attr]
+            except KeyError:
+                pass
 
         # Allow subfields to be gotten via this function.
         if "." in attr:
@@ -1249,6 +1291,9 @@ class Struct(BaseAddressComparisonMixIn, BaseObject):
         except Error, e:
             result = NoneObject(str(e))
 
+        if member_cache is not None:
+            member_cache[attr] = result
+
         return result
 
     def __getattr__(self, attr):
@@ -1294,6 +1339,49 @@ class Struct(BaseAddressComparisonMixIn, BaseObject):
             yield item
 
 
+class LazyMember(object):
+    """A Struct member which has not been resolved yet.
+
+    Converting a member's vtype descriptor into a callable is deferred until
+    the member is first accessed. The LazyMember then replaces itself in the
+    members dict (which is shared by all instances of the Struct) with the
+    usual (offset, callable) pair.
+    """
+
+    def __init__(self, profile, members, name, offset, type_list):
+        self.profile = profile
+        self.members = members
+        self.name = name
+        self.offset = offset
+        self.type_list = type_list
+
+    def resolve(self):
+        result = (self.offset,
+                  self.profile.list_to_type(self.name, self.type_list))
+        self.members[self.name] = result
+
+        return result
+
+    def __call__(self, struct_obj):
+        self.resolve()
+        return struct_obj.m(self.name)
+
+    def __getitem__(self, item):
+        return self.resolve()[item]
+
+
+def IsPlainData(value):
+    """Is value made of only plain (i.e. serializable) python data?"""
+    if isinstance(value, (list, tuple)):
+        return all(IsPlainData(x) for x in value)
+
+    if isinstance(value, dict):
+        return all(IsPlainData(x) and IsPlainData(y)
+                   for x, y in value.iteritems())
+
+    return value is None or isinstance(value, (basestring, int, long, float))
+
+
 ## Profiles are the interface for creating/interpreting
 ## objects
 
@@ -1341,6 +1429,19 @@ class Profile(object):
     # from METADATA here.
     _metadata = None
 
+    # If set, Struct instances cache their member objects and native values
+    # read from the image. This is only safe on static images, so it is
+    # enabled with the memoize_structs session parameter.
+    memoize_members = False
+
+    # The time in seconds it took to compile each type.
+    compile_times = None
+
+    # Type descriptors with the overlays already applied. These are kept in
+    # the disk cache between sessions (see GetCompiledTypes()). Keys are type
+    # names and values are (vtype, type overlays, descriptor) tuples.
+    precompiled_types = None
+
     @classmethod
     def LoadProfileFromData(cls, data, session=None, name=None):
         """Creates a profile directly from a JSON object.
@@ -1364,21 +1465,66 @@ class Profile(object):
             if profile_type == "Symlink":
                 return session.LoadProfile(metadata.get("Target"))
 
-            profile_cls = cls.classes.get(metadata["ProfileClass"])
+            result = cls._GetProfileClass(metadata)(
+                name=name, session=session, metadata=metadata)
+
+            result._SetupProfileFromData(data)  # pylint: disable=protected-access
+            return result
+
+    @classmethod
+    def LoadProfileFromState(cls, state, session=None, name=None):
+        """Creates a profile from the state returned by GetSetupState().
 
-            if profile_cls is None:
-                logging.warn("No profile implementation class %s" %
-                             metadata["ProfileClass"])
+        This is much faster than LoadProfileFromData() since the types do not
+        need to be copied and the constants are already sorted.
 
-                raise IOError(
-                    "No profile implementation class %s" %
-                    metadata["ProfileClass"])
+        Raises:
+          IOError if we can not load the profile.
+        """
+        metadata = state["metadata"]
+        result = cls._GetProfileClass(metadata)(
+            name=name, session=session, metadata=metadata)
+
+        result.vtypes = state["vtypes"]
+        result.known_types.update(result.vtypes)
+        result.constants = state["constants"]
+        result.constant_addresses = utils.SortedCollection(
+            [tuple(x) for x in state["constant_addresses"]],
+            key=lambda x: x[0])
+        result.enums = state["enums"]
+        result.reverse_enums = state["reverse_enums"]
 
-            result = profile_cls(name=name, session=session,
-                                 metadata=metadata)
+        return result
 
-            result._SetupProfileFromData(data)  # pylint: disable=protected-access
-            return result
+    @classmethod
+    def _GetProfileClass(cls, metadata):
+        profile_cls = cls.classes.get(metadata["ProfileClass"])
+
+        if profile_cls is None:
+            logging.warn("No profile implementation class %s" %
+                         metadata["ProfileClass"])
+
+            raise IOError(
+                "No profile implementation class %s" %
+                metadata["ProfileClass"])
+
+        return profile_cls
+
+    def GetSetupState(self):
+        """Returns the state set up from the profile data.
+
+        The state is plain data (which can be stored as JSON) to recreate the
+        profile with LoadProfileFromState(). Once the profile is initialized
+        this returns None, since the state would include what Initialize()
+        added.
+        """
+        if self._initialized:
+            return
+
+        return dict(metadata=self._metadata, vtypes=self.vtypes,
+                    constants=self.constants,
+                    constant_addresses=list(self.constant_addresses),
+                    enums=self.enums, reverse_enums=self.reverse_enums)
 
     def _SetupProfileFromData(self, data):
         """Sets up the current profile."""
@@ -1440,6 +1586,9 @@ class Profile(object):
         if session is None:
             raise RuntimeError("Session must be specified.")
 
+        self.memoize_members = bool(
+            session.GetParameter("memoize_structs", False))
+
         self.overlays = []
         self.vtypes = {}
         self.generators = {}
@@ -1450,6 +1599,9 @@ class Profile(object):
         self.applied_modifications = []
         self.applied_modifications.append(self.name)
         self.object_classes = {}
+        self.compile_times = {}
+        self.precompiled_types = {}
+        self._compiled_descriptors = {}
 
         # Keep track of all the known types so we can command line complete.
         self.known_types = set()
@@ -1499,6 +1651,7 @@ class Profile(object):
         result._initialized = self._initialized
         result.known_types = self.known_types.copy()
         result._metadata = self._metadata.copy()
+        result.precompiled_types = self.precompiled_types
         # pylint: enable=protected-access
 
         return result
@@ -1557,18 +1710,25 @@ class Profile(object):
         """Add the kwargs as constants for this profile."""
         self.flush_cache()
 
+        addresses = []
         for k, v in kwargs.iteritems():
             self.constants[k] = v
             if constants_are_addresses:
                 try:
                     # We need to interpret the value as a pointer.
-                    address = Pointer.integer_to_address(v)
-                    if (address, 0) not in self.constant_addresses:
-                        self.constant_addresses.insert((address, k))
+                    addresses.append((Pointer.integer_to_address(v), k))
 
                 except ValueError:
                     pass
 
+        # Sorting everything once is much faster than inserting each address
+        # when many constants are added (e.g. from an export table). Note that
+        # a new collection is made so users can tell the constants changed.
+        if addresses:
+            self.constant_addresses = utils.SortedCollection(
+                list(self.constant_addresses) + addresses,
+                key=lambda x: x[0])
+
     def add_reverse_enums(self, **kwargs):
         """Add the kwargs as a reverse enum for this profile."""
         for k, v in kwargs.iteritems():
@@ -1609,20 +1769,50 @@ class Profile(object):
         """Compile the specific type and ensure it exists in the type cache.
 
         The type_name here is a reference to the vtypes which are loaded into
-        the profile.
+        the profile. Types are only compiled when they are first used, and
+        their members are only resolved when they are first accessed.
         """
         # Make sure we are initialized on demand.
         self.EnsureInitialized()
         if type_name in self.types:
             return
 
-        original_type_descriptor = type_descriptor = copy.deepcopy(
-            self.vtypes.get(type_name, self.EMPTY_DESCRIPTOR))
+        start = time.time()
+        self._compile_type(type_name)
+        seconds = self.compile_times[type_name] = time.time() - start
+
+        ACCESS_LOG.LogCompileTime(self.name, type_name, seconds)
+
+    def _get_type_descriptor(self, type_name):
+        """Returns the vtype and the descriptor with all overlays applied."""
+        vtype = self.vtypes.get(type_name, self.EMPTY_DESCRIPTOR)
+        type_overlays = [overlay[type_name] for overlay in self.overlays
+                         if overlay.get(type_name) is not None]
 
-        for overlay in self.overlays:
-            type_overlay = copy.deepcopy(overlay.get(type_name))
+        # Without overlays the vtype is used as is - we never modify it.
+        if not type_overlays:
+            return vtype, vtype
+
+        precompiled = self.precompiled_types.get(type_name)
+        if (precompiled and precompiled[0] == vtype and
+                precompiled[1] == type_overlays):
+            return vtype, precompiled[2]
+
+        type_descriptor = copy.deepcopy(vtype)
+        for type_overlay in type_overlays:
             type_descriptor = self._apply_type_overlay(
-                type_descriptor, type_overlay)
+                type_descriptor, copy.deepcopy(type_overlay))
+
+        # Remember the descriptor so it can be stored for the next session.
+        if IsPlainData(type_overlays) and IsPlainData(type_descriptor):
+            self._compiled_descriptors[type_name] = (
+                vtype, type_overlays, type_descriptor)
+
+        return vtype, type_descriptor
+
+    def _compile_type(self, type_name):
+        original_type_descriptor, type_descriptor = self._get_type_descriptor(
+            type_name)
 
         # An overlay which specifies a string as a definition is simply an alias
         # for another struct. We just copy the old struct in place of the
@@ -1655,8 +1845,8 @@ class Profile(object):
                     # to it.
                     original_v = original_type_descriptor[1].get(k)
                     if original_v:
-                        members[k] = (original_v[0],
-                                      self.list_to_type(k, original_v[1]))
+                        members[k] = LazyMember(
+                            self, members, k, original_v[0], original_v[1])
 
                 elif v[0] == None:
                     logging.warning(
@@ -1664,7 +1854,7 @@ class Profile(object):
                         "has a concrete definition for it.".format(
                             k, type_name))
                 else:
-                    members[k] = (v[0], self.list_to_type(k, v[1]))
+                    members[k] = LazyMember(self, members, k, v[0], v[1])
 
             ## Allow the class plugins to override the class constructor here
             cls = self.object_classes.get(type_name, Struct)
@@ -1672,6 +1862,18 @@ class Profile(object):
             self.types[type_name] = self._make_struct_callable(
                 cls, type_name, members, size, callable_members)
 
+    def GetCompiledTypes(self):
+        """Returns the precompiled form of the types compiled so far.
+
+        This can be stored (e.g. in the disk cache) and assigned to
+        precompiled_types in a later session to skip applying the overlays
+        again. Only types made of plain data are included.
+        """
+        result = self.precompiled_types.copy()
+        result.update(self._compiled_descriptors)
+
+        return result
+
     def _make_struct_callable(self, cls, type_name, members, size,
                               callable_members):
         """Compile the structs class into a callable.
@@ -1998,9 +2200,10 @@ class Profile(object):
 
            is_address: If true the constant is converted to an address.
         """
-        self.compile_type(constant)
+        self.EnsureInitialized()
 
-        ACCESS_LOG.LogConstant(self.name, constant)
+        if ACCESS_LOG.active:
+            ACCESS_LOG.LogConstant(self.name, constant)
 
         result = self.constants.get(constant)
         if result is None:
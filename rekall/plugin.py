@@ -22,10 +22,13 @@
 __author__ = "Michael Cohen <scudette@gmail.com>"
 
 
+import array
 import StringIO
 
 from rekall import config
+from rekall import obj
 from rekall import registry
+from rekall import utils
 from rekall.ui import renderer as rekall_renderer
 
 
@@ -266,3 +269,154 @@ class VerbosityMixIn(object):
         super(VerbosityMixIn, self).__init__(**kwargs)
 
         self.verbosity = verbosity
+
+
+class ObjectList(object):
+    """A compact list of plugin results.
+
+    Structs are stored as an offset and an index into a small table of (type
+    name, address space, profile, name) templates, and are re-created when the
+    list is iterated. Anything else is stored as is.
+
+    Note that re-created structs have no parent.
+    """
+
+    def __init__(self, items=()):
+        self.templates = []
+        self.template_ids = array.array("I")
+        self.offsets = utils.AddressArray()
+
+        # Items which can not be re-created, keyed by their position.
+        self.others = {}
+
+        template_lookup = {}
+        for item in items:
+            if isinstance(item, obj.Struct) and not item.obj_context:
+                template = (item.obj_type, item.obj_vm, item.obj_profile,
+                            item.obj_name)
+
+                template_key = tuple(id(x) for x in template)
+                template_id = template_lookup.get(template_key)
+                if template_id is None:
+                    template_id = template_lookup[template_key] = len(
+                        self.templates)
+                    self.templates.append(template)
+
+                self.template_ids.append(template_id)
+                self.offsets.append(item.obj_offset)
+
+            else:
+                self.others[len(self.offsets)] = item
+                self.template_ids.append(0)
+                self.offsets.append(0)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+
+        if index in self.others:
+            return self.others[index]
+
+        type_name, vm, profile, name = self.templates[self.template_ids[index]]
+        return profile.Object(type_name=type_name, offset=self.offsets[index],
+                              vm=vm, name=name)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+
+class PluginResults(dict):
+    """The memoized plugin results stored in the session.
+
+    The results depend on the address spaces and process context of the
+    session. When any of these change all the results are discarded.
+    """
+
+    def __init__(self):
+        super(PluginResults, self).__init__()
+        self.state = None
+        self.state_objects = None
+
+    def CheckState(self, session):
+        """Discards all the results if the session state changed."""
+        process_context = session.GetParameter("process_context")
+
+        # Keep references to the objects in the state so their ids can not be
+        # reused while we remember them.
+        state_objects = (session.default_address_space,
+                         session.kernel_address_space,
+                         session.physical_address_space)
+
+        state = (process_context and process_context.obj_offset or None,
+                 tuple(id(x) for x in state_objects))
+
+        if state != self.state:
+            self.clear()
+            self.state = state
+            self.state_objects = state_objects
+
+    def __str__(self):
+        return "<%d memoized plugin results>" % len(self)
+
+
+def MemoizeResults(*attributes):
+    """Memoizes the results of a plugin method in the session.
+
+    The method's results are materialized into an ObjectList the first time it
+    is called, and the same ObjectList is returned on subsequent calls from any
+    plugin instance with the same key.
+
+    The key is the method, its positional args, the named attributes of the
+    plugin, the plugin's profile and the session's address spaces and process
+    context. Keyword args are not part of the key - they may only be used for
+    hints which do not change the results.
+
+    Args:
+      attributes: The names of plugin attributes which affect the results.
+    """
+    def Decorator(f):
+        def Wrapper(self, *args, **kwargs):
+            results = self.session.plugin_results
+            if results is None:
+                results = self.session.plugin_results = PluginResults()
+
+            results.CheckState(self.session)
+
+            key = (f.__module__, f.__name__, args,
+                   id(getattr(self, "profile", None)),
+                   tuple(_FreezeKey(getattr(self, x, None))
+                         for x in attributes))
+
+            result = results.get(key)
+            if result is None:
+                result = results[key] = ObjectList(f(self, *args, **kwargs))
+
+            return result
+
+        Wrapper.__name__ = f.__name__
+        Wrapper.__doc__ = f.__doc__
+        return Wrapper
+
+    return Decorator
+
+
+def _FreezeKey(value):
+    """Converts a plugin attribute into something hashable."""
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_FreezeKey(x) for x in value))
+
+    if isinstance(value, (list, tuple)):
+        return tuple(_FreezeKey(x) for x in value)
+
+    if isinstance(value, obj.BaseObject):
+        return (value.obj_type, value.obj_offset)
+
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
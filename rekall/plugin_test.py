@@ -0,0 +1,100 @@
+import unittest
+
+from rekall import addrspace
+from rekall import obj
+from rekall import plugin
+from rekall import session
+
+# Import and register all the plugins.
+from rekall import plugins  # pylint: disable=unused-import
+
+
+class MemoizedCommand(plugin.Command):
+    """A command with a memoized method."""
+
+    __abstract = True
+
+    def __init__(self, profile=None, regex=None, **kwargs):
+        super(MemoizedCommand, self).__init__(**kwargs)
+        self.profile = profile
+        self.regex = regex
+        self.calls = 0
+
+    @plugin.MemoizeResults("regex")
+    def list_tests(self, count, hint=None):
+        _ = hint
+        self.calls += 1
+        for i in range(count):
+            yield self.profile.Object(
+                "Test", offset=i * 0x10,
+                vm=self.session.kernel_address_space)
+
+        yield "not a struct"
+
+
+class MemoizeResultsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.session = session.Session()
+        self.session.kernel_address_space = addrspace.BufferAddressSpace(
+            session=self.session, data="hello world" * 100)
+
+        self.profile = obj.Profile.classes['Profile32Bits'](
+            session=self.session)
+        self.profile.add_types({
+            'Test': [0x10, {
+                'Field1': [0x00, ['unsigned int']],
+                }]})
+
+    def MakeCommand(self, **kwargs):
+        return MemoizedCommand(
+            session=self.session, profile=self.profile, **kwargs)
+
+    def testObjectList(self):
+        command = self.MakeCommand()
+        expected = list(command.list_tests(5))
+        results = command.list_tests(5)
+
+        self.assertTrue(isinstance(results, plugin.ObjectList))
+        self.assertEqual(len(results), 6)
+        self.assertEqual(len(results.templates), 1)
+        self.assertEqual([x.obj_offset for x in list(results)[:-1]],
+                         [x.obj_offset for x in expected[:-1]])
+        self.assertEqual(results[2].Field1, expected[2].Field1)
+        self.assertEqual(results[-1], "not a struct")
+
+    def testMemoize(self):
+        command = self.MakeCommand()
+        command.list_tests(5)
+
+        # Another instance with the same key shares the results.
+        other = self.MakeCommand()
+        self.assertEqual(len(other.list_tests(5, hint=1)), 6)
+        self.assertEqual(other.calls, 0)
+
+        # Different args or attributes are different keys.
+        self.assertEqual(len(other.list_tests(3)), 4)
+        self.assertEqual(other.calls, 1)
+
+        self.assertEqual(len(self.MakeCommand(regex="x").list_tests(5)), 6)
+        self.assertEqual(other.calls, 1)
+
+        # Changing the address space invalidates the results.
+        self.session.kernel_address_space = addrspace.BufferAddressSpace(
+            session=self.session, data="\x00" * 0x100)
+        other.list_tests(5)
+        self.assertEqual(other.calls, 2)
+
+        # So does changing the process context.
+        process = self.profile.Object(
+            "Test", offset=0x20, vm=self.session.kernel_address_space)
+        self.session.SetParameter("process_context", process)
+        other.list_tests(5)
+        self.assertEqual(other.calls, 3)
+
+        other.list_tests(5)
+        self.assertEqual(other.calls, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
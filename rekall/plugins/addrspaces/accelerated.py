@@ -1,3 +1,4 @@
+
 # Copyright 2013 Google Inc. All Rights Reserved.
 #
 # This program is free software; you can redistribute it and/or modify
@@ -16,36 +17,133 @@
 #
 
 """The module provides alternate implementations utilizing C extension modules.
+
+If the rekall.support extension is built, the paged address spaces walk their
+page tables in C. The accelerated classes replace the python implementations in
+the address space registry, so they are used by default. When the extension is
+missing this module fails to import and the python implementations are used.
 """
 
 __author__ = "scudette@google.com (Michael Cohen)"
 import logging
-import os
 
+from rekall import addrspace
+from rekall import config
 from rekall import support
 from rekall.plugins.addrspaces import amd64
+from rekall.plugins.addrspaces import intel
 
-class AcceleratedAMD64PagedMemory(amd64.AMD64PagedMemory):
-    """An accelerated AMD64 address space."""
+
+config.DeclareOption(
+    "--no_native_paging", default=False, action="store_true",
+    help="Walk page tables in python even if the C support module is "
+    "available.")
+
+
+class NativePagingMixIn(object):
+    """Walks the page tables with the native walker.
+
+    Only the page table walks (_vtop(), get_available_addresses() and
+    _get_coalesced_ranges()) are done in C - translations are still cached in
+    the shared TranslationCache and reads still go through the PagedReader.
+    """
+
+    # The paging mode of the native walker.
+    paging_mode = None
+
+    # The number of pages fetched from the native walker at once.
+    RANGES_BATCH = 10000
 
     def __init__(self, **kwargs):
-        super(AcceleratedAMD64PagedMemory, self).__init__(**kwargs)
-        self._delegate = support.AMD64PagedMemory(self.base, int(self.dtb))
+        super(NativePagingMixIn, self).__init__(**kwargs)
+        self._walker = None
+        if self.session and self.session.GetParameter("no_native_paging"):
+            return
 
-    def read(self, offset, length):
-        return self._delegate.read(int(offset), int(length))
+        self._walker = support.PagedMemory(
+            base=self.base, dtb=self.page_table_root(),
+            mode=self.paging_mode)
 
-    def vtop(self, address):
-        return self._delegate.vtop(int(address))
+    def page_table_root(self):
+        return self.dtb
+
+    def flush_translation_cache(self):
+        super(NativePagingMixIn, self).flush_translation_cache()
+        if self._walker is not None:
+            self._walker.flush()
+
+    def _vtop(self, vaddr):
+        if self._walker is None:
+            return super(NativePagingMixIn, self)._vtop(vaddr)
+
+        return self._walker.vtop(vaddr)
+
+    def _walk_ranges(self, coalesce):
+        start = 0
+        while start is not None:
+            ranges, start = self._walker.get_available_addresses(
+                start=start, limit=self.RANGES_BATCH, coalesce=coalesce)
+
+            for x in ranges:
+                yield x
 
     def get_available_addresses(self):
-        for virt, offset, _ in self._delegate.get_available_addresses():
-            yield virt, offset
+        if self._walker is None:
+            return super(NativePagingMixIn, self).get_available_addresses()
+
+        return self._walk_ranges(coalesce=False)
+
+    def _get_coalesced_ranges(self):
+        if self._walker is None:
+            return super(NativePagingMixIn, self)._get_coalesced_ranges()
+
+        return self._walk_ranges(coalesce=True)
+
+
+class AcceleratedIA32PagedMemory(NativePagingMixIn, intel.IA32PagedMemory):
+    """An accelerated IA32 address space."""
+
+    __abstract = True
+
+    paging_mode = "ia32"
+
+
+class AcceleratedIA32PagedMemoryPae(NativePagingMixIn,
+                                    intel.IA32PagedMemoryPae):
+    """An accelerated PAE address space."""
+
+    __abstract = True
+
+    paging_mode = "pae"
+
+
+class AcceleratedAMD64PagedMemory(NativePagingMixIn, amd64.AMD64PagedMemory):
+    """An accelerated AMD64 address space."""
+
+    __abstract = True
+
+    paging_mode = "amd64"
+
+
+class AcceleratedVTxPagedMemory(NativePagingMixIn, amd64.VTxPagedMemory):
+    """An accelerated Intel VT-x address space."""
+
+    __abstract = True
+
+    paging_mode = "ept"
+
+    def page_table_root(self):
+        return self.ept
+
 
+# The python implementations replaced by the accelerated ones.
+ACCELERATED_ADDRESS_SPACES = {
+    "IA32PagedMemory": AcceleratedIA32PagedMemory,
+    "IA32PagedMemoryPae": AcceleratedIA32PagedMemoryPae,
+    "AMD64PagedMemory": AcceleratedAMD64PagedMemory,
+    "VTxPagedMemory": AcceleratedVTxPagedMemory,
+    }
 
-if os.environ.get("FAST"):
-    logging.info("Installing accelerated address spaces.")
-    # Replace the original implementation with the accelerated one.
-    AcceleratedAMD64PagedMemory.classes[
-        "AMD64PagedMemory"] = AcceleratedAMD64PagedMemory
 
+logging.debug("Installing accelerated address spaces.")
+addrspace.BaseAddressSpace.classes.update(ACCELERATED_ADDRESS_SPACES)
@@ -0,0 +1,135 @@
+import random
+import unittest
+
+from rekall import session
+from rekall import testlib
+from rekall.plugins.addrspaces import amd64
+from rekall.plugins.addrspaces import intel
+
+try:
+    from rekall.plugins.addrspaces import accelerated
+except ImportError:
+    accelerated = None
+
+
+@unittest.skipIf(accelerated is None, "The rekall.support module is not built.")
+class NativePagingTest(unittest.TestCase):
+    """Compare the native page table walker with the python implementation."""
+
+    # (mode, python class, accelerated class name, large page sizes)
+    MODES = [
+        ("ia32", intel.IA32PagedMemory, "AcceleratedIA32PagedMemory",
+         [0x400000]),
+        ("pae", intel.IA32PagedMemoryPae, "AcceleratedIA32PagedMemoryPae",
+         [0x200000]),
+        ("amd64", amd64.AMD64PagedMemory, "AcceleratedAMD64PagedMemory",
+         [0x200000, 0x40000000]),
+        ("amd64", amd64.VTxPagedMemory, "AcceleratedVTxPagedMemory",
+         [0x200000, 0x40000000]),
+        ]
+
+    # Entry flags: present, in transition, prototype and invalid.
+    FLAGS = [0x3, 0x3, 0x3, 0x800, 0xc00, 0x400, 0x4, 0x0]
+
+    def setUp(self):
+        self.session = session.Session()
+
+    def BuildTables(self, mode, large_pages, rand):
+        tables = testlib.SyntheticPageTables(mode, table_base=0x1000000)
+        address_bits = 48 if mode == "amd64" else 32
+        vaddrs = []
+        for _ in range(500):
+            vaddr = rand.randrange(0, 1 << address_bits) & ~0xfff
+            page_size = 0x1000
+            flags = rand.choice(self.FLAGS)
+            if rand.random() < 0.05:
+                page_size = rand.choice(large_pages)
+                flags |= tables.PAGE_SIZE_FLAG
+                vaddr &= ~(page_size - 1)
+
+            # A run of pages, mostly contiguous in physical memory too.
+            paddr = rand.randrange(0, 0x100000) * 0x1000 & ~(page_size - 1)
+            for i in range(rand.randrange(1, 20) if page_size == 0x1000 else 1):
+                if rand.random() < 0.1:
+                    paddr = rand.randrange(0, 0x100000) * 0x1000
+
+                tables.map(vaddr + i * page_size, paddr + i * page_size,
+                           page_size=page_size, flags=flags)
+
+            vaddrs.append(vaddr)
+
+        return tables, vaddrs
+
+    def MakeAddressSpaces(self, tables, python_cls, accelerated_name):
+        base = tables.address_space(self.session)
+        kwargs = dict(base=base, dtb=tables.dtb, session=self.session)
+        if issubclass(python_cls, amd64.VTxPagedMemory):
+            kwargs = dict(base=base, ept=[tables.dtb], session=self.session)
+
+        python_as = python_cls(**kwargs)
+        python_as.cache_translations = False
+
+        native_as = getattr(accelerated, accelerated_name)(**kwargs)
+        native_as.cache_translations = False
+
+        # Make sure we really use the native walker.
+        self.assertTrue(native_as._walker is not None)
+
+        return python_as, native_as
+
+    def testVtop(self):
+        rand = random.Random(1)
+        for mode, python_cls, accelerated_name, large_pages in self.MODES:
+            tables, vaddrs = self.BuildTables(mode, large_pages, rand)
+            python_as, native_as = self.MakeAddressSpaces(
+                tables, python_cls, accelerated_name)
+
+            for vaddr in vaddrs:
+                for address in (vaddr, vaddr + 0x123, vaddr + 0x1fff,
+                                vaddr + 0x200000, vaddr ^ 0x400000,
+                                rand.randrange(0, 1 << 48)):
+                    self.assertEqual(python_as.vtop(address),
+                                     native_as.vtop(address),
+                                     "%s: %#x" % (accelerated_name, address))
+
+    def testGetAvailableAddresses(self):
+        rand = random.Random(2)
+        for mode, python_cls, accelerated_name, large_pages in self.MODES:
+            tables, _ = self.BuildTables(mode, large_pages, rand)
+            python_as, native_as = self.MakeAddressSpaces(
+                tables, python_cls, accelerated_name)
+
+            # Fetch in small batches to test resuming the walk.
+            native_as.RANGES_BATCH = 7
+
+            expected = list(python_as.get_available_addresses())
+            self.assertTrue(expected)
+            self.assertEqual(expected,
+                             list(native_as.get_available_addresses()))
+
+            # The merged ranges must also be the same.
+            expected = list(python_as.get_address_ranges())
+            self.assertTrue(len(expected) < len(
+                list(python_as.get_available_addresses())))
+            self.assertEqual(expected, list(intel.MergeRanges(
+                python_as.get_available_addresses())))
+
+            native_as.flush_translation_cache()
+            self.assertEqual(expected, list(native_as.get_address_ranges()))
+
+    def testFallback(self):
+        self.session.SetParameter("no_native_paging", True)
+        tables = testlib.SyntheticPageTables("amd64")
+        tables.map(0xf80000001000, 0x5000)
+        native_as = accelerated.AcceleratedAMD64PagedMemory(
+            base=tables.address_space(self.session), dtb=tables.dtb,
+            session=self.session)
+
+        self.assertEqual(native_as._walker, None)
+        self.assertEqual(native_as.vtop(0xf80000001010), 0x5010)
+        self.assertEqual(list(native_as.get_available_addresses()),
+                         [(0xf80000001000, 0x5000, 0x1000)])
+
+
+if __name__ == "__main__":
+    unittest.main()
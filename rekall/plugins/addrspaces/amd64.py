@@ -23,7 +23,6 @@
 """ This is based on Jesse Kornblum's patch to clean up the standard AS's.
 """
 import logging
-import struct
 
 from rekall import config
 from rekall.plugins.addrspaces import intel
@@ -64,6 +63,14 @@ class AMD64PagedMemory(intel.IA32PagedMemoryPae):
         '''
         return (vaddr & 0xff8000000000) >> 39
 
+    def get_pml4(self):
+        '''
+        Returns the physical address of the Page Map Level 4 table.
+
+        Bits 51:12 are from CR3.
+        '''
+        return self.dtb & 0xffffffffff000
+
     def get_pml4e(self, vaddr):
         '''
         Return the Page Map Level 4 Entry for the given virtual address.
@@ -73,8 +80,7 @@ class AMD64PagedMemory(intel.IA32PagedMemoryPae):
         Bits 11:3 are bits 47:39 of the linear address
         Bits 2:0 are 0.
         '''
-        pml4e_addr = (
-            self.dtb & 0xffffffffff000) | ((vaddr & 0xff8000000000) >> 36)
+        pml4e_addr = self.get_pml4() | ((vaddr & 0xff8000000000) >> 36)
         return self._read_long_long_phys(pml4e_addr)
 
     def get_pdpte(self, vaddr, pml4e):
@@ -98,7 +104,7 @@ class AMD64PagedMemory(intel.IA32PagedMemoryPae):
         '''
         return (pdpte & 0xfffffc0000000) | (vaddr & 0x3fffffff)
 
-    def vtop(self, vaddr):
+    def _vtop(self, vaddr):
         '''
         Translates virtual addresses into physical offsets.
         The function returns either None (no valid mapping)
@@ -137,20 +143,21 @@ class AMD64PagedMemory(intel.IA32PagedMemoryPae):
     def get_available_addresses(self):
         '''
         Return a list of lists of available memory pages.
-        Each entry in the list is the starting virtual address
-        and the size of the memory page.
+        Each entry in the list is the starting virtual address,
+        the physical address and the size of the memory page.
         '''
         # Pages that hold PDEs and PTEs are 0x1000 bytes each.
         # Each PDE and PTE is eight bytes. Thus there are 0x1000 / 8 = 0x200
         # PDEs and PTEs we must test.
-        for pml4e in range(0, 0x200):
-            vaddr = pml4e << 39
-            pml4e_value = self.get_pml4e(vaddr)
+        for pml4e, pml4e_value in self._read_page_table(
+                self.get_pml4(), 8, "Q"):
             if not self.entry_present(pml4e_value):
                 continue
-            for pdpte in range(0, 0x200):
+
+            # Empty tables are skipped without looking at their entries.
+            for pdpte, pdpte_value in self._read_page_table(
+                    pml4e_value & 0xffffffffff000, 8, "Q"):
                 vaddr = (pml4e << 39) | (pdpte << 30)
-                pdpte_value = self.get_pdpte(vaddr, pml4e_value)
                 if not self.entry_present(pdpte_value):
                     continue
                 if self.page_size_flag(pdpte_value):
@@ -159,9 +166,9 @@ class AMD64PagedMemory(intel.IA32PagedMemoryPae):
                            0x40000000)
                     continue
                 tmp2 = vaddr
-                for pde in range(0, 0x200):
+                for pde, pde_value in self._read_page_table(
+                        pdpte_value & 0xffffffffff000, 8, "Q"):
                     vaddr = tmp2 | (pde << 21)
-                    pde_value = self.get_pde(vaddr, pdpte_value)
                     if not self.entry_present(pde_value):
                         continue
                     if self.page_size_flag(pde_value):
@@ -174,13 +181,8 @@ class AMD64PagedMemory(intel.IA32PagedMemoryPae):
                     # windows where IO is extremely expensive, its
                     # about 10 times more efficient than reading it
                     # one value at the time - and this loop is HOT!
-                    pte_table_addr = ((pde_value & 0xffffffffff000) |
-                                      ((vaddr & 0x1ff000) >> 9))
-
-                    data = self.base.read(pte_table_addr, 8 * 0x200)
-                    pte_table = struct.unpack("<" + "Q" * 0x200, data)
-
-                    for i, pte_value in enumerate(pte_table):
+                    for i, pte_value in self._read_page_table(
+                            pde_value & 0xffffffffff000, 8, "Q"):
                         if self.entry_present(pte_value):
                             out_vaddr = vaddr | i << 12
                             yield (out_vaddr,
@@ -234,16 +236,17 @@ class VTxPagedMemory(AMD64PagedMemory):
         self.as_assert(this_ept != None, "No more EPTs specified")
         self.ept = this_ept
 
+        # Several VMs may share the same base, so we cache under the EPT.
+        self.translation_root = (self.__class__.__name__, self.ept)
+
     def entry_present(self, entry):
         # A page entry being present depends only on bits 2:0 for EPT
         # translation.
         return entry and (entry & 0x7)
 
-    def get_pml4e(self, vaddr):
+    def get_pml4(self):
         # PML4 for VT-x is in the EPT, not the DTB as AMD64PagedMemory does.
-        ept_pml4e_paddr = ((self.ept & 0xffffffffff000) |
-                           ((vaddr & 0xff8000000000) >> 36))
-        return self._read_long_long_phys(ept_pml4e_paddr)
+        return self.ept & 0xffffffffff000
 
     def __str__(self):
         return "%s@0x%08X" % (self.__class__.__name__, self.ept)
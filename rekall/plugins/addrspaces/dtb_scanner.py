@@ -0,0 +1,222 @@
+# Rekall Memory Forensics
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""A fast brute force scanner for Directory Table Bases.
+
+Every page in physical memory might be a DTB. A DTB is a candidate if it
+translates a known kernel virtual address to its known physical address.
+
+Rather than building an address space for each page, we read physical memory in
+large chunks and pick the top level page table entry for the virtual address
+out of every candidate page at once. Most candidates share the same few top
+level entries (e.g. all processes map the kernel through the same PDPT), so the
+rest of the walk is done once per distinct entry value and remembered.
+
+Translations exactly match the python implementations in intel.py and amd64.py.
+"""
+__author__ = "Michael Cohen <scudette@google.com>"
+
+import struct
+
+from rekall.plugins.addrspaces import amd64
+from rekall.plugins.addrspaces import intel
+
+
+class PagingMode(object):
+    """Describes the page table layout of a paging mode."""
+
+    def __init__(self, name, entry_format, dtb_alignment, table_mask, levels):
+        self.name = name
+        self.entry_format = entry_format
+        self.entry_size = struct.calcsize(entry_format)
+
+        # DTBs must be aligned to this.
+        self.dtb_alignment = dtb_alignment
+
+        # The mask applied to an entry to find the next table (or the page
+        # frame in the last level).
+        self.table_mask = table_mask
+
+        # A list of (shift, bits, large page mask). The virtual address bits
+        # [shift + bits - 1 : shift] index the table at each level. If an entry
+        # at the level may map a large page, the large page mask is the mask of
+        # the physical address bits in the entry.
+        self.levels = levels
+
+    def index(self, level, vaddr):
+        shift, bits, _ = self.levels[level]
+        return (vaddr >> shift) & ((1 << bits) - 1)
+
+
+PAGING_MODES = dict(
+    ia32=PagingMode("ia32", "<I", 0x1000, 0xfffff000, [
+        (22, 10, 0xffc00000),
+        (12, 10, None)]),
+
+    pae=PagingMode("pae", "<Q", 0x20, 0xffffffffff000, [
+        (30, 2, None),
+        (21, 9, 0xfffffffe00000),
+        (12, 9, None)]),
+
+    amd64=PagingMode("amd64", "<Q", 0x1000, 0xffffffffff000, [
+        (39, 9, None),
+        (30, 9, 0xfffffc0000000),
+        (21, 9, 0xfffffffe00000),
+        (12, 9, None)]),
+    )
+
+
+def GetPagingMode(address_space_cls):
+    """Returns the name of the paging mode of the address space class.
+
+    Returns None for address spaces we can not scan for.
+    """
+    if issubclass(address_space_cls, amd64.VTxPagedMemory):
+        return
+
+    if issubclass(address_space_cls, amd64.AMD64PagedMemory):
+        return "amd64"
+
+    if issubclass(address_space_cls, intel.IA32PagedMemoryPae):
+        return "pae"
+
+    if issubclass(address_space_cls, intel.IA32PagedMemory):
+        return "ia32"
+
+
+class DTBScanner(object):
+    """Finds DTBs which translate a virtual address to a physical address."""
+
+    # How much physical memory we read at once.
+    CHUNK_SIZE = 0x100000
+
+    # The most top level entry translations we remember.
+    MAX_TRANSLATIONS = 100000
+
+    def __init__(self, address_space=None, mode="amd64", session=None):
+        """Scans the physical address_space for DTBs.
+
+        Args:
+          address_space: The physical address space.
+          mode: The name of the paging mode (ia32, pae or amd64).
+          session: If specified, used to report progress.
+        """
+        self.address_space = address_space
+        self.mode = PAGING_MODES[mode]
+        self.session = session
+
+    def _entry_present(self, entry):
+        # Transition pages are treated as present, like the address spaces do.
+        return entry & 1 or (entry & (1 << 11) and not entry & (1 << 10))
+
+    def _read_entry(self, addr):
+        try:
+            data = self.address_space.read(addr, self.mode.entry_size)
+        except IOError:
+            return
+
+        if len(data) != self.mode.entry_size:
+            return
+
+        return struct.unpack(self.mode.entry_format, data)[0]
+
+    def translate_entry(self, vaddr, entry):
+        """Completes the translation of vaddr from its top level entry.
+
+        Returns:
+          The physical address or None if vaddr is not mapped.
+        """
+        mode = self.mode
+        last_level = len(mode.levels) - 1
+        for level, (shift, _, large_page_mask) in enumerate(mode.levels):
+            if not entry or not self._entry_present(entry):
+                return
+
+            if level == last_level:
+                return (entry & mode.table_mask) | (vaddr & 0xfff)
+
+            if large_page_mask and entry & (1 << 7):
+                return (entry & large_page_mask) | (vaddr & ((1 << shift) - 1))
+
+            entry = self._read_entry(
+                (entry & mode.table_mask) |
+                mode.index(level + 1, vaddr) * mode.entry_size)
+
+    def _chunks(self, start, end):
+        """Yields aligned (offset, data) chunks of the physical memory."""
+        alignment = self.mode.dtb_alignment
+        for offset, _, length in self.address_space.get_address_ranges(
+                start=start, end=end):
+            run_end = offset + length
+            offset += -offset % alignment
+
+            while offset + alignment <= run_end:
+                length = min(self.CHUNK_SIZE, run_end - offset)
+                length -= length % alignment
+                yield offset, self.address_space.read(offset, length)
+                offset += length
+
+    def scan(self, vaddr, paddr=None, start=0, end=None):
+        """Yields (dtb, physical address) for DTBs which map vaddr.
+
+        Args:
+          vaddr: The virtual address to translate.
+          paddr: If specified, only DTBs which translate vaddr to this physical
+             address are returned.
+          start, end: The range of physical memory to scan.
+        """
+        mode = self.mode
+        index = mode.index(0, vaddr)
+
+        # The number of entries between candidate DTBs.
+        stride = mode.dtb_alignment / mode.entry_size
+
+        # Translations of each distinct top level entry.
+        translations = {}
+
+        for offset, data in self._chunks(start, end):
+            if self.session:
+                self.session.report_progress(
+                    "Scanning for DTBs at %#x (%smb)" % (
+                        offset, offset / 1024 / 1024))
+
+            entries = struct.unpack(
+                "<%d%s" % (len(data) / mode.entry_size, mode.entry_format[1]),
+                data)[index::stride]
+
+            hits = []
+            for entry in set(entries):
+                if entry not in translations:
+                    # Random data has many distinct values - bound the cache.
+                    if len(translations) > self.MAX_TRANSLATIONS:
+                        translations.clear()
+
+                    translations[entry] = self.translate_entry(vaddr, entry)
+
+                result = translations[entry]
+                if result is None or (paddr is not None and result != paddr):
+                    continue
+
+                for i, candidate in enumerate(entries):
+                    # Like the address spaces, we never accept a DTB of 0.
+                    dtb = offset + i * mode.dtb_alignment
+                    if candidate == entry and dtb:
+                        hits.append((dtb, result))
+
+            for hit in sorted(hits):
+                yield hit
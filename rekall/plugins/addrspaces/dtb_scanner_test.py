@@ -0,0 +1,95 @@
+import random
+import unittest
+
+from rekall import session
+from rekall import testlib
+from rekall.plugins.addrspaces import amd64
+from rekall.plugins.addrspaces import dtb_scanner
+from rekall.plugins.addrspaces import intel
+
+
+class DTBScannerTest(unittest.TestCase):
+    """Compare the scanner with building an address space for each page."""
+
+    # (mode, python class, kernel virtual address, large page size)
+    MODES = [
+        ("ia32", intel.IA32PagedMemory, 0x80801000, 0x400000),
+        ("pae", intel.IA32PagedMemoryPae, 0x80801000, 0x200000),
+        ("amd64", amd64.AMD64PagedMemory, 0xf80000201000, 0x40000000),
+        ]
+
+    def setUp(self):
+        self.session = session.Session()
+
+    def BuildMemory(self, mode, vaddr, large_page, rand):
+        tables = testlib.SyntheticPageTables(mode, table_base=0x40000)
+        tables.map(vaddr, 0x5000)
+        tables.map((vaddr & ~(large_page - 1)) + large_page, 0,
+                   page_size=large_page)
+
+        # Some pages of noise.
+        for page in range(0x10000, 0x30000, 0x1000):
+            tables.write(page, "".join(
+                chr(rand.choice([0, 0, 1, 3, 0x83, rand.randrange(256)]))
+                for _ in range(0x1000)))
+
+        # Processes share the kernel's top level entries.
+        for _ in range(5):
+            dtb = tables._allocate_table()
+            tables.write(dtb, tables.memory[tables.dtb:tables.dtb + 0x1000])
+
+        # A page table with a different mapping for the kernel.
+        tables.dtb = tables._allocate_table()
+        tables.map(vaddr, 0x6000)
+
+        return tables
+
+    def Expected(self, tables, python_cls, vaddr, paddr, alignment):
+        result = []
+        base = tables.address_space(self.session)
+        for dtb in range(alignment, len(tables.memory), alignment):
+            test_as = python_cls(base=base, dtb=dtb, session=self.session)
+            test_as.cache_translations = False
+            if test_as.vtop(vaddr) == paddr:
+                result.append(dtb)
+
+        return result
+
+    def testScan(self):
+        rand = random.Random(1)
+        for mode, python_cls, vaddr, large_page in self.MODES:
+            tables = self.BuildMemory(mode, vaddr, large_page, rand)
+            scanner = dtb_scanner.DTBScanner(
+                address_space=tables.address_space(self.session), mode=mode)
+
+            # Make sure there are several chunks.
+            scanner.CHUNK_SIZE = 0x3000
+            alignment = scanner.mode.dtb_alignment
+
+            large_vaddr = (vaddr & ~(large_page - 1)) + large_page
+            for address, paddr in ((vaddr + 0x123, 0x5123),
+                                   (large_vaddr + 0x123, 0x123)):
+                expected = self.Expected(
+                    tables, python_cls, address, paddr, alignment)
+
+                # The kernel DTB and its copies.
+                self.assertTrue(len(expected) >= 6)
+                self.assertEqual(
+                    [(dtb, paddr) for dtb in expected],
+                    list(scanner.scan(address, paddr=paddr)))
+
+            self.assertEqual(
+                list(scanner.scan(vaddr, paddr=0x6000)),
+                [(tables.dtb, 0x6000)])
+
+    def testGetPagingMode(self):
+        self.assertEqual(
+            dtb_scanner.GetPagingMode(amd64.AMD64PagedMemory), "amd64")
+        self.assertEqual(
+            dtb_scanner.GetPagingMode(intel.IA32PagedMemoryPae), "pae")
+        self.assertEqual(
+            dtb_scanner.GetPagingMode(amd64.VTxPagedMemory), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
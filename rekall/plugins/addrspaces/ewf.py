@@ -133,6 +133,7 @@ class EWFAddressSpace(addrspace.CachingAddressSpaceMixIn,
                        "EWF signature not present")
 
         path = session.GetParameter("filename") or filename
+        self.fname = path
         fhandle = ewf_open([path])
 
         super(EWFAddressSpace, self).__init__(
@@ -25,10 +25,14 @@
 # this code in Rekall Memory Forensics.
 
 """ A Hiber file Address Space """
+import hashlib
+import multiprocessing
+import struct
+
 from rekall import addrspace
 from rekall import obj
+from rekall import utils
 from rekall.plugins.addrspaces import xpress
-import struct
 
 
 #pylint: disable-msg=C0111
@@ -36,6 +40,18 @@ import struct
 PAGE_SIZE = 0x1000
 page_shift = 12
 
+# Bump this when the layout of the cached page index changes.
+INDEX_VERSION = 1
+
+
+def _decode_block(args):
+    """Decompress a single xpress block (runs in a worker process)."""
+    offset, size, data_z = args
+    if size == 0x10000:
+        return offset, data_z
+
+    return offset, xpress.xpress_decode(data_z)
+
 
 class HibernationSupport(obj.ProfileModification):
     """Support hibernation file structures for different versions of windows."""
@@ -261,9 +277,12 @@ class WindowsHiberFileSpace(addrspace.BaseAddressSpace):
         ## need to search for it.
         self.dtb = self.ProcState.SpecialRegisters.Cr3.v()
 
-        # This is a lengthy process, it was cached, but it may be best to delay this
-        # until it's absolutely necessary and/or convert it into a generator...
-        self.build_page_cache()
+        # The page index is built lazily: either loaded from the disk cache or
+        # incrementally, one memory range table at a time, as pages are
+        # requested.
+        self._index_builder = None
+        self._index_complete = False
+        self._load_page_index()
 
     def _get_first_table_page(self):
         if self.header:
@@ -273,7 +292,75 @@ class WindowsHiberFileSpace(addrspace.BaseAddressSpace):
             if self.base.read(i * PAGE_SIZE, 8) == "\x81\x81xpress":
                 return i - 1
 
+    def _index_fingerprint(self):
+        """A key which identifies this hibernation file in the disk cache.
+
+        The header, the processor state and the first memory range table
+        together identify the file without reading all of it.
+        """
+        first_table = self._get_first_table_page()
+        digest = hashlib.sha1()
+        for page in sorted(set([
+                0, self.profile.get_constant("HibrProcPage"),
+                first_table, first_table + 1])):
+            digest.update(self.base.read(page * PAGE_SIZE, PAGE_SIZE))
+
+        return (INDEX_VERSION, self.profile.name, self.entry_count,
+                digest.hexdigest())
+
+    def _disk_cache(self):
+        return getattr(self.session, "disk_cache", None)
+
+    def _load_page_index(self):
+        disk_cache = self._disk_cache()
+        if disk_cache is None:
+            return
+
+        try:
+            (self.PageDict, self.LookupCache, self.AddressList,
+             self.HighestPage, self.PageIndex, self.MemRangeCnt) = (
+                 disk_cache.Get("hiberfil", self._index_fingerprint()))
+            self._index_complete = True
+        except KeyError:
+            pass
+
+    def _store_page_index(self):
+        disk_cache = self._disk_cache()
+        if disk_cache is None:
+            return
+
+        disk_cache.Put("hiberfil", self._index_fingerprint(), (
+            self.PageDict, self.LookupCache, self.AddressList,
+            self.HighestPage, self.PageIndex, self.MemRangeCnt))
+
+    def _extend_page_index(self):
+        """Index the next memory range table.
+
+        Returns:
+          False when the index is complete.
+        """
+        if self._index_complete:
+            return False
+
+        if self._index_builder is None:
+            self._index_builder = self._build_page_index()
+
+        try:
+            self._index_builder.next()
+            return True
+        except StopIteration:
+            self._index_builder = None
+            self._index_complete = True
+            self._store_page_index()
+            return False
+
     def build_page_cache(self):
+        """Build the complete page index."""
+        while self._extend_page_index():
+            pass
+
+    def _build_page_index(self):
+        """Walk the memory range tables, yielding after each table."""
         XpressIndex = 0
 
         XpressHeader = self.profile.Object("_IMAGE_XPRESS_HEADER",
@@ -322,6 +409,9 @@ class WindowsHiberFileSpace(addrspace.BaseAddressSpace):
                     self.PageIndex += 1
                     XpressIndex += 1
 
+            # Let callers use the pages indexed so far.
+            yield
+
             NextTable = MemoryArray.MemArrayLink.NextTable.v()
 
             # This entry count (EntryCount) should probably be calculated
@@ -341,21 +431,55 @@ class WindowsHiberFileSpace(addrspace.BaseAddressSpace):
             else:
                 MemoryArrayOffset = 0
 
-    def convert_to_raw(self, ofile):
+    def convert_to_raw(self, ofile, workers=None, batch_size=64):
+        """Write the decompressed image into ofile as a raw image.
+
+        Blocks are read in batches and decompressed in parallel by a pool of
+        worker processes. This is a generator which yields the number of pages
+        written so far after each block.
+
+        Args:
+          ofile: A writable file like object.
+          workers: The number of worker processes (default the number of
+            CPUs). With a single worker, blocks are decompressed in process.
+          batch_size: The number of blocks handed to the pool at once - this
+            bounds the memory used.
+        """
+        self.build_page_cache()
+
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        pool = None
+        if workers > 1:
+            pool = multiprocessing.Pool(workers)
+
+        # Sorting the blocks keeps both the reads and writes mostly
+        # sequential.
+        blocks = sorted(self.PageDict)
         page_count = 0
-        for _i, xb in enumerate(self.PageDict.keys()):
-            size = self.PageDict[xb][0][1]
-            data_z = self.base.read(xb + 0x20, size)
-            if size == 0x10000:
-                data_uz = data_z
-            else:
-                data_uz = xpress.xpress_decode(data_z)
-            for page, size, offset in self.PageDict[xb]:
-                ofile.seek(page * 0x1000)
-                ofile.write(data_uz[offset * 0x1000:offset * 0x1000 + 0x1000])
-                page_count += 1
-            del data_z, data_uz
-            yield page_count
+        try:
+            for i in xrange(0, len(blocks), batch_size):
+                batch = [(xb, self.PageDict[xb][0][1],
+                          self.base.read(xb + 0x20, self.PageDict[xb][0][1]))
+                         for xb in blocks[i:i + batch_size]]
+
+                if pool:
+                    results = pool.imap(_decode_block, batch)
+                else:
+                    results = (_decode_block(x) for x in batch)
+
+                for xb, data_uz in results:
+                    for page, _, offset in self.PageDict[xb]:
+                        ofile.seek(page * 0x1000)
+                        ofile.write(
+                            data_uz[offset * 0x1000:offset * 0x1000 + 0x1000])
+                        page_count += 1
+
+                    yield page_count
+        finally:
+            if pool:
+                pool.terminate()
 
     def next_xpress(self, XpressHeader, XpressBlockSize):
         XpressHeaderOffset = int(XpressBlockSize) + XpressHeader.obj_offset + \
@@ -419,32 +543,36 @@ class WindowsHiberFileSpace(addrspace.BaseAddressSpace):
         return (self.ProcState.SpecialRegisters.Cr4.v() >> 5) & 1
 
     def get_number_of_memranges(self):
+        self.build_page_cache()
         return self.MemRangeCnt
 
     def get_number_of_pages(self):
+        self.build_page_cache()
         return self.PageIndex
 
+    def _lookup(self, page):
+        """Find the page in the index, extending the index as needed."""
+        while True:
+            try:
+                return self.LookupCache[page]
+            except KeyError:
+                if not self._extend_page_index():
+                    return None, None, None
+
     def get_addr(self, addr):
-        page = addr >> page_shift
-        if page in self.LookupCache:
-            (hoffset, size, pageoffset) = self.LookupCache[page]
-            return hoffset, size, pageoffset
-        return None, None, None
+        return self._lookup(addr >> page_shift)
 
     def get_block_offset(self, _xb, addr):
-        page = addr >> page_shift
-        if page in self.LookupCache:
-            (_hoffset, _size, pageoffset) = self.LookupCache[page]
-            return pageoffset
-        return None
+        return self._lookup(addr >> page_shift)[2]
 
     def is_valid_address(self, addr):
         XpressHeaderOffset, _XpressBlockSize, _XpressPage = self.get_addr(addr)
         return XpressHeaderOffset != None
 
     def read_xpress(self, baddr, BlockSize):
-        data_uz = self.PageCache.Get(baddr)
-        if data_uz is None:
+        try:
+            data_uz = self.PageCache.Get(baddr)
+        except KeyError:
             data_read = self.base.read(baddr, BlockSize)
             if BlockSize == 0x10000:
                 data_uz = data_read
@@ -511,6 +639,7 @@ class WindowsHiberFileSpace(addrspace.BaseAddressSpace):
         return longval
 
     def get_available_pages(self):
+        self.build_page_cache()
         page_list = []
         for _i, xb in enumerate(self.PageDict.keys()):
             for page, _size, _offset in self.PageDict[xb]:
@@ -519,6 +648,7 @@ class WindowsHiberFileSpace(addrspace.BaseAddressSpace):
 
     def get_address_range(self):
         """ This relates to the logical address range that is indexable """
+        self.build_page_cache()
         size = self.HighestPage * 0x1000 + 0x1000
         return [0, size]
 
@@ -529,6 +659,7 @@ class WindowsHiberFileSpace(addrspace.BaseAddressSpace):
 
     def get_available_addresses(self):
         """ This returns the ranges  of valid addresses """
+        self.build_page_cache()
         for i in self.AddressList:
             yield i
 
@@ -0,0 +1,158 @@
+import StringIO
+import shutil
+import struct
+import tempfile
+import unittest
+
+from rekall import addrspace
+from rekall import session
+from rekall.plugins.addrspaces import hibernate
+from rekall.plugins.addrspaces import xpress
+from rekall.plugins.overlays import basic
+
+
+class XpressTest(unittest.TestCase):
+    """Test decompressing XPRESS blocks."""
+
+    # (compressed, plain)
+    VECTORS = [
+        # Only literals.
+        ("\x00\x00\x00\x00abcdefgh", "abcdefgh"),
+
+        # A match which overlaps the bytes it copies.
+        ("\x00\x00\x00\x10abc\x16\x00", "abcabcabcabc"),
+
+        # Two lengths in the low and then the high nibble of the same byte.
+        ("\x00\x00\x00\x60a\x07\x00\x5a\x07\x00", "a" * 36),
+
+        # Lengths in a byte and in a short.
+        ("\x00\x00\x00\x20ab\x0f\x00\x0f\x64", ("ab" * 64)[:127]),
+        ("\x00\x00\x00\x40x\x07\x00\x0f\xff\xfd\x0f", "x" * 0x1001),
+        ]
+
+    def testDecode(self):
+        for compressed, plain in self.VECTORS:
+            self.assertEqual(xpress.xpress_decode(compressed), plain)
+
+
+class HiberTestProfile(basic.Profile32Bits):
+    """The header structs which normally come from the kernel profile."""
+
+    METADATA = dict(major=6, minor=1, build=7600)
+
+    @classmethod
+    def Initialize(cls, profile):
+        super(HiberTestProfile, cls).Initialize(profile)
+        profile.add_types({
+            'PO_MEMORY_IMAGE': [0x100, {
+                'FirstTablePage': [0x68, ['unsigned long']],
+                }],
+            '_KPROCESSOR_STATE': [0x100, {
+                'SpecialRegisters': [0x0, ['_KSPECIAL_REGISTERS']],
+                }],
+            '_KSPECIAL_REGISTERS': [0x10, {
+                'Cr0': [0x0, ['unsigned long']],
+                'Cr3': [0x8, ['unsigned long']],
+                'Cr4': [0xc, ['unsigned long']],
+                }],
+            })
+
+
+class WindowsHiberFileSpaceTest(unittest.TestCase):
+    """Test reading a (windows 7) hibernation file."""
+
+    ENTRY_COUNT = 0x1ff
+
+    def setUp(self):
+        self.temp_directory = tempfile.mkdtemp()
+
+        image = bytearray(0x16000)
+        image[0:4] = "hibr"
+        struct.pack_into("<I", image, 0x68, 2)
+        struct.pack_into("<I", image, 0x1008, 0x185000)
+
+        # The first table is full so there is a next table. Its pages are
+        # stored uncompressed.
+        self.WriteTable(image, 0x2000, 0x14, self.ENTRY_COUNT, (0x10, 0x20))
+        self.WriteBlock(image, 0x3000, "".join(
+            chr(ord("a") + i) * 0x1000 for i in range(0x10)))
+
+        # The last table's pages are all "Q".
+        self.WriteTable(image, 0x14000, 0, 1, (0x100, 0x110))
+        self.WriteBlock(image, 0x15000,
+                        "\x00\x00\x00\x40Q\x07\x00\x0f\xff\xfc\xff")
+
+        self.image = str(image)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_directory)
+
+    def WriteTable(self, image, offset, next_table, entry_count, page_range):
+        struct.pack_into("<IIII", image, offset, next_table, entry_count,
+                         *page_range)
+
+    def WriteBlock(self, image, offset, data):
+        size = (len(data) + 7) & ~7
+        struct.pack_into("<8sI", image, offset, "\x81\x81xpress",
+                         (size - 1) << 10)
+        image[offset + 0x20:offset + 0x20 + len(data)] = data
+
+    def MakeAddressSpace(self):
+        test_session = session.Session()
+        test_session.SetParameter("cache_dir", self.temp_directory)
+
+        return hibernate.WindowsHiberFileSpace(
+            base=addrspace.BufferAddressSpace(
+                session=test_session, data=self.image),
+            session=test_session,
+            profile=HiberTestProfile(session=test_session))
+
+    def testLazyIndex(self):
+        address_space = self.MakeAddressSpace()
+        self.assertEqual(address_space.dtb, 0x185000)
+        self.assertEqual(address_space.LookupCache, {})
+
+        # Reading a page only indexes the tables up to that page.
+        self.assertEqual(address_space.read(0x12ffe, 4), "ccdd")
+        self.assertEqual(len(address_space.LookupCache), 0x10)
+        self.assertFalse(address_space._index_complete)
+
+        self.assertEqual(address_space.read(0x10fffc, 4), "Q" * 4)
+        self.assertFalse(address_space.is_valid_address(0x200000))
+        self.assertTrue(address_space._index_complete)
+
+        self.assertEqual(address_space.get_number_of_pages(), 0x20)
+        self.assertEqual(address_space.get_address_range(), [0, 0x111000])
+        self.assertEqual(
+            [x for x in address_space.get_available_addresses() if x[2]],
+            [(0x10000, 0x10000, 0x10000), (0x100000, 0x100000, 0x10000)])
+
+        # The complete index is loaded from the disk cache.
+        address_space = self.MakeAddressSpace()
+        self.assertTrue(address_space._index_complete)
+        self.assertEqual(len(address_space.LookupCache), 0x20)
+        self.assertEqual(address_space.read(0x1f000, 2), "pp")
+
+    def Convert(self, **kwargs):
+        fd = StringIO.StringIO()
+        for _ in self.MakeAddressSpace().convert_to_raw(fd, **kwargs):
+            pass
+
+        return fd.getvalue()
+
+    def testConvertToRaw(self):
+        expected = bytearray(0x110000)
+        for i in range(0x10):
+            expected[0x10000 + i * 0x1000:0x11000 + i * 0x1000] = (
+                chr(ord("a") + i) * 0x1000)
+        expected[0x100000:0x110000] = "Q" * 0x10000
+
+        serial = self.Convert(workers=1)
+        self.assertEqual(serial, str(expected))
+
+        # Workers decompress the blocks, in batches smaller than the image.
+        self.assertEqual(self.Convert(workers=2, batch_size=1), serial)
+
+
+if __name__ == "__main__":
+    unittest.main()
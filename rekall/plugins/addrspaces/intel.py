@@ -29,6 +29,96 @@ from rekall import addrspace
 from rekall import obj
 
 
+# A page of zeros. Empty page tables are skipped by comparing with this.
+ZERO_PAGE = "\x00" * 0x1000
+
+
+def MergeRanges(ranges):
+    """Merges adjacent (virtual address, physical address, length) ranges.
+
+    Ranges are merged if they are contiguous in both the virtual and the
+    physical address space.
+    """
+    run_vaddr = run_paddr = None
+    run_length = 0
+    for vaddr, paddr, length in ranges:
+        if (run_length and vaddr == run_vaddr + run_length and
+                paddr == run_paddr + run_length):
+            run_length += length
+            continue
+
+        if run_length:
+            yield run_vaddr, run_paddr, run_length
+
+        run_vaddr, run_paddr, run_length = vaddr, paddr, length
+
+    if run_length:
+        yield run_vaddr, run_paddr, run_length
+
+
+class TranslationCache(object):
+    """A software TLB for paged address spaces.
+
+    A single cache is shared by all the paged address spaces stacked on the same
+    base address space (e.g. the kernel and all the process address spaces), so
+    translations are keyed by (translation root, virtual page), where the root
+    is the paging mode and the dtb. We also cache the most recently read page
+    table pages (keyed by their physical address in the base address space), so
+    a page table walk which repeats an upper level only costs a dict lookup.
+
+    The merged address ranges of each set of page tables are also kept here, so
+    enumerating the address space of a process is only done once per session.
+
+    Entries never expire on their own. If the underlying memory changes (e.g. on
+    a live system) the cache must be flushed explicitly.
+    """
+
+    def __init__(self, max_translations=100000, max_tables=1000):
+        self.max_translations = max_translations
+        self.max_tables = max_tables
+        self.translations = {}
+        self.tables = {}
+
+        # Maps the translation root (e.g. the dtb) to a list of ranges.
+        self.ranges = {}
+
+        # Statistics.
+        self.hits = self.misses = 0
+        self.table_hits = self.table_misses = 0
+
+    def Flush(self):
+        """Invalidate all the cached translations and page tables."""
+        self.translations.clear()
+        self.tables.clear()
+        self.ranges.clear()
+
+    def PutTranslation(self, key, value):
+        # When the cache is full we just start again - this is much cheaper
+        # than maintaining an LRU list on the hot path.
+        if len(self.translations) >= self.max_translations:
+            self.translations.clear()
+
+        self.translations[key] = value
+
+    def PutTable(self, key, value):
+        if len(self.tables) >= self.max_tables:
+            self.tables.clear()
+
+        self.tables[key] = value
+
+    def Stats(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    table_hits=self.table_hits,
+                    table_misses=self.table_misses,
+                    translations=len(self.translations),
+                    tables=len(self.tables),
+                    ranges=len(self.ranges))
+
+    def __str__(self):
+        return ("TLB: %(hits)s hits, %(misses)s misses. Page tables: "
+                "%(table_hits)s hits, %(table_misses)s misses." % self.Stats())
+
+
 class IA32PagedMemory(addrspace.PagedReader):
     """ Standard x86 32 bit non PAE address space.
 
@@ -47,14 +137,18 @@ class IA32PagedMemory(addrspace.PagedReader):
     Similar information is also available from Advanced Micro Devices (AMD)
     at http://support.amd.com/us/Processor_TechDocs/24593.pdf.
 
-    This is simplified from previous versions of rekall, by removing caching
-    and automated DTB searching (which is now performed by specific plugins in
-    an OS specific way).
+    This is simplified from previous versions of rekall, by removing automated
+    DTB searching (which is now performed by specific plugins in an OS specific
+    way). Translations and page table pages are cached in a TranslationCache
+    shared with all other paged address spaces on the same base.
     """
     order = 70
 
     _md_arch = "I386"
 
+    # Set this to False to disable the translation cache.
+    cache_translations = True
+
     def __init__(self, name=None, dtb=None, **kwargs):
         """Instantiate an Intel 32 bit Address space over the layered AS.
 
@@ -75,6 +169,80 @@ class IA32PagedMemory(addrspace.PagedReader):
                        " plugin to search for the dtb.")
         self.name = (name or 'Kernel AS') + "@%#x" % self.dtb
 
+        # Translations are cached under this key (with the virtual page). The
+        # same dtb means something different in each paging mode.
+        self.translation_root = (self.__class__.__name__, self.dtb)
+
+        # The translation cache is shared by all paged address spaces on the
+        # same base, so it is stored there. Note that the base may itself be a
+        # paged address space (e.g. VTxPagedMemory) with its own cache, which
+        # must not be confused with this one.
+        self.translation_cache = getattr(self.base, "_translation_cache", None)
+        if self.translation_cache is None:
+            self.translation_cache = TranslationCache()
+            self.base._translation_cache = self.translation_cache
+
+    def flush_translation_cache(self):
+        """Invalidates all cached translations (e.g. when memory changed).
+
+        Address spaces stacked on top of us (e.g. guest address spaces over a
+        VTxPagedMemory) translate through us, so their cache is flushed too.
+        """
+        self.translation_cache.Flush()
+
+        stacked_cache = getattr(self, "_translation_cache", None)
+        if stacked_cache is not None:
+            stacked_cache.Flush()
+
+    def _read_table_entry(self, addr, size, fmt):
+        """Reads a page table entry through the page table cache.
+
+        The entire page table page containing addr is read and unpacked once.
+
+        Returns:
+          The entry as an integer, or None if the page table could not be read.
+        """
+        table_addr = addr & ~0xfff
+        cache = self.translation_cache
+        try:
+            table = cache.tables[table_addr, size]
+            cache.table_hits += 1
+        except KeyError:
+            cache.table_misses += 1
+            try:
+                data = self.base.read(table_addr, 0x1000)
+            except IOError:
+                data = None
+
+            if not data or len(data) != 0x1000:
+                return None
+
+            table = struct.unpack("<" + fmt * (0x1000 / size), data)
+            cache.PutTable((table_addr, size), table)
+
+        return table[(addr & 0xfff) / size]
+
+    def _read_page_table(self, table_addr, size, fmt):
+        """Reads an entire page table for enumerating the address space.
+
+        The table is not kept in the translation cache, since enumeration
+        touches every table once. Empty tables are detected with a single
+        comparison, without unpacking them.
+
+        Returns:
+          A list of (index, entry) tuples for the non zero entries.
+        """
+        try:
+            data = self.base.read(table_addr, 0x1000)
+        except IOError:
+            return []
+
+        if len(data) != 0x1000 or data == ZERO_PAGE:
+            return []
+
+        table = struct.unpack("<" + fmt * (0x1000 / size), data)
+        return [(i, entry) for i, entry in enumerate(table) if entry]
+
     def entry_present(self, entry):
         '''
         Returns whether or not the 'P' (Present) flag is on
@@ -154,6 +322,32 @@ class IA32PagedMemory(addrspace.PagedReader):
         Translates virtual addresses into physical offsets.
         The function should return either None (no valid mapping)
         or the offset in physical memory where the address maps.
+
+        Translations are cached per page. The actual page table walk is done
+        by _vtop().
+        '''
+        vaddr = int(vaddr)
+        if not self.cache_translations:
+            return self._vtop(vaddr)
+
+        cache = self.translation_cache
+        key = (self.translation_root, vaddr >> 12)
+        try:
+            page = cache.translations[key]
+            cache.hits += 1
+        except KeyError:
+            cache.misses += 1
+            page = self._vtop(vaddr & ~0xfff)
+            cache.PutTranslation(key, page)
+
+        if page is None:
+            return None
+
+        return page | (vaddr & 0xfff)
+
+    def _vtop(self, vaddr):
+        '''
+        Walks the page tables to translate vaddr into a physical offset.
         '''
         pde_value = self.get_pde(vaddr)
         if not self.entry_present(pde_value):
@@ -176,6 +370,14 @@ class IA32PagedMemory(addrspace.PagedReader):
         Returns an unsigned 32-bit integer from the address addr in
         physical memory. If unable to read from that location, returns None.
         '''
+        if self.cache_translations:
+            longval = self._read_table_entry(addr, 4, "I")
+            if longval is None:
+                return obj.NoneObject(
+                    "Could not read_long_phys at offset " + str(addr))
+
+            return longval
+
         try:
             string = self.base.read(addr, 4)
         except IOError:
@@ -187,18 +389,18 @@ class IA32PagedMemory(addrspace.PagedReader):
         return longval
 
     def get_available_addresses(self):
-        """Enumerate all valid memory ranges.
+        """Enumerate all valid memory pages.
 
         Yields:
-          tuples of (starting virtual address, size) for valid the memory
-          ranges.
+          tuples of (starting virtual address, physical address, size) for
+          each valid page, in order.
         """
         # Pages that hold PDEs and PTEs are 0x1000 bytes each.
         # Each PDE and PTE is four bytes. Thus there are 0x1000 / 4 = 0x400
         # PDEs and PTEs we must test
-        for pde in range(0, 0x400):
+        for pde, pde_value in self._read_page_table(
+                self.dtb & 0xfffff000, 4, "I"):
             vaddr = pde << 22
-            pde_value = self.get_pde(vaddr)
             if not self.entry_present(pde_value):
                 continue
 
@@ -212,18 +414,44 @@ class IA32PagedMemory(addrspace.PagedReader):
             # windows where IO is extremely expensive, its
             # about 10 times more efficient than reading it
             # one value at the time - and this loop is HOT!
-            pte_table_addr = ((pde_value & 0xfffff000) |
-                              ((vaddr & 0x3ff000) >> 10))
-
-            data = self.base.read(pte_table_addr, 4 * 0x400)
-            pte_table = struct.unpack("<" + "I" * 0x400, data)
-
-            for i, pte_value in enumerate(pte_table):
+            for i, pte_value in self._read_page_table(
+                    pde_value & 0xfffff000, 4, "I"):
                 if self.entry_present(pte_value):
                     yield (vaddr | i << 12,
                            self.get_phys_addr(vaddr | i << 12, pte_value),
                            0x1000)
 
+    def _get_coalesced_ranges(self):
+        """Generates the valid memory ranges, merging adjacent pages."""
+        return MergeRanges(self.get_available_addresses())
+
+    def _get_address_ranges(self):
+        """Generates the merged address ranges of this address space.
+
+        The ranges are kept in the translation cache under our translation
+        root, so all the address spaces using the same page tables share them.
+        """
+        cache = self.translation_cache
+        try:
+            for x in cache.ranges[self.translation_root]:
+                yield x
+
+            return
+        except KeyError:
+            pass
+
+        result = []
+        for x in self._get_coalesced_ranges():
+            if self.session:
+                self.session.report_progress(
+                    "%(name)s: Merging Address Ranges %(spinner)s",
+                    name=self.name)
+
+            result.append(x)
+            yield x
+
+        cache.ranges[self.translation_root] = result
+
     def __str__(self):
         return "%s@0x%08X (%s)" % (self.__class__.__name__, self.dtb, self.name)
 
@@ -314,7 +542,7 @@ class IA32PagedMemoryPae(IA32PagedMemory):
         return (pte & 0xffffffffff000) | (vaddr & 0xfff)
 
 
-    def vtop(self, vaddr):
+    def _vtop(self, vaddr):
         '''
         Translates virtual addresses into physical offsets.
         The function returns either None (no valid mapping)
@@ -346,6 +574,14 @@ class IA32PagedMemoryPae(IA32PagedMemory):
         Returns an unsigned 64-bit integer from the address addr in
         physical memory. If unable to read from that location, returns None.
         '''
+        if self.cache_translations:
+            longlongval = self._read_table_entry(addr, 8, "Q")
+            if longlongval is None:
+                return obj.NoneObject(
+                    "Unable to read_long_long_phys at " + str(addr))
+
+            return longlongval
+
         try:
             string = self.base.read(addr, 8)
         except IOError:
@@ -367,9 +603,9 @@ class IA32PagedMemoryPae(IA32PagedMemory):
             if not self.entry_present(pdpte_value):
                 continue
 
-            for pde in range(0, 0x200):
+            for pde, pde_value in self._read_page_table(
+                    pdpte_value & 0xffffffffff000, 8, "Q"):
                 vaddr = pdpte << 30 | (pde << 21)
-                pde_value = self.get_pde(vaddr, pdpte_value)
                 if not self.entry_present(pde_value):
                     continue
                 if self.page_size_flag(pde_value):
@@ -382,13 +618,8 @@ class IA32PagedMemoryPae(IA32PagedMemory):
                 # windows where IO is extremely expensive, its
                 # about 10 times more efficient than reading it
                 # one value at the time - and this loop is HOT!
-                pte_table_addr = ((pde_value & 0xffffffffff000) |
-                                  ((vaddr & 0x1ff000) >> 9))
-
-                data = self.base.read(pte_table_addr, 8 * 0x200)
-                pte_table = struct.unpack("<" + "Q" * 0x200, data)
-
-                for i, pte_value in enumerate(pte_table):
+                for i, pte_value in self._read_page_table(
+                        pde_value & 0xffffffffff000, 8, "Q"):
                     if self.entry_present(pte_value):
                         yield (vaddr | i << 12,
                                self.get_phys_addr(vaddr | i << 12, pte_value),
@@ -0,0 +1,134 @@
+import unittest
+
+from rekall import session
+from rekall import testlib
+from rekall.plugins.addrspaces import amd64
+from rekall.plugins.addrspaces import intel
+
+
+class TranslationCacheTest(unittest.TestCase):
+    """Test the translation cache shared by the paged address spaces."""
+
+    def setUp(self):
+        self.session = session.Session()
+        self.tables = testlib.SyntheticPageTables("ia32", table_base=0x10000)
+        self.tables.map(0x0, 0x5000)
+        self.tables.map(0x1000, 0x7000)
+        self.tables.map(0x400000, 0x8000)
+        self.base = self.tables.address_space(self.session)
+
+    def MakeAddressSpace(self, cls, cache_translations=True):
+        result = cls(base=self.base, dtb=self.tables.dtb, session=self.session)
+        result.cache_translations = cache_translations
+        return result
+
+    def testMixedPagingModes(self):
+        # The same dtb interpreted in two paging modes on a shared base.
+        ia32_as = self.MakeAddressSpace(intel.IA32PagedMemory)
+        pae_as = self.MakeAddressSpace(intel.IA32PagedMemoryPae)
+        self.assertTrue(ia32_as.translation_cache is pae_as.translation_cache)
+
+        addresses = [0x0, 0x1010, 0x400020, 0x800000]
+        expected = {}
+        for cls in (intel.IA32PagedMemory, intel.IA32PagedMemoryPae):
+            uncached_as = self.MakeAddressSpace(cls, cache_translations=False)
+            expected[cls] = [uncached_as.vtop(x) for x in addresses]
+
+        self.assertEqual(expected[intel.IA32PagedMemory],
+                         [0x5000, 0x7010, 0x8020, None])
+        self.assertNotEqual(expected[intel.IA32PagedMemory],
+                            expected[intel.IA32PagedMemoryPae])
+
+        # Each mode sees its own translations, whichever is cached first.
+        for address_space in (ia32_as, pae_as, ia32_as, pae_as):
+            self.assertEqual([address_space.vtop(x) for x in addresses],
+                             expected[address_space.__class__])
+
+        self.assertEqual(list(ia32_as.get_address_ranges()),
+                         [(0x0, 0x5000, 0x1000), (0x1000, 0x7000, 0x1000),
+                          (0x400000, 0x8000, 0x1000)])
+        self.assertEqual(list(pae_as.get_address_ranges()),
+                         list(self.MakeAddressSpace(
+                             intel.IA32PagedMemoryPae).get_address_ranges()))
+        self.assertNotEqual(list(pae_as.get_address_ranges()),
+                            list(ia32_as.get_address_ranges()))
+
+    def testCounters(self):
+        address_space = self.MakeAddressSpace(intel.IA32PagedMemory)
+        cache = address_space.translation_cache
+
+        self.assertEqual(address_space.vtop(0x1010), 0x7010)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        # The same page is only walked once.
+        self.assertEqual(address_space.vtop(0x1ff0), 0x7ff0)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # A new page in the same page table reuses the cached table pages.
+        table_misses = cache.table_misses
+        self.assertEqual(address_space.vtop(0x10), 0x5010)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertEqual(cache.table_misses, table_misses)
+        self.assertTrue(cache.table_hits >= 2)
+
+        # Invalid pages are cached too.
+        self.assertEqual(address_space.vtop(0x800000), None)
+        self.assertEqual(address_space.vtop(0x800000), None)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+        # Without the cache nothing is counted.
+        address_space.cache_translations = False
+        self.assertEqual(address_space.vtop(0x1010), 0x7010)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+    def testFlush(self):
+        address_space = self.MakeAddressSpace(intel.IA32PagedMemory)
+        self.assertEqual(address_space.vtop(0x1010), 0x7010)
+        self.assertEqual(len(list(address_space.get_address_ranges())), 3)
+
+        # Remap the page in memory - the stale translation is still cached.
+        self.tables.map(0x1000, 0x9000)
+        self.base.assign_buffer(str(self.tables.memory))
+        self.assertEqual(address_space.vtop(0x1010), 0x7010)
+
+        address_space.flush_translation_cache()
+        cache = address_space.translation_cache
+        self.assertEqual((cache.translations, cache.tables, cache.ranges),
+                         ({}, {}, {}))
+
+        self.assertEqual(address_space.vtop(0x1010), 0x9010)
+        self.assertEqual(list(address_space.get_address_ranges())[1],
+                         (0x1000, 0x9000, 0x1000))
+
+
+class AMD64AvailableAddressesTest(unittest.TestCase):
+    """Test enumerating the four level page tables."""
+
+    MAPPINGS = [(0x1000, 0x5000, 0x1000), (0x7fff00200000, 0x200000, 0x200000),
+                (0xc00000000000, 0x40000000, 0x40000000),
+                (0xfffff80000003000, 0x6000, 0x1000)]
+
+    def testGetAvailableAddresses(self):
+        tables = testlib.SyntheticPageTables("amd64")
+        for vaddr, paddr, page_size in self.MAPPINGS:
+            tables.map(vaddr, paddr, page_size=page_size)
+
+        session_obj = session.Session()
+        base = tables.address_space(session_obj)
+        expected = [(x & 0xffffffffffff, y, z) for x, y, z in self.MAPPINGS]
+
+        for address_space in (
+                amd64.AMD64PagedMemory(
+                    base=base, dtb=tables.dtb, session=session_obj),
+                amd64.VTxPagedMemory(
+                    base=base, ept=[tables.dtb], session=session_obj)):
+            self.assertEqual(list(address_space.get_available_addresses()),
+                             expected)
+
+            # The ranges are cached separately for each mode.
+            self.assertEqual(list(address_space.get_address_ranges()),
+                             expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -80,6 +80,29 @@ class MmapFileAddressSpace(addrspace.BaseAddressSpace):
 
         return result + "\x00" * (length - len(result))
 
+    def read_into(self, addr, buf, offset=0, length=None):
+        # Copy straight from the mapping into the caller's buffer.
+        if length is None:
+            length = len(buf) - offset
+
+        available = 0
+        if addr is not None and addr >= 0:
+            available = max(0, min(length, self.fsize - addr))
+            buf[offset:offset + available] = buffer(self.map, addr, available)
+
+        if available < length:
+            buf[offset + available:offset + length] = "\x00" * (
+                length - available)
+
+        return length
+
+    def read_view(self, addr, length):
+        # A view into the mapping itself - no data is copied.
+        if addr is not None and 0 <= addr and addr + length <= self.fsize:
+            return buffer(self.map, addr, length)
+
+        return self.read(addr, length)
+
     def get_available_addresses(self):
         # TODO: Explain why this is always fsize - 1?
         yield (0, 0, self.fsize - 1)
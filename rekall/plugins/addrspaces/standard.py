@@ -57,6 +57,28 @@ class FDAddressSpace(addrspace.BaseAddressSpace):
         except IOError:
             return "\x00" * length
 
+    def read_into(self, addr, buf, offset=0, length=None):
+        if length is None:
+            length = len(buf) - offset
+
+        # Not all file like objects can read into a buffer.
+        if not hasattr(self.fhandle, "readinto"):
+            return super(FDAddressSpace, self).read_into(
+                addr, buf, offset, length)
+
+        try:
+            self.fhandle.seek(addr)
+            available = self.fhandle.readinto(
+                memoryview(buf)[offset:offset + length]) or 0
+        except IOError:
+            available = 0
+
+        if available < length:
+            buf[offset + available:offset + length] = "\x00" * (
+                length - available)
+
+        return length
+
     def read_long(self, addr):
         string = self.read(addr, 4)
         (longval,) = struct.unpack('=I', string)
@@ -80,7 +102,7 @@ class FDAddressSpace(addrspace.BaseAddressSpace):
                 self.fname == other.fname)
 
 
-class FileAddressSpace(FDAddressSpace):
+class FileAddressSpace(addrspace.CachingAddressSpaceMixIn, FDAddressSpace):
     """ This is a direct file AS.
 
     For this AS to be instantiated, we need
@@ -118,6 +140,9 @@ class FileAddressSpace(FDAddressSpace):
                 "Unable to open a device without the win32file package "
                 "installed.")
 
+        # Devices (e.g. live memory) may change under us so are not cached.
+        self.cache_blocks = os.path.isfile(self.fname)
+
         fhandle = open(self.fname, self.mode)
         super(FileAddressSpace, self).__init__(
             fhandle=fhandle, session=session, base=base, **kwargs)
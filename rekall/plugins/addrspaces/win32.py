@@ -123,6 +123,11 @@ class Win32FileAddressSpace(addrspace.RunBasedAddressSpace):
 
         return data
 
+    def _read_chunk_into(self, addr, buf, offset, length):
+        data = self._read_chunk(addr, length)
+        buf[offset:offset + len(data)] = data
+        return len(data)
+
     def write(self, addr, data):
         length = len(data)
         offset, available_length = self._get_available_buffer(addr, length)
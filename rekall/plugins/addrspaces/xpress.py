@@ -32,100 +32,108 @@
 
 #pylint: disable-msg=C0111
 
-from struct import unpack
+from struct import unpack_from
 from struct import error as StructError
 
-def recombine(outbuf):
-    return "".join(outbuf[k] for k in sorted(outbuf.keys()))
 
 def xpress_decode(inputBuffer):
-    outputBuffer = {}
-    outputIndex = 0
+    """Decompress an XPRESS compressed buffer.
+
+    The output is accumulated in a bytearray: runs of literals are copied with
+    a single slice and back references are copied a whole match at a time
+    (overlapping matches simply repeat the referenced window).
+    """
+    data = bytearray(inputBuffer)
+    outputBuffer = bytearray()
     inputIndex = 0
+    inputLength = len(data)
+    indicator = 0
     indicatorBit = 0
     nibbleIndex = 0
 
     # we are decoding the entire input here, so I have changed
     # the check to see if we're at the end of the output buffer
     # with a check to see if we still have any input left.
-    while inputIndex < len(inputBuffer):
-        if (indicatorBit == 0):
-            # in pseudocode this was indicatorBit = ..., but that makes no
-            # sense, so I think this was intended...
+    while inputIndex < inputLength:
+        if indicatorBit == 0:
             try:
-                indicator = unpack("<L", inputBuffer[inputIndex:inputIndex + 4])[0]
+                indicator = unpack_from("<L", inputBuffer, inputIndex)[0]
             except StructError:
-                return recombine(outputBuffer)
+                break
 
             inputIndex += 4
             indicatorBit = 32
 
-        indicatorBit = indicatorBit - 1
-        # check whether the bit specified by indicatorBit is set or not
-        # set in indicator. For example, if indicatorBit has value 4
-        # check whether the 4th bit of the value in indicator is set
-        if not (indicator & (1 << indicatorBit)):
-            try:
-                outputBuffer[outputIndex] = inputBuffer[inputIndex]
-            except IndexError:
-                return recombine(outputBuffer)
-
-            inputIndex += 1
-            outputIndex += 1
-        else:
-            # Get the length. This appears to use a scheme whereby if
-            # the value at the current width is all ones, then we assume
-            # that it is actually wider. First we try 3 bits, then 3
-            # bits plus a nibble, then a byte, and finally two bytes (an
-            # unsigned short). Also, if we are using a nibble, then every
-            # other time we get the nibble from the high part of the previous
-            # byte used as a length nibble.
-            # Thus if a nibble byte is F2, we would first use the low part (2),
-            # and then at some later point get the nibble from the high part (F).
-
-            try:
-                length = unpack("<H", inputBuffer[inputIndex:inputIndex + 2])[0]
-            except StructError:
-                return recombine(outputBuffer)
-
+        # Each clear bit in the indicator (from the most significant bit down)
+        # is a literal byte. Copy the whole run of literals at once.
+        remaining = indicator & ((1 << indicatorBit) - 1)
+        literals = indicatorBit - remaining.bit_length()
+        if literals:
+            outputBuffer += data[inputIndex:inputIndex + literals]
+            inputIndex += literals
+            indicatorBit -= literals
+
+            if inputIndex > inputLength:
+                break
+
+            continue
+
+        # The next bit is set - this is a back reference.
+        indicatorBit -= 1
+
+        # Get the length. This appears to use a scheme whereby if
+        # the value at the current width is all ones, then we assume
+        # that it is actually wider. First we try 3 bits, then 3
+        # bits plus a nibble, then a byte, and finally two bytes (an
+        # unsigned short). Also, if we are using a nibble, then every
+        # other time we get the nibble from the high part of the previous
+        # byte used as a length nibble.
+        # Thus if a nibble byte is F2, we would first use the low part (2),
+        # and then at some later point get the nibble from the high part (F).
+        try:
+            length = unpack_from("<H", inputBuffer, inputIndex)[0]
             inputIndex += 2
-            offset = length / 8
-            length = length % 8
+            offset = length >> 3
+            length &= 7
             if length == 7:
                 if nibbleIndex == 0:
                     nibbleIndex = inputIndex
-                    length = ord(inputBuffer[inputIndex]) % 16
+                    length = data[inputIndex] & 0xF
                     inputIndex += 1
                 else:
                     # get the high nibble of the last place a nibble sized
                     # length was used thus we don't waste that extra half
                     # byte :p
-                    length = ord(inputBuffer[nibbleIndex]) / 16
+                    length = data[nibbleIndex] >> 4
                     nibbleIndex = 0
 
                 if length == 15:
-                    length = ord(inputBuffer[inputIndex])
+                    length = data[inputIndex]
                     inputIndex += 1
                     if length == 255:
-                        try:
-                            length = unpack("<H", inputBuffer[inputIndex:inputIndex + 2])[0]
-                        except StructError:
-                            return recombine(outputBuffer)
-                        inputIndex = inputIndex + 2
-                        length = length - (15 + 7)
-                    length = length + 15
-                length = length + 7
-            length = length + 3
-
-            while length != 0:
-                try:
-                    outputBuffer[outputIndex] = outputBuffer[outputIndex - offset - 1]
-                except KeyError:
-                    return recombine(outputBuffer)
-                outputIndex += 1
-                length -= 1
-
-    return recombine(outputBuffer)
+                        length = unpack_from("<H", inputBuffer, inputIndex)[0]
+                        inputIndex += 2
+                        length -= 15 + 7
+                    length += 15
+                length += 7
+            length += 3
+
+        except (StructError, IndexError):
+            break
+
+        source = len(outputBuffer) - offset - 1
+        if source < 0:
+            break
+
+        window = offset + 1
+        if length <= window:
+            outputBuffer += outputBuffer[source:source + length]
+        else:
+            # An overlapping match repeats the last window bytes.
+            pattern = outputBuffer[source:]
+            outputBuffer += (pattern * (length // window + 1))[:length]
+
+    return str(outputBuffer)
 
 try:
     import pyxpress #pylint: disable-msg=F0401
@@ -1,3 +1,4 @@
 """Plugins that are not OS-specific"""
 
 from rekall.plugins.common import networking
+from rekall.plugins.common import reverse_map
@@ -0,0 +1,252 @@
+# Rekall Memory Forensics
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""A reverse map from physical addresses to the virtual addresses mapping them.
+
+The same physical page may be mapped into many address spaces at once (e.g. the
+kernel and several processes). The only way to find them all is to enumerate
+every address space, which is expensive - so the ReverseMap is built once and
+kept in the session (and optionally in the disk cache).
+
+The runs are kept in flat arrays sorted by physical address. Runs are split so
+they are never longer than MAX_RUN, so a lookup only needs to search back a
+bounded distance from the bisection point.
+"""
+__author__ = "Michael Cohen <scudette@google.com>"
+
+import array
+import bisect
+
+from rekall import config
+from rekall import utils
+
+
+config.DeclareOption(
+    "--persist_reverse_map", default=False, action="store_true",
+    help="Keep the physical to virtual reverse map in the disk cache, so "
+    "later sessions on the same image do not need to rebuild it.")
+
+
+class ReverseMap(object):
+    """Maps physical addresses to (owner, virtual address) pairs."""
+
+    # Runs longer than this are split.
+    MAX_RUN = 0x200000
+
+    def __init__(self, owners=None):
+        # A list of (pid, name, dtb) for each address space in the map. The
+        # kernel has a pid of None.
+        self.owners = owners or []
+
+        # The runs, sorted by physical address.
+        self.starts = utils.AddressArray()
+        self.lengths = array.array("I")
+        self.vaddrs = utils.AddressArray()
+        self.owner_ids = array.array("I")
+
+    @classmethod
+    def Build(cls, owners, session=None):
+        """Builds the map.
+
+        Args:
+          owners: An iterable of (pid, name, address_space).
+          session: If specified, used to report progress.
+        """
+        result = cls()
+        runs = []
+        for pid, name, address_space in owners:
+            owner_id = len(result.owners)
+            result.owners.append(
+                (pid, name, getattr(address_space, "dtb", None)))
+
+            if session:
+                session.report_progress(
+                    "Enumerating memory for %s (%s)" % (pid, name))
+
+            for vaddr, paddr, length in address_space.get_address_ranges():
+                for offset in xrange(0, length, cls.MAX_RUN):
+                    runs.append((paddr + offset,
+                                 min(cls.MAX_RUN, length - offset),
+                                 vaddr + offset, owner_id))
+
+        runs.sort()
+        for paddr, length, vaddr, owner_id in runs:
+            result.starts.append(paddr)
+            result.lengths.append(length)
+            result.vaddrs.append(vaddr)
+            result.owner_ids.append(owner_id)
+
+        return result
+
+    def Lookup(self, physical_address):
+        """Finds all the virtual addresses mapping the physical address.
+
+        Returns:
+          A list of ((pid, name, dtb), virtual address) tuples ordered by the
+          owners (i.e. the kernel first).
+        """
+        result = []
+        starts = self.starts
+        i = bisect.bisect_right(starts, physical_address) - 1
+        while i >= 0 and starts[i] + self.MAX_RUN > physical_address:
+            offset = physical_address - starts[i]
+            if offset < self.lengths[i]:
+                result.append((self.owner_ids[i], self.vaddrs[i] + offset))
+
+            i -= 1
+
+        result.sort()
+        return [(self.owners[owner_id], vaddr) for owner_id, vaddr in result]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getstate__(self):
+        # Arrays pickle much smaller as strings.
+        state = dict(owners=self.owners)
+        for name in ("starts", "lengths", "vaddrs", "owner_ids"):
+            value = getattr(self, name)
+            if isinstance(value, array.array):
+                value = value.tostring()
+
+            state[name] = value
+
+        return state
+
+    def __setstate__(self, state):
+        self.__init__(owners=state["owners"])
+        self.starts = utils.AddressArray(state["starts"])
+        self.lengths.fromstring(state["lengths"])
+        self.vaddrs = utils.AddressArray(state["vaddrs"])
+        self.owner_ids.fromstring(state["owner_ids"])
+
+
+class ReverseMapCache(dict):
+    """The reverse maps stored in the session."""
+
+    def __str__(self):
+        return "<%d reverse maps>" % len(self)
+
+
+class ReverseMapMixIn(object):
+    """A mixin for plugins which need to map physical to virtual addresses.
+
+    The map is shared by all plugins through the session. Plugins implement
+    reverse_map_owners() for their OS.
+    """
+
+    def reverse_map_owners(self):
+        """Yields (pid, name, address_space) to put in the reverse map.
+
+        The kernel should come first, with a pid of None.
+        """
+        raise NotImplementedError()
+
+    def get_reverse_map(self):
+        """Returns the ReverseMap for the owners, building it if needed."""
+        owners = list(self.reverse_map_owners())
+
+        # The map depends on exactly which address spaces are in it.
+        key = tuple((pid, getattr(address_space, "dtb", None))
+                    for pid, _, address_space in owners)
+
+        if self.session.reverse_maps is None:
+            self.session.reverse_maps = ReverseMapCache()
+
+        result = self.session.reverse_maps.get(key)
+        if result is not None:
+            return result
+
+        cache_key = None
+        if self.session.GetParameter("persist_reverse_map"):
+            image_state = self.session.GetImageState()
+            if image_state:
+                cache_key = (image_state.fingerprint, key)
+
+        if cache_key:
+            try:
+                result = self.session.disk_cache.Get("reverse_map", cache_key)
+            except KeyError:
+                pass
+
+        if result is None:
+            result = ReverseMap.Build(owners, session=self.session)
+            if cache_key:
+                self.session.disk_cache.Put("reverse_map", cache_key, result)
+
+        self.session.reverse_maps[key] = result
+        return result
+
+    def get_virtual_addresses(self, physical_address):
+        """Returns (pid, name, virtual address) tuples mapping the address.
+
+        If the kernel maps the address we only report the kernel mappings
+        (since the kernel is also mapped into every process).
+        """
+        mappings = [(pid, name, vaddr) for (pid, name, _), vaddr in
+                    self.get_reverse_map().Lookup(physical_address)]
+
+        kernel_mappings = [x for x in mappings if x[0] is None]
+
+        return kernel_mappings or mappings
+
+
+class Pas2VasMixIn(ReverseMapMixIn):
+    """Resolves a physical address to a virtual address in a process.
+
+    Often a user might want to see which process maps a particular physical
+    offset. In reality the same physical memory can be mapped into multiple
+    processes (and the kernel) at the same time. Usually since the kernel
+    memory is mapped into each process's address space, a single physical
+    offset which is mapped into the kernel will also be mapped into each
+    process.
+
+    The only way to tell if a physical page is mapped into a process is to
+    enumerate all process maps and then search them for the physical
+    offset. This takes a fair bit of effort so the reverse map is stored in the
+    session for quick reuse.
+    """
+
+    @classmethod
+    def args(cls, parser):
+        super(Pas2VasMixIn, cls).args(parser)
+        parser.add_argument(
+            "offsets", action=config.ArrayIntParser, nargs="+",
+            help="A list of physical offsets to resolve.")
+
+    def __init__(self, offsets=None, **kwargs):
+        super(Pas2VasMixIn, self).__init__(**kwargs)
+        if offsets is None:
+            raise RuntimeError("Some offsets must be provided.")
+
+        try:
+            self.physical_address = list(offsets)
+        except TypeError:
+            self.physical_address = [offsets]
+
+    def render(self, renderer):
+        renderer.table_header([('Physical', 'virtual_offset', '[addrpad]'),
+                               ('Virtual', 'physical_offset', '[addrpad]'),
+                               ('Pid', 'pid', '>6'),
+                               ('Name', 'name', '')])
+
+        for physical_address in self.physical_address:
+            for pid, name, virtual_address in self.get_virtual_addresses(
+                    physical_address):
+                renderer.table_row(physical_address, virtual_address,
+                                   pid or 0, name)
@@ -0,0 +1,61 @@
+import cPickle
+import unittest
+
+from rekall import session
+from rekall import testlib
+from rekall.plugins.addrspaces import amd64
+from rekall.plugins.common import reverse_map
+
+
+class ReverseMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.session = session.Session()
+
+    def MakeAddressSpace(self, mappings, page_size=0x1000):
+        tables = testlib.SyntheticPageTables("amd64")
+        for vaddr, paddr, length in mappings:
+            for offset in range(0, length, page_size):
+                tables.map(vaddr + offset, paddr + offset, page_size=page_size,
+                           flags=None if page_size == 0x1000 else
+                           0x3 | tables.PAGE_SIZE_FLAG)
+
+        return amd64.AMD64PagedMemory(
+            base=tables.address_space(self.session), dtb=tables.dtb,
+            session=self.session)
+
+    def testLookup(self):
+        kernel_as = self.MakeAddressSpace(
+            [(0xf80000000000, 0x400000, 0x600000)], page_size=0x200000)
+        proc1_as = self.MakeAddressSpace([(0x10000, 0x5000, 0x3000),
+                                          (0x40000, 0x6000, 0x1000)])
+        proc2_as = self.MakeAddressSpace([(0x20000, 0x7000, 0x1000)])
+
+        result = reverse_map.ReverseMap.Build([
+            (None, "Kernel", kernel_as), (1, "proc1", proc1_as),
+            (2, "proc2", proc2_as)])
+
+        # The kernel run is split.
+        self.assertEqual(len(result), 3 + 3)
+
+        def Lookup(physical_address):
+            return [(owner[0], vaddr)
+                    for owner, vaddr in result.Lookup(physical_address)]
+
+        self.assertEqual(Lookup(0x4fff), [])
+        self.assertEqual(Lookup(0x5010), [(1, 0x10010)])
+        self.assertEqual(Lookup(0x6010), [(1, 0x11010), (1, 0x40010)])
+        self.assertEqual(Lookup(0x7fff), [(1, 0x12fff), (2, 0x20fff)])
+        self.assertEqual(Lookup(0x8000), [])
+        self.assertEqual(Lookup(0x400000), [(None, 0xf80000000000)])
+        self.assertEqual(Lookup(0x9ff123), [(None, 0xf800005ff123)])
+        self.assertEqual(Lookup(0xa00000), [])
+
+        # The map survives pickling (for the disk cache).
+        result = cPickle.loads(cPickle.dumps(result, -1))
+        self.assertEqual(Lookup(0x7fff), [(1, 0x12fff), (2, 0x20fff)])
+        self.assertEqual(Lookup(0x9ff123), [(None, 0xf800005ff123)])
+
+
+if __name__ == "__main__":
+    unittest.main()
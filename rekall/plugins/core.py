@@ -37,6 +37,7 @@ from rekall import registry
 from rekall import plugin
 from rekall import obj
 from rekall import utils
+from rekall.plugins.addrspaces import dtb_scanner
 
 
 class DummyParser(object):
@@ -261,6 +262,12 @@ class Info(plugin.Command):
         self.render_profile_info(renderer)
 
 
+config.DeclareOption(
+    "--scan_for_dtb", default=False, action="store_true",
+    help="If the DTB can not be found from the profile, brute force scan the "
+    "physical memory for it.")
+
+
 class FindDTB(plugin.PhysicalASMixin, plugin.ProfileCommand):
     """A base class to be used by all the FindDTB implementation."""
     __abstract = True
@@ -273,6 +280,14 @@ class FindDTB(plugin.PhysicalASMixin, plugin.ProfileCommand):
         """Verify the hit for correctness, yielding an address space."""
         return self.CreateAS(hit)
 
+    def VerifyDTB(self, dtb):
+        """Verify a DTB found earlier (e.g. in a previous session).
+
+        Returns:
+          The address space for the DTB, or None if it is not valid.
+        """
+        return self.VerifyHit(dtb)
+
     def address_space_hits(self):
         """Finds DTBs and yields virtual address spaces that expose kernel.
 
@@ -312,6 +327,24 @@ class FindDTB(plugin.PhysicalASMixin, plugin.ProfileCommand):
 
         return as_class
 
+    def scan_for_dtbs(self, vaddr, paddr=None):
+        """Brute force scans the physical memory for DTBs.
+
+        Yields:
+          Each DTB which translates vaddr to paddr (or which maps vaddr at all
+          if paddr is None).
+        """
+        mode = dtb_scanner.GetPagingMode(self.GetAddressSpaceImplementation())
+        if mode is None:
+            return
+
+        scanner = dtb_scanner.DTBScanner(
+            address_space=self.physical_address_space, mode=mode,
+            session=self.session)
+
+        for dtb, _ in scanner.scan(vaddr, paddr=paddr):
+            yield dtb
+
 
 class LoadAddressSpace(plugin.Command):
     """Load address spaces into the session if its not already loaded."""
@@ -376,7 +409,8 @@ class LoadAddressSpace(plugin.Command):
         try:
             # Try to get a physical address space.
             if self.pas_spec == "auto":
-                self.session.physical_address_space = self.GuessAddressSpace()
+                self.session.physical_address_space = (
+                    self.RememberedAddressSpace() or self.GuessAddressSpace())
             else:
                 self.session.physical_address_space = self.AddressSpaceFactory(
                     specification=self.pas_spec)
@@ -449,6 +483,22 @@ class LoadAddressSpace(plugin.Command):
 
         return self.session.kernel_address_space
 
+    def RememberedAddressSpace(self):
+        """Builds the address space stack found for this image before."""
+        image_state = self.session.GetImageState()
+        if not image_state:
+            return
+
+        try:
+            return self.AddressSpaceFactory(
+                specification=image_state.Get("pas_spec"))
+        except KeyError:
+            return
+
+        except (AssertionError, IOError, addrspace.Error), e:
+            logging.debug("Remembered address space failed: %s", e)
+            image_state.Expire("pas_spec")
+
     def GuessAddressSpace(self, base_as=None, **kwargs):
         """Loads an address space by stacking valid ASes on top of each other
         (priority order first).
@@ -492,6 +542,18 @@ class LoadAddressSpace(plugin.Command):
 
         if base_as:
             logging.info("Autodetected physical address space %s", base_as)
+
+            # Remember the stack so we do not need to guess next time.
+            image_state = self.session.GetImageState()
+            if image_state and not kwargs:
+                specification = [base_as.__class__.__name__]
+                address_space = base_as
+                while address_space.base not in (None, address_space):
+                    address_space = address_space.base
+                    specification.insert(0, address_space.__class__.__name__)
+
+                image_state.Put("pas_spec", ":".join(specification))
+
         else:
             logging.error("Failed to autodetect image file format. "
                           "Try running plugins.load_as with the pas_spec "
@@ -594,16 +656,20 @@ class DirectoryDumperMixin(object):
         """
         BUFFSIZE = 1024 * 1024
 
+        # Data is read straight into this buffer, which is reused for each
+        # block.
+        buf = bytearray(BUFFSIZE)
+
         for offset, _, length in address_space.get_address_ranges(start, end):
             outfd.seek(offset - start)
             i = offset
 
             # Now copy the region in fixed size buffers.
             while i < offset + length:
-                to_read = min(BUFFSIZE, length)
+                to_read = min(BUFFSIZE, offset + length - i)
 
-                data = address_space.read(i, to_read)
-                outfd.write(data)
+                address_space.read_into(i, buf, 0, to_read)
+                outfd.write(buffer(buf, 0, to_read))
 
                 i += to_read
 
@@ -8,4 +8,5 @@ from rekall.plugins.darwin import lsmod
 from rekall.plugins.darwin import misc
 from rekall.plugins.darwin import pslist
 from rekall.plugins.darwin import networking
+from rekall.plugins.darwin import pas2kas
 from rekall.plugins.darwin import zones
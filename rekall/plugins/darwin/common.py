@@ -88,11 +88,13 @@ def MOUNTAIN_LION_OR_LATER(profile):
     return bool(profile.get_constant("_BootPML4", False))
 
 
-class KernelSlideHook(kb.ParameterHook):
+class KernelSlideHook(kb.ProfileSpecificHookMixin, kb.ParameterHook):
     """Find the kernel slide if needed."""
 
     name = "vm_kernel_slide"
 
+    persistent = True
+
     def calculate(self):
         if MOUNTAIN_LION_OR_LATER(self.session.profile):
             return DarwinFindKASLR(session=self.session).vm_kernel_slide()
@@ -343,6 +345,19 @@ class DarwinFindDTB(DarwinKASLRMixin, AbstractDarwinCommandPlugin,
                                         vm=self.physical_address_space)
         yield int(kernel_pmap.pm_cr3)
 
+    def _dtb_hits_scan(self):
+        """Brute force scans for DTBs which map the kernel version string.
+
+        The kernel image is identity mapped (see ID_MAP_VTOP), so we know the
+        physical address the DTB must translate it to. This is slow, so it is
+        only used if requested with --scan_for_dtb.
+
+        Yields:
+          The physical address of the DTB, not verified.
+        """
+        address = self.profile.get_constant("_version")
+        return self.scan_for_dtbs(address, paddr=ID_MAP_VTOP(address))
+
     def _dtb_methods(self):
         """Determines viable methods of getting the DTB based on profile.
 
@@ -357,6 +372,9 @@ class DarwinFindDTB(DarwinKASLRMixin, AbstractDarwinCommandPlugin,
         if self.profile.metadata("arch") == "AMD64":
             yield self._dtb_hits_kernel_pmap
 
+            if self.session.GetParameter("scan_for_dtb"):
+                yield self._dtb_hits_scan
+
     def dtb_hits(self):
         for method in self._dtb_methods():
             for dtb_hit in method():
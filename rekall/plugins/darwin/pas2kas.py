@@ -0,0 +1,41 @@
+# Rekall Memory Forensics
+#
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""Resolve physical addresses to the processes mapping them."""
+
+__author__ = "Michael Cohen <scudette@google.com>"
+
+from rekall.plugins.common import reverse_map
+from rekall.plugins.darwin import common
+
+
+class DarwinPas2Vas(reverse_map.Pas2VasMixIn, common.DarwinProcessFilter):
+    """Resolves a physical address to a virtual addrress in a process."""
+
+    __name = "pas2vas"
+
+    def reverse_map_owners(self):
+        yield None, "Kernel", self.kernel_address_space
+
+        for proc in self.filter_processes():
+            proc_as = proc.get_process_address_space()
+
+            # Kernel threads share the kernel's page tables.
+            if proc_as is None or proc_as.dtb == self.kernel_address_space.dtb:
+                continue
+
+            yield int(proc.p_pid), unicode(proc.p_comm), proc_as
@@ -22,8 +22,8 @@
 __author__ = "Michael Cohen <scudette@gmail.com>"
 
 # pylint: disable=protected-access
-import re
 import logging
+import re
 
 from rekall import config
 from rekall import scan
@@ -74,6 +74,18 @@ class ProfileScanner(scan.BaseScanner):
 config.DeclareOption("--no_autodetect", default=False, action="store_true",
                      help="Should profiles be autodetected.")
 
+config.DeclareOption(
+    "--autodetect_workers", default=1, action=config.IntParser,
+    help="The number of worker processes used to verify candidate profiles "
+    "in parallel.")
+
+
+def _VerifyCandidate(hook, candidate):
+    """Returns the DTB found with the candidate profile, or None."""
+    kind, profile_name = candidate
+    if hook.VerifyProfile(kind, profile_name):
+        return int(hook.session.GetParameter("dtb"))
+
 
 class KernelASHook(kb.ParameterHook):
     """A ParameterHook for default_address_space.
@@ -97,6 +109,9 @@ class ProfileHook(kb.ParameterHook):
     """If the profile is not specified, we guess it."""
     name = "profile"
 
+    # We remember the profile and the DTB found with it.
+    persistent = True
+
     # Windows kernel pdb files.
     KERNEL_NAMES = set(
         ["ntoskrnl.pdb", "ntkrnlmp.pdb", "ntkrnlpa.pdb", "ntkrpamp.pdb"])
@@ -164,53 +179,183 @@ class ProfileHook(kb.ParameterHook):
 
             return profile
 
-    def ScanProfiles(self):
-        pe_profile = self.session.LoadProfile("pe")
+    # Candidates found in the same window of this many bytes are ranked
+    # together before being verified.
+    RANKING_WINDOW = 0x4000000
+
+    FIND_DTB_PLUGINS = dict(
+        Win=win_common.WinFindDTB,
+        Linux=linux_common.LinuxFindDTB,
+        Darwin=darwin_common.DarwinFindDTB)
+
+    def VerifyProfile(self, kind, profile_name):
+        return getattr(self, "Verify%sProfile" % kind)(profile_name)
+
+    # The kind of each profile by its os metadata.
+    OS_KINDS = dict(windows="Win", linux="Linux", darwin="Darwin")
+
+    def ApplyDTB(self, kind, profile_name, dtb, verify=False):
+        """Uses the profile with a DTB.
+
+        Args:
+          verify: If set the DTB is verified first, otherwise it must have been
+            verified already (e.g. by a worker process).
+        """
+        try:
+            profile = self.session.LoadProfile(profile_name)
+        except ValueError:
+            return
+
+        self.session.profile = profile
+        find_dtb_plugin = self.FIND_DTB_PLUGINS[kind](session=self.session)
+        if verify:
+            address_space = find_dtb_plugin.VerifyDTB(dtb)
+        else:
+            address_space = find_dtb_plugin.CreateAS(dtb)
+
+        if address_space is None:
+            return
 
+        self.session.kernel_address_space = address_space
+        self.session.SetParameter("default_address_space", address_space)
+        self.session.SetParameter("dtb", address_space.dtb)
+
+        return profile
+
+    def ParseCandidate(self, hit, pe_profile):
+        """Returns the (kind, profile name) suggested by the scanner hit."""
         address_space = self.session.physical_address_space
-        for hit in ProfileScanner(address_space=address_space,
-                                  session=self.session).scan():
-            rsds = pe_profile.CV_RSDS_HEADER(offset=hit, vm=address_space)
-            if (rsds.Signature.is_valid() and
+        rsds = pe_profile.CV_RSDS_HEADER(offset=hit, vm=address_space)
+        if (rsds.Signature.is_valid() and
                 str(rsds.Filename) in self.KERNEL_NAMES):
-                profile = self.VerifyWinProfile(
-                    "nt/GUID/%s" % rsds.GUID_AGE)
+            return "Win", "nt/GUID/%s" % rsds.GUID_AGE
+
+        guess = address_space.read(hit-100, 300)
+        m = self.DARWIN_TEMPLATE.search(guess)
+        if m:
+            version = PROFILE_STRINGS.get(m.group(1), "")
+            return "Darwin", "OSX/%s_AMD" % version
+
+        m = self.LINUX_TEMPLATE.search(guess)
+        if m:
+            # Try to guess the distribution.
+            distribution = "LinuxGeneric"
+            if "Ubuntu" in guess:
+                distribution = "Ubuntu"
+
+            return "Linux", "%s/%s" % (distribution, m.group(1))
+
+    def CandidateWindows(self):
+        """Yields lists of candidates, ranked by how likely they are.
+
+        Each candidate is a (kind, profile name) tuple, and is only yielded
+        once. The image is scanned one window of RANKING_WINDOW bytes at a time,
+        and the candidates found in each window are yielded as soon as the scan
+        has passed it. They are ranked by the number of times they were seen
+        (the running kernel usually appears many times), then by where they
+        were first seen.
+        """
+        pe_profile = self.session.LoadProfile("pe")
+        scanner = ProfileScanner(
+            address_space=self.session.physical_address_space,
+            session=self.session)
+        scanner.SHARD_SIZE = self.RANKING_WINDOW
+
+        seen = set()
+        for offset, length in scanner.shards(0, 2**64):
+            window = {}
+            for hit in scanner.scan(offset=offset, maxlen=length):
+                candidate = self.ParseCandidate(hit, pe_profile)
+                if candidate is None or candidate in seen:
+                    continue
+
+                count, first_hit = window.get(candidate, (0, hit))
+                window[candidate] = (count + 1, first_hit)
+
+            if window:
+                seen.update(window)
+                yield self.RankCandidates(window)
+
+    def RankCandidates(self, window):
+        return [candidate for _, candidate in sorted(
+            ((-count, first_hit), candidate)
+            for candidate, (count, first_hit) in window.iteritems())]
+
+    def VerifyCandidates(self, candidates):
+        """Returns the first candidate (in order) which verifies.
+
+        Returns:
+          A (kind, profile name, dtb) tuple or None.
+        """
+        workers = min(self.session.GetParameter("autodetect_workers", 1),
+                      len(candidates))
+        image = scan.ImageAddressSpace(self.session.physical_address_space)
+
+        if workers <= 1 or image is None:
+            for kind, profile_name in candidates:
+                if self.VerifyProfile(kind, profile_name):
+                    return (kind, profile_name,
+                            int(self.session.GetParameter("dtb")))
 
-                if profile:
-                    logging.info(
-                        "Detected %s with GUID %s", rsds.Filename,
-                        rsds.GUID_AGE)
+            return
+
+        # Verify in worker processes. The results come back in the order of
+        # the candidates, and the remaining workers are killed as soon as one
+        # is found.
+        with scan.ForkPool(self, image, workers) as pool:
+            for (kind, profile_name), dtb in zip(
+                    candidates, pool.imap(_VerifyCandidate, candidates)):
+                if dtb is not None:
+                    return kind, profile_name, dtb
+
+    def Serialize(self, value):
+        dtb = self.session.GetParameter("dtb")
+        return dict(profile=value.name, dtb=dtb and int(dtb))
+
+    def Deserialize(self, data):
+        try:
+            profile = self.session.LoadProfile(data["profile"])
+        except ValueError:
+            return
 
-                    return profile
+        # Do not override a DTB the user specified.
+        if self.session.GetParameter("dtb") == None:
+            # The remembered profile must still work with this image.
+            kind = self.OS_KINDS.get(profile.metadata("os"))
+            if kind is None:
+                return
 
+            if data["dtb"]:
+                profile = self.ApplyDTB(
+                    kind, data["profile"], data["dtb"], verify=True)
             else:
-                guess = address_space.read(hit-100, 300)
-                m = self.DARWIN_TEMPLATE.search(guess)
-                if m:
-                    version = PROFILE_STRINGS.get(m.group(1), "")
-                    profile_name = "OSX/%s_AMD" % version
-                    profile = self.VerifyDarwinProfile(profile_name)
-                    if profile:
-                        logging.info(
-                            "Detected %s: %s", profile_name, m.group(0))
-
-                        return profile
-
-                m = self.LINUX_TEMPLATE.search(guess)
-                if m:
-                    # Try to guess the distribution.
-                    distribution = "LinuxGeneric"
-                    if "Ubuntu" in guess:
-                        distribution = "Ubuntu"
-
-                    profile_name = "%s/%s" % (distribution, m.group(1))
-                    profile = self.VerifyLinuxProfile(profile_name)
-                    if profile:
-                        logging.info(
-                            "Detected %s: %s", profile_name, m.group(0))
-
-                        return profile
+                profile = self.ApplyFindDTB(
+                    self.FIND_DTB_PLUGINS[kind], profile)
+
+            if profile is None:
+                logging.info("Remembered profile %s does not verify.",
+                             data["profile"])
+                return
+
+        logging.info("Using remembered profile %s", profile.name)
+        return profile
 
+    def ScanProfiles(self):
+        for candidates in self.CandidateWindows():
+            result = self.VerifyCandidates(candidates)
+            if result is None:
+                continue
+
+            kind, profile_name, dtb = result
+            logging.info("Detected %s", profile_name)
+
+            # Workers only return the DTB, so apply the winner here.
+            profile = self.session.profile
+            if (profile is None or self.session.kernel_address_space is None or
+                    self.session.kernel_address_space.dtb != dtb):
+                profile = self.ApplyDTB(kind, profile_name, dtb)
+
+            return profile
 
     def calculate(self):
         """Try to find the correct profile by scanning for PDB files."""
@@ -0,0 +1,178 @@
+import struct
+import tempfile
+import unittest
+
+from rekall import addrspace
+from rekall import obj
+from rekall import session
+from rekall import testlib
+from rekall.plugins import guess_profile
+from rekall.plugins.addrspaces import standard
+from rekall.plugins.overlays.windows import pe_vtypes
+
+
+class FakeProfile(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class ProfileHook(guess_profile.ProfileHook):
+    """Remembers the hits parsed, and verifies profiles from a dict."""
+
+    # Maps the profile names which verify to their DTB.
+    DTBS = {"b": 0x1000, "c": 0x2000}
+
+    def __init__(self, session=None):
+        super(ProfileHook, self).__init__(session)
+        self.parsed_hits = []
+        self.verified = []
+
+    def ParseCandidate(self, hit, pe_profile):
+        self.parsed_hits.append(hit)
+        return super(ProfileHook, self).ParseCandidate(hit, pe_profile)
+
+    def VerifyProfile(self, kind, profile_name):
+        self.verified.append(profile_name)
+        if profile_name in self.DTBS:
+            self.session.SetParameter("dtb", self.DTBS[profile_name])
+            return FakeProfile(profile_name)
+
+
+class CandidateTest(unittest.TestCase):
+    """Test finding and ranking candidate profiles."""
+
+    WINDOW = 0x4000
+
+    def setUp(self):
+        self.session = session.Session()
+
+        # The vtypes which normally come from the profile repository.
+        pe_profile = pe_vtypes.PEProfile(session=self.session)
+        pe_profile.add_types({
+            "CV_RSDS_HEADER": [0x40, {}],
+            "_GUID": [16, {
+                "Data1": [0, ["unsigned long"]],
+                "Data2": [4, ["unsigned short"]],
+                "Data3": [6, ["unsigned short"]],
+                }],
+            })
+
+        self.session.profile_cache["pe"] = pe_profile
+        self.hook = ProfileHook(session=self.session)
+        self.hook.RANKING_WINDOW = self.WINDOW
+
+    def Linux(self, version):
+        return "Linux", "LinuxGeneric/%s-generic" % version
+
+    def testRankCandidates(self):
+        self.assertEqual(self.hook.RankCandidates({
+            "a": (1, 0x100), "b": (3, 0x500), "c": (1, 0x50),
+            "d": (3, 0x400)}), ["d", "b", "c", "a"])
+
+    def testCandidateWindows(self):
+        memory = bytearray(0x10000)
+        linux = "Linux version %s-generic (buildd@farm) "
+        for offset, version in [
+                (0x100, "3.2.0-1"), (0x1000, "3.2.0-2"), (0x2000, "3.2.0-2"),
+                # Crosses into the next window, but starts in this one.
+                (0x3ff8, "3.2.0-4"),
+                (0x4100, "3.2.0-1"), (0x5000, "3.2.0-3"), (0x6000, "3.2.0-4"),
+                (0xe000, "3.2.0-1")]:
+            memory[offset:offset + 50] = linux % version
+
+        struct.pack_into("<4s16sI13s", memory, 0x3000, "RSDS", "\x01" * 16,
+                         2, "ntkrnlmp.pdb\x00")
+
+        self.session.physical_address_space = addrspace.BufferAddressSpace(
+            session=self.session, data=str(memory))
+
+        rsds = self.session.profile_cache["pe"].CV_RSDS_HEADER(
+            offset=0x3000, vm=self.session.physical_address_space)
+        windows = self.hook.CandidateWindows()
+
+        # The first window is ranked as soon as the scan passes it.
+        self.assertEqual(windows.next(), [
+            self.Linux("3.2.0-2"), self.Linux("3.2.0-1"),
+            ("Win", "nt/GUID/%s" % rsds.GUID_AGE), self.Linux("3.2.0-4")])
+        self.assertEqual(self.hook.parsed_hits,
+                         [0x100, 0x1000, 0x2000, 0x3000, 0x3ff8])
+
+        # Candidates which were already seen are not repeated, and windows
+        # without new candidates are not yielded.
+        self.assertEqual(list(windows), [[self.Linux("3.2.0-3")]])
+
+    def testVerifyCandidates(self):
+        candidates = [("Linux", "a"), ("Linux", "c"), ("Linux", "b")]
+
+        self.session.physical_address_space = addrspace.BufferAddressSpace(
+            session=self.session, data="\x00" * 0x1000)
+        self.session.SetParameter("autodetect_workers", 3)
+
+        # Without an image file, profiles are verified in order.
+        self.assertEqual(self.hook.VerifyCandidates(candidates),
+                         ("Linux", "c", 0x2000))
+        self.assertEqual(self.hook.verified, ["a", "c"])
+        self.assertEqual(self.hook.VerifyCandidates(candidates[:1]), None)
+
+        # Workers return the first candidate which verifies too.
+        with tempfile.NamedTemporaryFile() as fd:
+            fd.write("\x00" * 0x1000)
+            fd.flush()
+
+            self.session.physical_address_space = (
+                standard.FileAddressSpace(
+                    filename=fd.name, session=self.session))
+
+            self.hook.verified = []
+            self.assertEqual(self.hook.VerifyCandidates(candidates),
+                             ("Linux", "c", 0x2000))
+            self.assertEqual(self.hook.VerifyCandidates(
+                [("Linux", "a"), ("Linux", "d")]), None)
+
+            # Verification happened in the workers.
+            self.assertEqual(self.hook.verified, [])
+
+
+class RememberedProfileTest(unittest.TestCase):
+    """Test using the profile remembered from an earlier session."""
+
+    def setUp(self):
+        self.tables = testlib.SyntheticPageTables("amd64")
+        self.tables.map(0xfffff80000001000, 0x5000)
+        self.tables._write_entry(self.tables.dtb + 0x1ed * 8,
+                                 self.tables.dtb | 3)
+
+    def Deserialize(self, dtb, os_name="windows", user_dtb=None):
+        test_session = session.Session()
+        test_session.physical_address_space = self.tables.address_space(
+            test_session)
+        test_session.profile_cache["test/win"] = obj.Profile(
+            name="test/win", session=test_session,
+            metadata=dict(os=os_name, arch="AMD64"))
+
+        if user_dtb:
+            test_session.SetParameter("dtb", user_dtb)
+
+        profile = guess_profile.ProfileHook(test_session).Deserialize(
+            dict(profile="test/win", dtb=dtb))
+
+        return profile, test_session.GetParameter("dtb")
+
+    def testDeserialize(self):
+        profile, dtb = self.Deserialize(self.tables.dtb)
+        self.assertEqual(profile.name, "test/win")
+        self.assertEqual(dtb, self.tables.dtb)
+
+        # The remembered DTB must still verify with the profile.
+        self.assertEqual(self.Deserialize(self.tables.dtb + 0x1000)[0], None)
+        self.assertEqual(self.Deserialize(self.tables.dtb, os_name="unknown")[0],
+                         None)
+
+        # A DTB given by the user is trusted.
+        profile, dtb = self.Deserialize(self.tables.dtb, user_dtb=0x1234000)
+        self.assertEqual(profile.name, "test/win")
+        self.assertEqual(dtb, 0x1234000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,11 @@
 """Implements scanners and plugins to find hypervisors in memory."""
 
+from rekall import addrspace
 from rekall import config
 from rekall import plugin
 from rekall import scan
 from rekall import session
 from rekall.plugins.addrspaces import amd64
-from rekall.plugins.addrspaces import intel
 from rekall.plugins.overlays import basic
 
 from itertools import groupby
@@ -246,7 +246,8 @@ class VirtualMachine(object):
         else:
             base_as = self.base_session.physical_address_space
 
-        return amd64.VTxPagedMemory(
+        as_class = addrspace.BaseAddressSpace.classes["VTxPagedMemory"]
+        return as_class(
             session=self.base_session, ept=self.ept_list, base=base_as)
 
 
@@ -315,15 +316,19 @@ class VirtualMachine(object):
 
         if not cr4 & (1 << 5):  # PAE bit
             # No PAE
-            address_space = intel.IA32PagedMemory(dtb=cr3, base=base_as)
+            as_class = addrspace.BaseAddressSpace.classes["IA32PagedMemory"]
+            address_space = as_class(dtb=cr3, base=base_as)
 
         elif not controls & (1 << 9):  # long mode bit
             # PAE and no long mode = 32bit PAE
-            address_space = intel.IA32PagedMemoryPae(dtb=cr3, base=base_as)
+            as_class = addrspace.BaseAddressSpace.classes[
+                "IA32PagedMemoryPae"]
+            address_space = as_class(dtb=cr3, base=base_as)
 
         elif controls & (1 << 9):  # long mode bit
             # Long mode AND PAE = IA-32e
-            address_space = amd64.AMD64PagedMemory(dtb=cr3, base=base_as)
+            as_class = addrspace.BaseAddressSpace.classes["AMD64PagedMemory"]
+            address_space = as_class(dtb=cr3, base=base_as)
         return address_space
 
     def add_vmcs(self, vmcs, validate=True):
@@ -90,9 +90,11 @@ class LinuxFindKASLR(AbstractLinuxCommandPlugin):
             renderer.table_row(vm_kernel_slide)
 
 
-class KASLRHook(kb.ParameterHook):
+class KASLRHook(kb.ProfileSpecificHookMixin, kb.ParameterHook):
     name = "kaslr_shift"
 
+    persistent = True
+
     def calculate(self):
         find_kaslr = LinuxFindKASLR(session=self.session,
                                     profile=self.session.profile)
@@ -144,6 +146,13 @@ class LinuxFindDTB(AbstractLinuxCommandPlugin, core.FindDTB):
             yield (self.profile.get_constant("init_level4_pgt", True) -
                    PAGE_OFFSET)
 
+        # Any DTB which maps the kernel text will do.
+        if self.session.GetParameter("scan_for_dtb"):
+            kernel_text = self.profile.get_constant("_text", False)
+            for dtb in self.scan_for_dtbs(
+                    kernel_text, paddr=kernel_text - PAGE_OFFSET):
+                yield dtb
+
     def render(self, renderer):
         renderer.table_header([("DTB", "dtv", "[addrpad]"),
                                ("Valid", "valid", "")])
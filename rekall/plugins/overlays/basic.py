@@ -382,7 +382,7 @@ class ListMixIn(object):
 
         return item
 
-    def find_all_lists(self, seen):
+    def find_all_lists(self, seen=None):
         """Follows all the list entries starting from lst.
 
         We basically convert the list to a tree and recursively search it for
@@ -394,28 +394,38 @@ class ListMixIn(object):
 
         Reference:
         http://en.wikipedia.org/wiki/Depth-first_search
+
+        Args:
+          seen: An optional set of offsets already visited. It is updated as
+            the list is walked.
+
+        Yields:
+          Each list entry as it is found.
         """
+        if seen is None:
+            seen = set()
+
         stack = [self]
         while stack:
             item = stack.pop()
-            if item not in seen:
-                seen.append(item)
+            if item.obj_offset in seen:
+                continue
 
-                Blink = item.m(self._backward).dereference()
-                if Blink.is_valid():
-                    stack.append(Blink)
+            seen.add(item.obj_offset)
+            yield item
 
-                Flink = item.m(self._forward).dereference()
-                if Flink.is_valid():
-                    stack.append(Flink)
+            Blink = item.m(self._backward).dereference()
+            if Blink.is_valid():
+                stack.append(Blink)
 
-    def list_of_type(self, type, member):
-        result = []
-        self.find_all_lists(result)
+            Flink = item.m(self._forward).dereference()
+            if Flink.is_valid():
+                stack.append(Flink)
 
+    def list_of_type(self, type, member):
         # We traverse all the _LIST_ENTRYs we can find, and cast them all back
         # to the required member.
-        for lst in result:
+        for lst in self.find_all_lists():
             # Skip ourselves in this (list_of_type is usually invoked on a list
             # head).
             if lst.obj_offset == self.obj_offset:
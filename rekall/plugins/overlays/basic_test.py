@@ -0,0 +1,115 @@
+import struct
+import unittest
+
+from rekall import addrspace
+from rekall import obj
+from rekall import session
+from rekall.plugins.overlays import basic
+
+
+class ListTestProfile(obj.Profile.classes['Profile32Bits']):
+    """A doubly linked list of items."""
+
+    @classmethod
+    def Initialize(cls, profile):
+        super(ListTestProfile, cls).Initialize(profile)
+        profile.add_types({
+            '_LIST_ENTRY': [0x8, {
+                'Flink': [0x0, ['Pointer', dict(target='_LIST_ENTRY')]],
+                'Blink': [0x4, ['Pointer', dict(target='_LIST_ENTRY')]],
+                }],
+            '_ITEM': [0xc, {
+                'Value': [0x0, ['unsigned int']],
+                'Links': [0x4, ['_LIST_ENTRY']],
+                }],
+            })
+
+        profile.add_classes(_LIST_ENTRY=basic._LIST_ENTRY)
+
+
+class ListMixInTest(unittest.TestCase):
+    """Test walking lists with ListMixIn."""
+
+    # Null pointers fall outside the address space.
+    BASE = 0x1000
+    HEAD = 0x1010
+
+    def setUp(self):
+        self.session = session.Session()
+        self.profile = ListTestProfile(session=self.session)
+        self.memory = bytearray(0x1000)
+
+    def Item(self, number):
+        """The offset of the item with this number."""
+        return self.BASE + 0x100 * number
+
+    def Entry(self, number):
+        """The offset of the links in the item with this number."""
+        return self.Item(number) + 4
+
+    def WriteEntry(self, offset, flink, blink):
+        struct.pack_into("<II", self.memory, offset - self.BASE, flink, blink)
+
+    def WriteItems(self, *numbers):
+        for number in numbers:
+            struct.pack_into("<I", self.memory, self.Item(number) - self.BASE,
+                             number)
+
+    def Head(self):
+        address_space = addrspace.BufferAddressSpace(
+            session=self.session, data=str(self.memory),
+            base_offset=self.BASE)
+
+        return self.profile._LIST_ENTRY(self.HEAD, vm=address_space)
+
+    def FindAllLists(self):
+        return sorted(x.obj_offset for x in self.Head().find_all_lists())
+
+    def testCycle(self):
+        self.WriteEntry(self.HEAD, self.Entry(1), self.Entry(2))
+        self.WriteEntry(self.Entry(1), self.Entry(2), self.HEAD)
+        self.WriteEntry(self.Entry(2), self.HEAD, self.Entry(1))
+
+        self.assertEqual(self.FindAllLists(),
+                         [self.HEAD, self.Entry(1), self.Entry(2)])
+
+    def testBlinkOnly(self):
+        # The second entry is not reachable by following Flink.
+        self.WriteEntry(self.HEAD, self.Entry(1), self.Entry(2))
+        self.WriteEntry(self.Entry(1), self.HEAD, self.HEAD)
+        self.WriteEntry(self.Entry(2), self.HEAD, self.Entry(1))
+
+        self.assertEqual(self.FindAllLists(),
+                         [self.HEAD, self.Entry(1), self.Entry(2)])
+
+    def testBrokenFlink(self):
+        # The first entry's Flink is smeared, the rest of the list is found
+        # through the Blinks.
+        self.WriteEntry(self.HEAD, self.Entry(1), self.Entry(3))
+        self.WriteEntry(self.Entry(1), 0xdead0000, self.HEAD)
+        self.WriteEntry(self.Entry(2), self.Entry(3), self.Entry(1))
+        self.WriteEntry(self.Entry(3), self.HEAD, self.Entry(2))
+
+        self.assertEqual(
+            self.FindAllLists(),
+            [self.HEAD, self.Entry(1), self.Entry(2), self.Entry(3)])
+
+    def testListOfTypeIsLazy(self):
+        self.WriteItems(1, 2, 3)
+        self.WriteEntry(self.HEAD, self.Entry(1), self.Entry(3))
+        self.WriteEntry(self.Entry(1), self.Entry(2), self.HEAD)
+        self.WriteEntry(self.Entry(2), self.Entry(3), self.Entry(1))
+        self.WriteEntry(self.Entry(3), self.HEAD, self.Entry(2))
+
+        head = self.Head()
+        items = head.list_of_type("_ITEM", "Links")
+        self.assertEqual(next(items).Value, 1)
+
+        # The rest of the list is only read as it is walked, so the second
+        # item, which is only linked from the first, is no longer found.
+        head.obj_vm.assign_buffer("\x00" * 0x1000, base_offset=self.BASE)
+        self.assertEqual([x.obj_offset for x in items], [self.Item(3)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -20,9 +20,9 @@ __author__ = "Michael Cohen <scudette@gmail.com>"
 
 import logging
 
+from rekall import addrspace
 from rekall import obj
 from rekall import utils
-from rekall.plugins.addrspaces import amd64
 from rekall.plugins.overlays import basic
 from rekall.plugins.darwin import entities
 from rekall.plugins.darwin import generators
@@ -485,28 +485,26 @@ class LIST_ENTRY(obj.Struct):
     def find_all_lists(self, type, member, seen=None):
         """Follows all the list entries starting from lst.
 
-        We basically convert the list to a tree and recursively search it for
-        new nodes. From each node we follow the Flink and then the Blink. When
-        we see a node we already have, we backtrack.
+        We follow the le_next pointers from each entry until we reach an
+        invalid entry or one we have already seen.
+
+        Args:
+          seen: An optional set of offsets already visited. It is updated as
+            the list is walked.
+
+        Yields:
+          Each list entry as it is found.
         """
         if seen is None:
             seen = set()
 
-        if not self.is_valid():
-            return seen
-
-        elif self in seen:
-            return seen
-
-        seen.add(self)
-
-        Flink = self._GetNextEntry(type, member)
-        Flink.find_all_lists(type, member, seen=seen)
-
-        # Blink = self._GetPreviousEntry()
-        # Blink.find_all_lists(type, member, seen=seen)
+        item = self
+        while item.is_valid() and item.obj_offset not in seen:
+            seen.add(item.obj_offset)
+            yield item
 
-        return seen
+            # The list is only followed forwards.
+            item = item._GetNextEntry(type, member)
 
     def list_of_type(self, type, member=None, include_current=True):
         # We sort here to ensure we have stable ordering as the output of this
@@ -1026,7 +1024,7 @@ class proc(obj.Struct):
         cr3 = self.task.map.pmap.pm_cr3
         as_class = self.obj_vm.__class__
         if self.task.map.pmap.pm_task_map == "TASK_MAP_64BIT_SHARED":
-            as_class = amd64.AMD64PagedMemory
+            as_class = addrspace.BaseAddressSpace.classes["AMD64PagedMemory"]
 
         return as_class(base=self.obj_vm.base, session=self.obj_vm.session,
                         dtb=cr3, name="Pid %s" % self.p_pid)
@@ -0,0 +1,63 @@
+import struct
+import unittest
+
+from rekall import addrspace
+from rekall import obj
+from rekall import session
+from rekall.plugins.overlays.darwin import darwin
+
+
+class ProcListTestProfile(obj.Profile.classes['Profile32Bits']):
+    """Just enough of struct proc to walk p_list."""
+
+    @classmethod
+    def Initialize(cls, profile):
+        super(ProcListTestProfile, cls).Initialize(profile)
+        profile.add_types({
+            'LIST_ENTRY': [0x8, {
+                'le_next': [0x0, ['Pointer']],
+                'le_prev': [0x4, ['Pointer', dict(target='Pointer')]],
+                }],
+            'proc': [0x10, {
+                'p_pid': [0x0, ['unsigned int']],
+                'p_list': [0x4, ['LIST_ENTRY']],
+                }],
+            })
+
+        profile.add_classes(LIST_ENTRY=darwin.LIST_ENTRY)
+
+
+class LIST_ENTRYTest(unittest.TestCase):
+    """Test walking a Darwin LIST_ENTRY."""
+
+    # Null pointers fall outside the address space.
+    BASE = 0x1000
+    COUNT = 5000
+
+    def testLongList(self):
+        # Every proc's le_prev points at the le_next of the one before it,
+        # the first one's at the list head. The last one links back to the
+        # first.
+        memory = bytearray(0x10 * (self.COUNT + 1))
+        for i in range(self.COUNT):
+            offset = 0x10 * (i + 1)
+            le_next = self.BASE + offset + 0x10
+            if i + 1 == self.COUNT:
+                le_next = self.BASE + 0x10
+
+            struct.pack_into("<III", memory, offset, i, le_next,
+                             self.BASE + offset - 0xc)
+
+        test_session = session.Session()
+        address_space = addrspace.BufferAddressSpace(
+            session=test_session, data=str(memory), base_offset=self.BASE)
+        profile = ProcListTestProfile(session=test_session)
+        first = profile.proc(self.BASE + 0x10, vm=address_space)
+
+        self.assertEqual(
+            [x.p_pid.v() for x in first.p_list.list_of_type("proc", "p_list")],
+            range(self.COUNT))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -753,43 +753,119 @@ class _HANDLE_TABLE(obj.Struct):
     tables, such as the _KDDEBUGGER_DATA64.PspCidTable.
     """
 
-    def get_item(self, entry):
+    # Each level of the table is a page of entries or of pointers to the
+    # tables of the next level.
+    TABLE_PAGE_SIZE = 0x1000
+
+    def get_object_header_offset(self, pointer):
+        """Returns the address of the _OBJECT_HEADER an entry points to."""
+        return pointer & ~self.obj_profile.constants['MAX_FAST_REF']
+
+    def get_item(self, entry_offset, header_offset):
         """Returns the OBJECT_HEADER of the associated handle. The parent
         is the _HANDLE_TABLE_ENTRY so that an object can be linked to its
         GrantedAccess.
         """
-        return entry.Object.dereference_as("_OBJECT_HEADER", parent=entry)
+        entry = self.obj_profile._HANDLE_TABLE_ENTRY(
+            offset=entry_offset, vm=self.obj_vm, parent=self)
+
+        return self.obj_profile._OBJECT_HEADER(
+            offset=header_offset, vm=self.obj_vm, parent=entry)
+
+    def _decode_table(self, table_offset, level, first_index, layout):
+        """Decodes a page of the table (and the tables below it).
 
-    def _make_handle_array(self, table_offset, level):
-        """ Returns an array of _HANDLE_TABLE_ENTRY rooted at offset,
-        and iterates over them.
+        Yields:
+          (entry index, object pointer, entry offset) for used entries.
         """
+        pointer_format, entry_size, object_index, span = layout
+        data = self.obj_vm.read(table_offset, self.TABLE_PAGE_SIZE)
+        pointer_size = struct.calcsize(pointer_format)
+        values = struct.unpack(
+            "<%d%s" % (len(data) / pointer_size, pointer_format), data)
+
         # level == 0 means we are at the bottom level and this is a table of
         # _HANDLE_TABLE_ENTRY, otherwise, it means we are a table of pointers to
         # lower tables.
         if level == 0:
-            target = "_HANDLE_TABLE_ENTRY"
-            table = self.obj_profile.Array(
-                offset=table_offset, target=target,
-                count=0x1000/self.obj_profile.get_obj_size(target),
-                parent=self)
+            stride = entry_size / pointer_size
+            for i, pointer in enumerate(values[object_index::stride]):
+                if pointer:
+                    yield (first_index + i, pointer,
+                           table_offset + i * entry_size)
 
-            for entry in table:
-                yield self.get_item(entry)
+            return
 
-        else:
-            target = "Pointer"
-            table = self.obj_profile.Array(
-                offset=table_offset,
-                target=target,
-                count=0x1000/self.obj_profile.get_obj_size(target),
-                parent=self)
-
-            for entry in table:
-                for item in self._make_handle_array(entry, level-1):
+        # The number of entries covered by each table in the next level.
+        entries = span[level - 1]
+        for i, pointer in enumerate(values):
+            if pointer:
+                for item in self._decode_table(
+                        pointer, level - 1, first_index + i * entries, layout):
                     yield item
 
-    def handles(self):
+    def decode_entries(self):
+        """Yields (handle value, object pointer, entry offset) for all entries.
+
+        Each page of the table is read only once, and entries are decoded from
+        the raw data without instantiating any objects.
+        """
+        # This should work equally for 32 and 64 bit systems
+        LEVEL_MASK = 7
+
+        profile = self.obj_profile
+        pointer_size = profile.get_obj_size("address")
+        entry_size = profile.get_obj_size("_HANDLE_TABLE_ENTRY")
+        entries_per_page = self.TABLE_PAGE_SIZE / entry_size
+        pointers_per_page = self.TABLE_PAGE_SIZE / pointer_size
+
+        layout = (
+            pointer_size == 8 and "Q" or "I",
+            entry_size,
+            profile.get_obj_offset(
+                "_HANDLE_TABLE_ENTRY", "Object") / pointer_size,
+            [entries_per_page * pointers_per_page ** level
+             for level in range(LEVEL_MASK + 1)])
+
+        table_code = int(self.TableCode)
+        for index, pointer, entry_offset in self._decode_table(
+                table_code & ~LEVEL_MASK, table_code & LEVEL_MASK, 0, layout):
+            yield index * 4, pointer, entry_offset
+
+    def _get_object_type(self, header_offset, type_names):
+        """Reads the type of the object header from its raw data.
+
+        Returns:
+          A (type value, type name) tuple. The type value is the TypeIndex (for
+          newer windows versions) or the Type pointer, and is 0 if the header
+          is not valid. type_names caches the names of the type values seen.
+        """
+        profile = self.obj_profile
+        if profile.obj_has_member("_OBJECT_HEADER", "TypeIndex"):
+            data = self.obj_vm.read(header_offset + profile.get_obj_offset(
+                "_OBJECT_HEADER", "TypeIndex"), 1)
+            type_value = ord(data[:1] or "\x00")
+            if type_value and type_value not in type_names:
+                type_names[type_value] = self.obj_session.GetParameter(
+                    "ObjectTypeMap")[type_value].Name.v()
+
+        else:
+            pointer_size = profile.get_obj_size("address")
+            data = self.obj_vm.read(header_offset + profile.get_obj_offset(
+                "_OBJECT_HEADER", "Type"), pointer_size)
+            type_value = struct.unpack(
+                pointer_size == 8 and "<Q" or "<I", data)[0]
+            if type_value not in type_names:
+                type_names[type_value] = profile._OBJECT_TYPE(
+                    offset=type_value, vm=self.obj_vm).Name.v()
+
+            # Objects without a type name are not valid.
+            if not type_names[type_value]:
+                type_value = 0
+
+        return type_value, type_names.get(type_value)
+
+    def handles(self, object_types=None):
         """ A generator which yields this process's handles
 
         _HANDLE_TABLE tables are multi-level tables at the first level
@@ -801,36 +877,43 @@ class _HANDLE_TABLE(obj.Struct):
         yielding all handles. We take care of recursing into the
         nested tables automatically.
 
+        Args:
+          object_types: If specified, only handles to objects of these types
+            (e.g. ["Process", "File"]) are returned. Other handles are skipped
+            without instantiating their objects.
+
         Reference:
         http://forum.sysinternals.com/hiding-a-process-pspcidtable_topic15362.html
         """
-        # This should work equally for 32 and 64 bit systems
-        LEVEL_MASK = 7
+        type_names = {}
+        for handle_value, pointer, entry_offset in self.decode_entries():
+            header_offset = self.get_object_header_offset(pointer)
+            type_value, type_name = self._get_object_type(
+                header_offset, type_names)
 
-        table = self.TableCode & ~LEVEL_MASK
-        level = self.TableCode & LEVEL_MASK
+            if not type_value:
+                continue
+
+            if object_types and type_name not in object_types:
+                continue
 
-        for i, handle in enumerate(self._make_handle_array(table, level)):
-            # New object header uses TypeIndex.
-            if handle.m("TypeIndex") > 0x0 or handle.m("Type").Name:
-                handle.HandleValue = i * 4
+            handle = self.get_item(entry_offset, header_offset)
+            handle.HandleValue = handle_value
 
-                yield handle
+            yield handle
 
 
 class _PSP_CID_TABLE(_HANDLE_TABLE):
     """Subclass the Windows handle table object for parsing PspCidTable"""
 
-    def get_item(self, entry):
-        p = self.obj_profile.Object("address", entry.Object.v(), self.obj_vm)
+    def get_object_header_offset(self, pointer):
+        # The entries point to the object body.
+        return (pointer & ~7) - self.obj_profile.get_obj_offset(
+            '_OBJECT_HEADER', 'Body')
 
-        handle = self.obj_profile.Object(
-            "_OBJECT_HEADER",
-            offset=(p & ~7) - self.obj_profile.get_obj_offset(
-                '_OBJECT_HEADER', 'Body'),
-            vm=self.obj_vm)
-
-        return handle
+    def get_item(self, entry_offset, header_offset):
+        return self.obj_profile.Object(
+            "_OBJECT_HEADER", offset=header_offset, vm=self.obj_vm)
 
 
 class _OBJECT_HEADER(obj.Struct):
@@ -1019,35 +1102,39 @@ class VadTraverser(obj.Struct):
         """ Traverse the VAD tree by generating all the left items,
         then the right items.
 
-        We try to be tolerant of cycles by storing all offsets visited.
+        We try to be tolerant of cycles by storing all offsets visited. The
+        tree is walked with an explicit stack so deep trees do not nest python
+        generators.
         """
-        if depth > 100:
-            raise RuntimeError("Vad tree too deep - something went wrong!")
-
         if visited == None:
             visited = set()
 
-        ## We try to prevent loops here
-        if self.obj_offset in visited:
-            return
+        stack = [(self, depth)]
+        while stack:
+            node, depth = stack.pop()
+            if depth > 100:
+                raise RuntimeError("Vad tree too deep - something went wrong!")
 
-        self.obj_context['depth'] = depth
+            ## We try to prevent loops here
+            if node.obj_offset in visited:
+                continue
 
-        # Find out which Vad type we need to be:
-        if self.Tag in self.tag_map:
-            yield self.cast(self.tag_map[self.Tag])
+            visited.add(node.obj_offset)
+            node.obj_context['depth'] = depth
 
-        # This tag is valid for the Root.
-        elif depth and self.Tag.v() != "\x00":
-            return
+            # Find out which Vad type we need to be:
+            if node.Tag in node.tag_map:
+                yield node.cast(node.tag_map[node.Tag])
 
-        for c in self.LeftChild.traverse(visited=visited, depth=depth+1):
-            visited.add(self.obj_offset)
-            yield c
+            # This tag is valid for the Root.
+            elif depth and node.Tag.v() != "\x00":
+                continue
 
-        for c in self.RightChild.traverse(visited=visited, depth=depth+1):
-            visited.add(self.obj_offset)
-            yield c
+            # The left subtree is generated before the right one.
+            for child in (node.RightChild, node.LeftChild):
+                child = child.dereference()
+                if child:
+                    stack.append((child, depth + 1))
 
 
 class _HEAP(obj.Struct):
@@ -0,0 +1,236 @@
+import struct
+import unittest
+
+from rekall import addrspace
+from rekall import obj
+from rekall import session
+
+# Import and register all the plugins.
+from rekall import plugins  # pylint: disable=unused-import
+from rekall.plugins.overlays import basic
+from rekall.plugins.overlays.windows import common
+from rekall.plugins.overlays.windows import win7
+
+
+class HandleTableTestProfile(obj.Profile.classes['Profile32Bits']):
+    """Just enough of the kernel structs to walk a (windows XP) handle table."""
+
+    @classmethod
+    def Initialize(cls, profile):
+        super(HandleTableTestProfile, cls).Initialize(profile)
+        profile.add_types({
+            '_HANDLE_TABLE': [0x10, {
+                'TableCode': [0x0, ['unsigned int']],
+                }],
+            '_PSP_CID_TABLE': [0x10, {
+                'TableCode': [0x0, ['unsigned int']],
+                }],
+            '_HANDLE_TABLE_ENTRY': [0x8, {
+                'Object': [0x0, ['_EX_FAST_REF']],
+                'GrantedAccess': [0x4, ['unsigned int']],
+                }],
+            '_EX_FAST_REF': [0x4, {
+                'Object': [0x0, ['Pointer']],
+                }],
+            '_OBJECT_HEADER': [0x20, {
+                'PointerCount': [0x0, ['unsigned int']],
+                'Type': [0x8, ['Pointer', dict(target='_OBJECT_TYPE')]],
+                'Body': [0x18, ['unsigned int']],
+                }],
+            '_OBJECT_TYPE': [0x40, {
+                'Name': [0x0, ['_UNICODE_STRING']],
+                }],
+            '_UNICODE_STRING': [0x8, {
+                'Length': [0x0, ['unsigned short']],
+                'Buffer': [0x4, ['Pointer', dict(
+                    target='UnicodeString',
+                    target_args=dict(length=lambda x: x.Length))]],
+                }],
+            })
+
+        profile.add_constants(default_text_encoding="utf-16-le")
+        profile.add_classes(
+            UnicodeString=basic.UnicodeString,
+            _UNICODE_STRING=common._UNICODE_STRING,
+            _EX_FAST_REF=common._EX_FAST_REF,
+            _HANDLE_TABLE=common._HANDLE_TABLE,
+            _PSP_CID_TABLE=common._PSP_CID_TABLE,
+            _OBJECT_HEADER=common._OBJECT_HEADER)
+
+
+class Win7HandleTableTestProfile(HandleTableTestProfile):
+    """Newer object headers have an index into the ObjectTypeMap."""
+
+    @classmethod
+    def Initialize(cls, profile):
+        super(Win7HandleTableTestProfile, cls).Initialize(profile)
+        profile.add_types({
+            '_OBJECT_HEADER': [0x20, {
+                'PointerCount': [0x0, ['unsigned int']],
+                'TypeIndex': [0xc, ['unsigned char']],
+                'InfoMask': [0xe, ['unsigned char']],
+                'Body': [0x18, ['unsigned int']],
+                }],
+            })
+        profile.add_classes(_OBJECT_HEADER=win7._OBJECT_HEADER)
+
+
+class HandleTableTest(unittest.TestCase):
+    """Test decoding a two level handle table."""
+
+    TABLE = 0x100
+    TOP_LEVEL = 0x1000
+    ENTRIES = [0x2000, 0, 0x3000]
+    OBJECT_TYPES = 0x8000
+    OBJECTS = 0x10000
+
+    # The objects in each table of entries: (index, type index).
+    HANDLES = [(1, 1), (2, 2), (7, 3), (300, 1), (511, 2)]
+    TYPE_NAMES = ["Process", "File", ""]
+
+    def setUp(self):
+        self.session = session.Session()
+        self.profile = Win7HandleTableTestProfile(session=self.session)
+        memory = bytearray(0x20000)
+
+        struct.pack_into("<I", memory, self.TABLE, self.TOP_LEVEL | 1)
+        for i, table in enumerate(self.ENTRIES):
+            struct.pack_into("<I", memory, self.TOP_LEVEL + i * 4, table)
+
+        # The type map (for TypeIndex) points to the same types.
+        for i, name in enumerate(self.TYPE_NAMES):
+            offset = self.OBJECT_TYPES + 0x100 * (i + 1)
+            name = name.encode("utf-16-le")
+            struct.pack_into("<HxxI", memory, offset, len(name), offset + 8)
+            memory[offset + 8:offset + 8 + len(name)] = name
+            struct.pack_into("<I", memory, self.OBJECT_TYPES + 4 * (i + 1),
+                             offset)
+
+        # The expected (handle value, header offset, type name).
+        self.expected = []
+        header = self.OBJECTS
+        for table_index, table in enumerate(self.ENTRIES):
+            if not table:
+                continue
+
+            for index, type_index in self.HANDLES:
+                name = self.TYPE_NAMES[type_index - 1]
+                struct.pack_into("<II", memory, table + index * 8,
+                                 header | 3, 0x1f0000 + index)
+
+                # Objects with no type name have no type index either.
+                struct.pack_into(
+                    "<IB", memory, header + 8,
+                    self.OBJECT_TYPES + 0x100 * type_index,
+                    name and type_index or 0)
+
+                if name:
+                    self.expected.append(
+                        ((table_index * 512 + index) * 4, header, name))
+
+                header += 0x20
+
+        self.kernel_as = addrspace.BufferAddressSpace(
+            session=self.session, data=str(memory))
+
+        self.session.SetParameter("ObjectTypeMap", self.profile.Array(
+            offset=self.OBJECT_TYPES, vm=self.kernel_as, target="Pointer",
+            target_args=dict(target="_OBJECT_TYPE")))
+
+    def GetHandles(self, profile=None, **kwargs):
+        table = (profile or self.profile)._HANDLE_TABLE(
+            offset=self.TABLE, vm=self.kernel_as)
+        return [(x.HandleValue, x.obj_offset, x.get_object_type(),
+                 x.GrantedAccess) for x in table.handles(**kwargs)]
+
+    def testHandles(self):
+        expected = [x + (0x1f0000 + (x[0] / 4) % 512,) for x in self.expected]
+
+        self.assertEqual(self.GetHandles(), expected)
+        self.assertEqual(self.GetHandles(object_types=["File"]),
+                         [x for x in expected if x[2] == "File"])
+
+        # Without a TypeIndex the Type pointer is used.
+        profile = HandleTableTestProfile(session=self.session)
+        self.assertTrue(self.profile.obj_has_member(
+            "_OBJECT_HEADER", "TypeIndex"))
+        self.assertFalse(profile.obj_has_member("_OBJECT_HEADER", "TypeIndex"))
+        self.assertEqual(self.GetHandles(profile=profile), expected)
+
+    def testPspCidTable(self):
+        table = self.profile._PSP_CID_TABLE(
+            offset=self.TABLE, vm=self.kernel_as)
+
+        # These entries point at the object bodies.
+        self.assertEqual(table.get_object_header_offset(0x10018 | 1), 0x10000)
+
+
+class VadTestProfile(obj.Profile.classes['Profile32Bits']):
+    """A VAD tree with just the members needed to traverse it."""
+
+    @classmethod
+    def Initialize(cls, profile):
+        super(VadTestProfile, cls).Initialize(profile)
+        vad = [0x10, {
+            'Tag': [0x0, ['String', dict(length=4)]],
+            'LeftChild': [0x4, ['Pointer', dict(target='_MMADDRESS_NODE')]],
+            'RightChild': [0x8, ['Pointer', dict(target='_MMADDRESS_NODE')]],
+            }]
+
+        profile.add_types(dict(
+            _MMADDRESS_NODE=vad, _MMVAD=vad, _MMVAD_SHORT=vad,
+            _MMVAD_LONG=vad))
+
+        profile.add_classes(
+            String=basic.String,
+            _MMADDRESS_NODE=common.VadTraverser,
+            _MMVAD=common.VadTraverser,
+            _MMVAD_SHORT=common.VadTraverser,
+            _MMVAD_LONG=common.VadTraverser)
+
+
+class VadTraverserTest(unittest.TestCase):
+    """Test walking the VAD tree."""
+
+    # offset: (tag, left, right). Address 0 is not mapped.
+    BASE = 0x1000
+    TREE = {
+        0x1100: ("\x00\x00\x00\x00", 0x1200, 0x1500),
+        0x1200: ("VadS", 0x1300, 0x1400),
+        0x1300: ("Vadl", 0, 0),
+        0x1400: ("Vad ", 0, 0),
+        0x1500: ("VadS", 0x1600, 0),
+
+        # A bad tag - this subtree is ignored.
+        0x1600: ("XXXX", 0x1700, 0),
+        0x1700: ("VadS", 0, 0),
+        }
+
+    def Traverse(self, tree):
+        memory = bytearray(0x1000)
+        for offset, (tag, left, right) in tree.items():
+            struct.pack_into("<4sII", memory, offset - self.BASE,
+                             tag, left, right)
+
+        profile = VadTestProfile(session=session.Session())
+        root = profile._MMADDRESS_NODE(
+            offset=0x1100, vm=addrspace.BufferAddressSpace(
+                session=profile.session, data=str(memory),
+                base_offset=self.BASE))
+
+        return [(x.obj_offset, x.obj_type, x.obj_context['depth'])
+                for x in root.traverse()]
+
+    def testTraverse(self):
+        expected = [(0x1200, "_MMVAD_SHORT", 1), (0x1300, "_MMVAD_LONG", 2),
+                    (0x1400, "_MMVAD", 2), (0x1500, "_MMVAD_SHORT", 1)]
+
+        self.assertEqual(self.Traverse(self.TREE), expected)
+
+        # A loop back to 0x1200 is only followed once.
+        tree = self.TREE.copy()
+        tree[0x1400] = ("Vad ", 0, 0x1200)
+        self.assertEqual(self.Traverse(tree), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -42,11 +42,30 @@ class ExportScanner(scan.BaseScanner):
 
 
 
-class KernelBaseHook(kb.ParameterHook):
+class KernelBaseHook(kb.ProfileSpecificHookMixin, kb.ParameterHook):
     """Finds the kernel base address."""
 
     name = "kernel_base"
 
+    persistent = True
+
+    def IsKernelImage(self, image_base):
+        """Checks for the kernel's PE header at image_base."""
+        address_space = self.session.kernel_address_space
+        if address_space.read(image_base, 2) != "MZ":
+            return False
+
+        helper = pe_vtypes.PE(address_space=address_space,
+                              session=self.session, image_base=image_base)
+
+        return (str(helper.RSDS.Filename) in
+                guess_profile.ProfileHook.KERNEL_NAMES)
+
+    def Deserialize(self, data):
+        kernel_base = super(KernelBaseHook, self).Deserialize(data)
+        if kernel_base is not None and self.IsKernelImage(kernel_base):
+            return kernel_base
+
     def calculate(self):
         address_space = self.session.kernel_address_space
         scanner = ExportScanner(session=self.session,
@@ -68,12 +87,7 @@ class KernelBaseHook(kb.ParameterHook):
             page = hit & 0xFFFFFFFFFFFFF000
             for _ in range(10):
                 if address_space.read(page, 2) == "MZ":
-                    helper = pe_vtypes.PE(
-                        address_space=address_space,
-                        session=self.session, image_base=page)
-                    if (str(helper.RSDS.Filename) in
-                        guess_profile.ProfileHook.KERNEL_NAMES):
-
+                    if self.IsKernelImage(page):
                         logging.info("Detected kernel base at 0x%X", page)
                         return page
                 else:
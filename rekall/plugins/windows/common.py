@@ -26,6 +26,7 @@
 
 import logging
 import re
+import struct
 
 from rekall import config
 from rekall import scan
@@ -37,6 +38,12 @@ from rekall import utils
 from rekall.plugins import core
 
 
+config.DeclareOption(
+    "--scan_workers", default=1, action=config.IntParser,
+    help="The number of worker processes pool scanners use to scan the image "
+    "in parallel.")
+
+
 # We require both a physical AS set and a valid profile for
 # AbstractWindowsCommandPlugins.
 
@@ -152,6 +159,45 @@ class WinFindDTB(AbstractWindowsCommandPlugin, core.FindDTB):
         self.session.SetParameter("idle_process", eprocess)
         return address_space
 
+    def VerifyDTB(self, dtb):
+        """Checks a kernel DTB without the process it was found in.
+
+        Windows maps the page tables into the kernel address space, so the top
+        level table refers to itself. With PAE the page directory mapping
+        0xC0000000 refers to all four page directories instead.
+        """
+        address_space = self.CreateAS(dtb)
+        if address_space is None:
+            return
+
+        if self.profile.metadata("pae"):
+            frames = self._ReadTableFrames(dtb & ~0x1F, 4)
+            if (frames and None not in frames and
+                    self._ReadTableFrames(frames[3], 4) == frames):
+                return address_space
+
+        elif dtb & 0xFFF == 0:
+            if dtb in self._ReadTableFrames(dtb, 0x1000 / self._EntrySize()):
+                return address_space
+
+    def _EntrySize(self):
+        if self.profile.metadata("pae") or (
+                self.profile.metadata("arch") == "AMD64"):
+            return 8
+
+        return 4
+
+    def _ReadTableFrames(self, table_addr, count):
+        """Returns the frames the present entries of a page table point to."""
+        size = self._EntrySize()
+        data = self.physical_address_space.read(table_addr, count * size)
+        if len(data) != count * size:
+            return []
+
+        return [entry & 0xFFFFFFFFFF000 if entry & 1 else None
+                for entry in struct.unpack(
+                    "<%d%s" % (count, "Q" if size == 8 else "I"), data)]
+
     def render(self, renderer):
         renderer.table_header(
             [("_EPROCESS (P)", "physical_eprocess", "[addrpad]"),
@@ -175,7 +221,7 @@ class PoolTagCheck(scan.StringCheck):
         super(PoolTagCheck, self).__init__(needle=tag, **kwargs)
 
         # The offset from the start of _POOL_HEADER to the tag.
-        self.tag_offset = self.profile.get_obj_offset(
+        self.tag_offset = self.needle_offset = self.profile.get_obj_offset(
             "_POOL_HEADER", "PoolTag")
 
     def skip(self, buffer_as, offset):
@@ -186,6 +232,11 @@ class PoolTagCheck(scan.StringCheck):
         return super(PoolTagCheck, self).check(
              buffer_as, offset + self.tag_offset)
 
+    def candidates(self, buffer_as, offset, end):
+        for hit in super(PoolTagCheck, self).candidates(
+            buffer_as, offset + self.tag_offset, end + self.tag_offset):
+            yield hit - self.tag_offset
+
 
 class MultiPoolTagCheck(scan.MultiStringFinderCheck):
     """This scanner checks for the occurrence of a pool tag.
@@ -196,7 +247,7 @@ class MultiPoolTagCheck(scan.MultiStringFinderCheck):
         super(MultiPoolTagCheck, self).__init__(needles=tags, **kwargs)
 
         # The offset from the start of _POOL_HEADER to the tag.
-        self.tag_offset = self.profile.get_obj_offset(
+        self.tag_offset = self.needle_offset = self.profile.get_obj_offset(
             "_POOL_HEADER", "PoolTag")
 
     def skip(self, buffer_as, offset):
@@ -207,6 +258,11 @@ class MultiPoolTagCheck(scan.MultiStringFinderCheck):
         return super(MultiPoolTagCheck, self).check(
              buffer_as, offset + self.tag_offset)
 
+    def candidates(self, buffer_as, offset, end):
+        for hit in super(MultiPoolTagCheck, self).candidates(
+            buffer_as, offset + self.tag_offset, end + self.tag_offset):
+            yield hit - self.tag_offset
+
 
 class CheckPoolSize(scan.ScannerCheck):
     """ Check pool block size """
@@ -259,19 +315,60 @@ class CheckPoolIndex(scan.ScannerCheck):
         return pool_hdr.PoolIndex == self.value
 
 
+def _ScanShard(scanner, shard):
+    """Returns the offsets of all the hits in the shard."""
+    offset, length = shard
+    return list(scan.BaseScanner.scan(scanner, offset=offset, maxlen=length))
+
+
 class PoolScanner(scan.BaseScanner):
-    """A scanner for pool allocations."""
+    """A scanner for pool allocations.
+
+    If the scan_workers parameter is larger than 1, the image is split into
+    shards which are scanned by that many worker processes in parallel. The
+    workers only return the offsets of the hits, which are turned into
+    objects here, in the same order as a serial scan.
+    """
 
     # These objects are allocated in the pool allocation.
     allocation = ['_POOL_HEADER']
 
+    def __init__(self, workers=None, **kwargs):
+        super(PoolScanner, self).__init__(**kwargs)
+        self.workers = workers
+
     def scan(self, offset=0, maxlen=None):
         """Yields instances of _POOL_HEADER which potentially match."""
 
         maxlen = maxlen or self.profile.get_constant("MaxPointer")
-        for hit in super(PoolScanner, self).scan(offset=offset, maxlen=maxlen):
+        workers = self.workers or self.session.GetParameter("scan_workers", 1)
+
+        if workers > 1 and self.image_address_space() is not None:
+            hits = self.parallel_scan(offset, maxlen, workers)
+        else:
+            hits = super(PoolScanner, self).scan(offset=offset, maxlen=maxlen)
+
+        for hit in hits:
             yield self.profile._POOL_HEADER(vm=self.address_space, offset=hit)
 
+    def parallel_scan(self, offset, maxlen, workers):
+        """Scans the shards in worker processes, yielding the hit offsets."""
+        # Build the constraints before forking so the workers inherit them.
+        if self.constraints is None:
+            self.build_constraints()
+
+        shards = list(self.shards(offset, offset + maxlen))
+        with scan.ForkPool(self, self.image_address_space(), workers) as pool:
+            # imap() returns the results in the order of the shards.
+            for (shard_offset, _), hits in zip(
+                    shards, pool.imap(_ScanShard, shards)):
+                self.session.report_progress(
+                    "Scanned 0x%08X with %s" % (
+                        shard_offset, self.__class__.__name__))
+
+                for hit in hits:
+                    yield hit
+
 
 class PoolScannerPlugin(plugin.KernelASMixin, AbstractWindowsCommandPlugin):
     """A base class for all pool scanner plugins."""
@@ -300,12 +397,103 @@ class PoolScannerPlugin(plugin.KernelASMixin, AbstractWindowsCommandPlugin):
         else:
             self.address_space = address_space or self.physical_address_space
 
+    def make_scanner(self):
+        """Returns the PoolScanner used by this plugin.
+
+        Plugins which implement this (and process_pool_hit()) can be run
+        together with other pool scanner plugins in a single pass over the image
+        using a PoolScannerGroup. Plugins which need several scanners (e.g.
+        netscan) override generate_hits() instead.
+        """
+        raise NotImplementedError()
+
+    def process_pool_hit(self, pool_obj):
+        """Converts a _POOL_HEADER found by our scanner into a result.
+
+        Returns:
+          The result to produce, or None if the hit should be discarded.
+        """
+        return pool_obj
+
+    def generate_hits(self):
+        """Generate possible hits."""
+        for pool_obj in self.make_scanner().scan():
+            result = self.process_pool_hit(pool_obj)
+            if result is not None:
+                yield result
+
+
+class PoolScannerGroup(scan.MultiStringScannerGroup):
+    """Runs the scanners of several pool scanner plugins in a single pass.
+
+    For example:
+
+    group = PoolScannerGroup(session=session, plugins=[
+        session.plugins.psscan(), session.plugins.filescan(),
+        session.plugins.mutantscan()])
 
-class KDBGHook(kb.ParameterHook):
+    for plugin_name, result in group.scan():
+        ...
+
+    Each result is exactly what the plugin's generate_hits() would produce.
+    Plugins must implement make_scanner() - others raise a PluginError.
+    """
+
+    def __init__(self, plugins=None, address_space=None, **kwargs):
+        """Create a new pool scanner group.
+
+        Args:
+          plugins: A list of PoolScannerPlugin instances.
+
+          address_space: The address space to scan. Defaults to the address
+            space of the first plugin.
+        """
+        self.plugins = dict((x.name, x) for x in plugins)
+        scanners = {}
+        for name, pool_plugin in self.plugins.items():
+            try:
+                scanners[name] = pool_plugin.make_scanner()
+            except NotImplementedError:
+                raise plugin.PluginError(
+                    "Plugin %s can not be run in a PoolScannerGroup." % name)
+
+        super(PoolScannerGroup, self).__init__(
+            address_space=address_space or plugins[0].address_space,
+            scanners=scanners, **kwargs)
+
+    def scan(self, offset=0, maxlen=None):
+        maxlen = maxlen or self.profile.get_constant("MaxPointer")
+        for name, hit in super(PoolScannerGroup, self).scan(
+            offset=offset, maxlen=maxlen):
+            pool_obj = self.scanners[name].profile._POOL_HEADER(
+                vm=self.address_space, offset=hit)
+
+            result = self.plugins[name].process_pool_hit(pool_obj)
+            if result is not None:
+                yield name, result
+
+
+class KDBGHook(kb.ProfileSpecificHookMixin, kb.ParameterHook):
     """A Hook to calculate the KDBG when needed."""
 
     name = "kdbg"
 
+    persistent = True
+
+    def Serialize(self, value):
+        return super(KDBGHook, self).Serialize(value.obj_offset)
+
+    def Deserialize(self, data):
+        offset = super(KDBGHook, self).Deserialize(data)
+        if offset is None:
+            return
+
+        kdbg = self.session.profile._KDDEBUGGER_DATA64(
+            offset=offset, vm=self.session.kernel_address_space)
+
+        if kdbg.Header.OwnerTag == "KDBG":
+            return kdbg
+
     def calculate(self):
         # Try to just get the KDBG address using the profile.
         kdbg = self.session.profile.get_constant_object(
@@ -330,7 +518,27 @@ class KDBGHook(kb.ParameterHook):
             return kdbg
 
 
-class PsActiveProcessHeadHook(kb.ParameterHook):
+class ListHeadHookMixin(kb.ProfileSpecificHookMixin):
+    """Remembers a list head hook's result by its offset."""
+
+    persistent = True
+
+    def Serialize(self, value):
+        return super(ListHeadHookMixin, self).Serialize(value.obj_offset)
+
+    def Deserialize(self, data):
+        offset = super(ListHeadHookMixin, self).Deserialize(data)
+        if offset is None:
+            return
+
+        head = self.session.profile._LIST_ENTRY(
+            offset=offset, vm=self.session.kernel_address_space)
+
+        if head.reflect():
+            return head
+
+
+class PsActiveProcessHeadHook(ListHeadHookMixin, kb.ParameterHook):
     """The PsActiveProcessHead is actually found in the profile symbols."""
 
     name = "PsActiveProcessHead"
@@ -351,7 +559,7 @@ class PsActiveProcessHeadHook(kb.ParameterHook):
             return kdbg.PsActiveProcessHead
 
 
-class PsLoadedModuleList(kb.ParameterHook):
+class PsLoadedModuleList(ListHeadHookMixin, kb.ParameterHook):
     """The PsLoadedModuleList is actually found in the profile symbols."""
 
     name = "PsLoadedModuleList"
@@ -573,10 +781,8 @@ class WinProcessFilter(WindowsCommandPlugin):
 
         for task in csrss_processes:
             # Gather the handles to process objects
-            for handle in task.ObjectTable.handles():
-                if handle.get_object_type() == "Process":
-                    process = handle.dereference_as("_EPROCESS")
-                    yield process
+            for handle in task.ObjectTable.handles(object_types=["Process"]):
+                yield handle.dereference_as("_EPROCESS")
 
     def list_from_pspcid(self, seen=None):
         """Enumerate processes by walking the PspCidTable"""
@@ -592,10 +798,8 @@ class WinProcessFilter(WindowsCommandPlugin):
             )
 
         # Walk the handle table
-        for handle in PspCidTable.handles():
-            if handle.get_object_type() == "Process":
-                process = handle.dereference_as("_EPROCESS")
-                yield process
+        for handle in PspCidTable.handles(object_types=["Process"]):
+            yield handle.dereference_as("_EPROCESS")
 
     def list_from_sessions(self, seen=None):
         """List processes using the SessionProcessLinks."""
@@ -609,25 +813,37 @@ class WinProcessFilter(WindowsCommandPlugin):
                 "_EPROCESS", "SessionProcessLinks"):
                 yield proc
 
+    @plugin.MemoizeResults()
+    def list_using_method(self, method, seen=None):
+        """Lists processes using a single method.
+
+        The results are memoized in the session so they are shared by all the
+        plugins which list processes.
+
+        Args:
+          method: The name of the method in METHODS.
+          seen: A frozenset of process offsets already known. Some methods use
+            these as a starting point, so it is passed positionally to be part
+            of the memoization key.
+        """
+        handler = dict(self.METHODS)[method]
+        return handler(self, seen=seen)
+
     def list_eprocess(self):
         """List processes using chosen methods."""
         # We actually keep the results from each method around in case we need
         # to find out later which process was revealed by which method.
-        self.cache = self.session.GetParameter("pslist_cache")
-        if not self.cache:
-            self.cache = {}
-            self.session.SetParameter("pslist_cache", self.cache)
+        self.cache = {}
 
         seen = set()
         for proc in self.list_from_eprocess():
             seen.add(proc.obj_offset)
 
-        for k, handler in self.METHODS:
+        for k, _ in self.METHODS:
             if k in self.methods:
-                if k not in self.cache:
-                    self.cache[k] = set()
-                    for proc in handler(self, seen=seen):
-                        self.cache[k].add(proc.obj_offset)
+                self.cache[k] = set(
+                    proc.obj_offset for proc in self.list_using_method(
+                        k, frozenset(seen)))
 
                 logging.debug("Listed %s processes using %s",
                               len(self.cache[k]), k)
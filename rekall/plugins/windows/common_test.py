@@ -0,0 +1,447 @@
+import struct
+import tempfile
+import unittest
+
+from rekall import addrspace
+from rekall import obj
+from rekall import plugin
+from rekall import session
+from rekall import testlib
+
+# Import and register all the plugins.
+from rekall import plugins  # pylint: disable=unused-import
+from rekall.plugins.addrspaces import standard
+from rekall.plugins.overlays import basic
+from rekall.plugins.overlays.windows import common as overlay
+from rekall.plugins.windows import common
+from rekall.plugins.windows import filescan
+from rekall.plugins.windows import modscan
+
+
+class PoolTestProfile(obj.Profile.classes['Profile32Bits']):
+    """Just enough to scan for pool allocations."""
+
+    @classmethod
+    def Initialize(cls, profile):
+        super(PoolTestProfile, cls).Initialize(profile)
+        profile.add_types({
+            '_POOL_HEADER': [0x8, {
+                'PreviousSize': [0x0, ['unsigned short']],
+                'BlockSize': [0x2, ['unsigned short']],
+                'PoolTag': [0x4, ['String', dict(length=4)]],
+                }],
+            })
+
+        profile.add_classes(String=basic.String,
+                            _POOL_HEADER=overlay._POOL_HEADER)
+
+
+class TagScanner(common.PoolScanner):
+    def __init__(self, tag=None, **kwargs):
+        super(TagScanner, self).__init__(**kwargs)
+        self.checks = [
+            ('PoolTagCheck', dict(tag=tag)),
+            ('CheckPoolSize', dict(min_size=0x20)),
+            ]
+
+
+class TagScannerPlugin(common.PoolScannerPlugin):
+    """Finds allocations with an even BlockSize."""
+    __abstract = True
+
+    tag = None
+
+    def make_scanner(self):
+        return TagScanner(tag=self.tag, profile=self.profile,
+                          session=self.session,
+                          address_space=self.address_space)
+
+    def process_pool_hit(self, pool_obj):
+        if pool_obj.BlockSize % 2 == 0:
+            return pool_obj.obj_offset, pool_obj.BlockSize.v()
+
+
+class ProcTagScanner(TagScannerPlugin):
+    __abstract = True
+    __name = "test_proc_scan"
+
+    tag = "Pro\xe3"
+
+
+class FileTagScanner(TagScannerPlugin):
+    __abstract = True
+    __name = "test_file_scan"
+
+    tag = "Fil\xe5"
+
+
+class OldStyleScanner(common.PoolScannerPlugin):
+    __abstract = True
+    __name = "test_old_scan"
+
+    def generate_hits(self):
+        return []
+
+
+class PoolScannerGroupTest(unittest.TestCase):
+    """Test running several pool scanner plugins in one pass."""
+
+    # (offset, tag, block size): Too small, odd and overlapping allocations.
+    ALLOCATIONS = [
+        (0x0, "Pro\xe3", 4), (0x40, "Fil\xe5", 2), (0x80, "Fil\xe5", 6),
+        (0x88, "Pro\xe3", 8), (0x100, "Pro\xe3", 5), (0x1ff8, "Fil\xe5", 4),
+        (0x2000, "Fil\xe5", 4), (0x3ff8, "Pro\xe3", 4),
+        ]
+
+    def setUp(self):
+        self.session = session.Session()
+        self.profile = PoolTestProfile(session=self.session)
+
+        memory = bytearray(0x4000)
+        for offset, tag, block_size in self.ALLOCATIONS:
+            struct.pack_into("<HH4s", memory, offset, 0, block_size, tag)
+
+        self.address_space = addrspace.BufferAddressSpace(
+            session=self.session, data=str(memory))
+
+    def MakePlugin(self, cls):
+        return cls(session=self.session, profile=self.profile,
+                   address_space=self.address_space,
+                   kernel_address_space=self.address_space,
+                   physical_address_space=self.address_space)
+
+    def testGroup(self):
+        scanners = [self.MakePlugin(ProcTagScanner),
+                    self.MakePlugin(FileTagScanner)]
+
+        group = common.PoolScannerGroup(
+            session=self.session, profile=self.profile, plugins=scanners)
+
+        results = {}
+        hits = list(group.scan(maxlen=0x4000))
+        for name, result in hits:
+            results.setdefault(name, []).append(result)
+
+        # The results of the group come out in order.
+        self.assertEqual(sorted(hits, key=lambda x: x[1]), hits)
+
+        for scanner in scanners:
+            self.assertEqual(results[scanner.name],
+                             list(scanner.generate_hits()))
+
+        self.assertEqual(results, {
+            "test_proc_scan": [(0x0, 4), (0x88, 8), (0x3ff8, 4)],
+            "test_file_scan": [(0x80, 6), (0x1ff8, 4), (0x2000, 4)]})
+
+    def testUnsupportedPlugin(self):
+        self.assertRaises(
+            plugin.PluginError, common.PoolScannerGroup,
+            session=self.session, profile=self.profile,
+            plugins=[self.MakePlugin(ProcTagScanner),
+                     self.MakePlugin(OldStyleScanner)])
+
+
+class ObjectPoolTestProfile(PoolTestProfile):
+    """The objects found by filescan, modscan and thrdscan."""
+
+    @classmethod
+    def Initialize(cls, profile):
+        super(ObjectPoolTestProfile, cls).Initialize(profile)
+        profile.add_types({
+            '_POOL_HEADER': [0x8, {
+                'PreviousSize': [0x0, ['unsigned char']],
+                'PoolIndex': [0x1, ['unsigned char']],
+                'BlockSize': [0x2, ['unsigned char']],
+                'PoolType': [0x3, ['unsigned char']],
+                'PoolTag': [0x4, ['String', dict(length=4)]],
+                }],
+            '_OBJECT_HEADER': [0x20, {
+                'Type': [0x8, ['Pointer', dict(target='_OBJECT_TYPE')]],
+                'Body': [0x18, ['unsigned int']],
+                }],
+            '_OBJECT_TYPE': [0x40, {
+                'Name': [0x0, ['_UNICODE_STRING']],
+                }],
+            '_UNICODE_STRING': [0x8, {
+                'Length': [0x0, ['unsigned short']],
+                'Buffer': [0x4, ['Pointer', dict(
+                    target='UnicodeString',
+                    target_args=dict(length=lambda x: x.Length))]],
+                }],
+            '_FILE_OBJECT': [0x40, {
+                'FileName': [0x30, ['_UNICODE_STRING']],
+                }],
+            '_LDR_DATA_TABLE_ENTRY': [0x50, {
+                'DllBase': [0x18, ['Pointer']],
+                }],
+            '_ETHREAD': [0x60, {
+                'Cid': [0x0, ['_CLIENT_ID']],
+                'StartAddress': [0x8, ['Pointer']],
+                'Tcb': [0x10, ['_KTHREAD']],
+                'KeyedWaitSemaphore': [0x30, ['_KSEMAPHORE']],
+                }],
+            '_CLIENT_ID': [0x8, {
+                'UniqueProcess': [0x0, ['unsigned int']],
+                'UniqueThread': [0x4, ['unsigned int']],
+                }],
+            '_KTHREAD': [0x20, {
+                'SuspendSemaphore': [0x0, ['_KSEMAPHORE']],
+                }],
+            '_KSEMAPHORE': [0x10, {
+                'Header': [0x0, ['_DISPATCHER_HEADER']],
+                }],
+            '_DISPATCHER_HEADER': [0x10, {
+                'Type': [0x0, ['unsigned char']],
+                }],
+            })
+
+        profile.add_constants(FILE_POOLTAG="Fil\xe5", MODULE_POOLTAG="MmLd",
+                              THREAD_POOLTAG="Thr\xe5",
+                              default_text_encoding="utf-16-le")
+        profile.add_classes(UnicodeString=basic.UnicodeString,
+                            _UNICODE_STRING=overlay._UNICODE_STRING,
+                            _OBJECT_HEADER=overlay._OBJECT_HEADER)
+
+
+class ObjectScannerGroupTest(unittest.TestCase):
+    """Test running the object scanner plugins in one pass."""
+
+    # Offsets of the object types.
+    FILE_TYPE = 0x1000
+    MUTANT_TYPE = 0x1100
+
+    def setUp(self):
+        self.session = session.Session()
+        self.profile = ObjectPoolTestProfile(session=self.session)
+        self.memory = bytearray(0x2000)
+
+        self.WriteString(self.FILE_TYPE, "File")
+        self.WriteString(self.MUTANT_TYPE, "Mutant")
+
+        # Files: A file, an unnamed file and a mutant.
+        for offset, object_type, named in ((0x100, self.FILE_TYPE, True),
+                                           (0x200, self.FILE_TYPE, False),
+                                           (0x300, self.MUTANT_TYPE, True)):
+            self.WritePool(offset, "Fil\xe5", 0x68)
+            struct.pack_into("<I", self.memory, offset + 0x18, object_type)
+            if named:
+                self.WriteString(offset + 0x58, "\\foo.txt")
+
+        # Modules: One is too small.
+        self.WritePool(0x400, "MmLd", 0x58)
+        self.WritePool(0x500, "MmLd", 0x20)
+
+        # Threads: A system thread without a start address, and threads with
+        # and without a semaphore.
+        for offset, pid, start_address, semaphore in (
+                (0x600, 0, 0, 5), (0x700, 4, 0, 5), (0x800, 4, 0x1234, 5),
+                (0x900, 4, 0x1234, 1)):
+            self.WritePool(offset, "Thr\xe5", 0x88)
+            struct.pack_into("<IIIxxxxB", self.memory, offset + 0x28,
+                             pid, 8, start_address, semaphore)
+            struct.pack_into("<B", self.memory, offset + 0x58, semaphore)
+
+        self.address_space = addrspace.BufferAddressSpace(
+            session=self.session, data=str(self.memory))
+
+    def WritePool(self, offset, tag, size):
+        struct.pack_into("<BBBB4s", self.memory, offset, 0, 0, size / 8, 1,
+                         tag)
+
+    def WriteString(self, offset, string):
+        """Writes a _UNICODE_STRING with its buffer after it."""
+        string = string.encode("utf-16-le")
+        struct.pack_into("<HxxI", self.memory, offset, len(string), offset + 8)
+        self.memory[offset + 8:offset + 8 + len(string)] = string
+
+    def MakePlugin(self, cls):
+        return cls(
+            session=self.session, profile=self.profile,
+            address_space=self.address_space,
+            kernel_address_space=self.address_space,
+            physical_address_space=self.address_space)
+
+    def Offsets(self, results):
+        return [tuple(x.obj_offset for x in result)
+                if isinstance(result, tuple) else result.obj_offset
+                for result in results]
+
+    def testGroup(self):
+        scanners = [self.MakePlugin(cls) for cls in (
+            filescan.FileScan, modscan.ModScan, modscan.ThrdScan)]
+        group = common.PoolScannerGroup(
+            session=self.session, profile=self.profile, plugins=scanners)
+
+        results = dict((x.name, []) for x in scanners)
+        for name, result in group.scan(maxlen=len(self.memory)):
+            results[name].append(result)
+
+        for scanner in scanners:
+            self.assertEqual(self.Offsets(results[scanner.name]),
+                             self.Offsets(scanner.generate_hits()))
+
+        self.assertEqual(
+            dict((name, self.Offsets(x)) for name, x in results.items()),
+            dict(filescan=[(0x110, 0x128)], modscan=[0x408],
+                 thrdscan=[0x628, 0x828]))
+
+
+class TestEPROCESS(obj.Struct):
+    @property
+    def pid(self):
+        return self.obj_offset
+
+
+class ProcessLister(common.WinProcessFilter):
+    """Lists processes with a method which starts from the known processes."""
+
+    __abstract = True
+    __name = "test_process_lister"
+
+    def list_from_eprocess(self):
+        for offset in self.eprocess:
+            yield self.profile._EPROCESS(offset, vm=self.kernel_address_space)
+
+    def list_from_head(self, seen=None):
+        _ = seen
+        for offset in (0x10, 0x20):
+            yield self.profile._EPROCESS(offset, vm=self.kernel_address_space)
+
+    def list_from_children(self, seen=None):
+        for offset in seen:
+            if offset < 0x100:
+                yield self.profile._EPROCESS(
+                    offset + 0x100, vm=self.kernel_address_space)
+
+    METHODS = [
+        ("Head", list_from_head),
+        ("Children", list_from_children),
+        ]
+
+
+class ProcessListTest(unittest.TestCase):
+    """Test listing processes with memoized methods."""
+
+    def setUp(self):
+        self.session = session.Session()
+        self.profile = obj.Profile.classes['Profile32Bits'](
+            session=self.session)
+        self.profile.add_types({'_EPROCESS': [0x10, {}]})
+        self.profile.add_classes(_EPROCESS=TestEPROCESS)
+
+        self.address_space = addrspace.BufferAddressSpace(
+            session=self.session, data="\x00" * 0x1000)
+        self.session.SetParameter("default_address_space", self.address_space)
+
+    def ListProcesses(self, **kwargs):
+        lister = ProcessLister(
+            session=self.session, profile=self.profile,
+            kernel_address_space=self.address_space,
+            physical_address_space=self.address_space, **kwargs)
+        return [x.obj_offset for x in lister.list_eprocess()]
+
+    def testMemoizedMethods(self):
+        self.assertEqual(self.ListProcesses(), [0x10, 0x20, 0x110, 0x120])
+
+        # Methods which start from the known processes also start from the
+        # ones given by the user.
+        self.assertEqual(self.ListProcesses(eprocess=[0x30]),
+                         [0x10, 0x20, 0x30, 0x110, 0x120, 0x130])
+        self.assertEqual(self.ListProcesses(), [0x10, 0x20, 0x110, 0x120])
+
+
+class ParallelPoolScannerTest(unittest.TestCase):
+    """Test scanning an image in shards with worker processes."""
+
+    SHARD_SIZE = 0x10000
+
+    def setUp(self):
+        self.session = session.Session()
+        self.profile = PoolTestProfile(session=self.session)
+
+        # Headers at the start and end of the image, and across the end of
+        # every shard.
+        memory = bytearray(0x48000)
+        self.expected = []
+        for offset in (range(0x8, len(memory), 0x1238) +
+                       range(self.SHARD_SIZE - 4, len(memory), self.SHARD_SIZE)
+                       + [0, len(memory) - 8]):
+            struct.pack_into("<HH4s", memory, offset, 0, 4, "Pro\xe3")
+            self.expected.append(offset)
+
+        self.expected.sort()
+
+        self.fd = tempfile.NamedTemporaryFile()
+        self.fd.write(memory)
+        self.fd.flush()
+
+        self.address_space = standard.FileAddressSpace(
+            filename=self.fd.name, session=self.session)
+
+    def tearDown(self):
+        self.fd.close()
+
+    def Scan(self, workers):
+        scanner = TagScanner(tag="Pro\xe3", profile=self.profile,
+                             session=self.session,
+                             address_space=self.address_space,
+                             workers=workers)
+        scanner.SHARD_SIZE = self.SHARD_SIZE
+        self.assertTrue(scanner.image_address_space() is self.address_space)
+
+        return [x.obj_offset for x in scanner.scan(maxlen=0x48000)]
+
+    def testParallelScan(self):
+        serial = self.Scan(1)
+        self.assertEqual(serial, self.expected)
+        self.assertEqual(self.Scan(3), serial)
+
+
+class WinFindDTBTest(unittest.TestCase):
+    """Test verifying a DTB without the process it was found in."""
+
+    # (paging mode, profile metadata, mapped virtual address)
+    MODES = [("amd64", dict(arch="AMD64"), 0xfffff80000001000),
+             ("ia32", dict(arch="I386"), 0x1000),
+             ("pae", dict(arch="I386", pae=True), 0x1000)]
+
+    def VerifyDTB(self, mode, metadata, vaddr, dtb_offset=0):
+        test_session = session.Session()
+        tables = testlib.SyntheticPageTables(mode)
+
+        # Map a page in each GB so all the PAE page directories exist.
+        for i in range(4):
+            tables.map(vaddr + i * 0x40000000, 0x5000 + i * 0x1000)
+
+        # Windows maps the page tables through self referencing entries.
+        if mode == "pae":
+            page_directory = tables._read_entry(tables.dtb + 3 * 8) & ~0xfff
+            for i in range(4):
+                tables._write_entry(page_directory + i * 8,
+                                    tables._read_entry(tables.dtb + i * 8))
+        else:
+            tables._write_entry(tables.dtb + 0x1ed * tables.entry_size,
+                                tables.dtb | 3)
+
+        profile = obj.Profile(name="test", session=test_session,
+                              metadata=metadata)
+        find_dtb = common.WinFindDTB(
+            session=test_session, profile=profile,
+            physical_address_space=tables.address_space(test_session))
+
+        return find_dtb.VerifyDTB(tables.dtb + dtb_offset)
+
+    def testVerifyDTB(self):
+        for mode, metadata, vaddr in self.MODES:
+            address_space = self.VerifyDTB(mode, metadata, vaddr)
+            self.assertEqual(address_space.vtop(vaddr + 0x10), 0x5010)
+
+            # Other page tables do not refer to themselves.
+            self.assertEqual(
+                self.VerifyDTB(mode, metadata, vaddr, dtb_offset=0x1000), None)
+            self.assertEqual(
+                self.VerifyDTB(mode, metadata, vaddr, dtb_offset=0x800), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -53,21 +53,16 @@ class ConnScan(tcpip_vtypes.TcpipPluginMixin,
         return (super(ConnScan, cls).is_active(session) and
                 session.profile.metadata("major") == "5")
 
-    def generate_hits(self):
-        """Search the physical address space for _TCPT_OBJECTs.
-
-        Yields:
-          _TCPT_OBJECT instantiated on the physical address space.
-        """
-        scanner = PoolScanConnFast(
+    def make_scanner(self):
+        return PoolScanConnFast(
             session=self.session, profile=self.tcpip_profile,
             address_space=self.address_space)
 
-        for pool_obj in scanner.scan():
-            # The struct is allocated out of the pool (i.e. its not an object).
-            yield self.tcpip_profile._TCPT_OBJECT(
-                vm=self.address_space,
-                offset=pool_obj.obj_offset + pool_obj.size())
+    def process_pool_hit(self, pool_obj):
+        """Returns the _TCPT_OBJECT instantiated on the scanned address space."""
+        # The struct is allocated out of the pool (i.e. its not an object).
+        return self.tcpip_profile._TCPT_OBJECT(
+            vm=pool_obj.obj_vm, offset=pool_obj.obj_offset + pool_obj.size())
 
     def render(self, renderer):
         renderer.table_header([("Offset(P)", "offset_p", "[addrpad]"),
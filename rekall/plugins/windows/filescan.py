@@ -58,23 +58,22 @@ class FileScan(common.PoolScannerPlugin):
 
     allocation = ['_POOL_HEADER', '_OBJECT_HEADER', '_FILE_OBJECT']
 
-    def generate_hits(self):
-        """Generate possible hits."""
-        scanner = PoolScanFile(profile=self.profile, session=self.session,
-                               address_space=self.address_space)
+    def make_scanner(self):
+        return PoolScanFile(profile=self.profile, session=self.session,
+                            address_space=self.address_space)
 
-        for pool_obj in scanner.scan():
-            object_obj = pool_obj.get_object("_OBJECT_HEADER", self.allocation)
+    def process_pool_hit(self, pool_obj):
+        object_obj = pool_obj.get_object("_OBJECT_HEADER", self.allocation)
 
-            if object_obj.get_object_type(self.kernel_address_space) != "File":
-                continue
+        if object_obj.get_object_type(self.kernel_address_space) != "File":
+            return
 
-            ## If the string is not reachable we skip it
-            file_obj = pool_obj.get_object("_FILE_OBJECT", self.allocation)
-            if not file_obj.FileName.v(vm=self.kernel_address_space):
-                continue
+        ## If the string is not reachable we skip it
+        file_obj = pool_obj.get_object("_FILE_OBJECT", self.allocation)
+        if not file_obj.FileName.v(vm=self.kernel_address_space):
+            return
 
-            yield (object_obj, file_obj)
+        return (object_obj, file_obj)
 
     def render(self, renderer):
         """Print the output in a table."""
@@ -139,26 +138,25 @@ class DriverScan(FileScan):
     allocation = ['_POOL_HEADER', '_OBJECT_HEADER', '_DRIVER_OBJECT',
                   '_DRIVER_EXTENSION']
 
-    def generate_hits(self):
-        """Generate possible hits."""
-        scanner = PoolScanDriver(session=self.session,
-                                 profile=self.profile,
-                                 address_space=self.address_space)
+    def make_scanner(self):
+        return PoolScanDriver(session=self.session,
+                              profile=self.profile,
+                              address_space=self.address_space)
 
-        for pool_obj in scanner.scan():
-            object_obj = pool_obj.get_object("_OBJECT_HEADER", self.allocation)
-            if object_obj.get_object_type(
-                self.kernel_address_space) != "Driver":
-                continue
+    def process_pool_hit(self, pool_obj):
+        object_obj = pool_obj.get_object("_OBJECT_HEADER", self.allocation)
+        if object_obj.get_object_type(
+            self.kernel_address_space) != "Driver":
+            return
 
-            object_name = object_obj.NameInfo.Name.v(
-                vm=self.kernel_address_space)
+        object_name = object_obj.NameInfo.Name.v(
+            vm=self.kernel_address_space)
 
-            driver_obj = pool_obj.get_object("_DRIVER_OBJECT", self.allocation)
-            extension_obj = pool_obj.get_object(
-                "_DRIVER_EXTENSION", self.allocation)
+        driver_obj = pool_obj.get_object("_DRIVER_OBJECT", self.allocation)
+        extension_obj = pool_obj.get_object(
+            "_DRIVER_EXTENSION", self.allocation)
 
-            yield (object_obj, driver_obj, extension_obj, object_name)
+        return (object_obj, driver_obj, extension_obj, object_name)
 
 
     def render(self, renderer):
@@ -209,23 +207,23 @@ class SymLinkScan(FileScan):
 
     allocation = ['_POOL_HEADER', '_OBJECT_HEADER', '_OBJECT_SYMBOLIC_LINK']
 
-    def generate_hits(self):
-        """Generate possible hits."""
-        scanner = PoolScanSymlink(profile=self.profile, session=self.session,
-                                  address_space=self.address_space)
-        for pool_obj in scanner.scan():
-            object_obj = pool_obj.get_object("_OBJECT_HEADER", self.allocation)
-            if object_obj.get_object_type(
-                self.kernel_address_space) != "SymbolicLink":
-                continue
+    def make_scanner(self):
+        return PoolScanSymlink(profile=self.profile, session=self.session,
+                               address_space=self.address_space)
+
+    def process_pool_hit(self, pool_obj):
+        object_obj = pool_obj.get_object("_OBJECT_HEADER", self.allocation)
+        if object_obj.get_object_type(
+            self.kernel_address_space) != "SymbolicLink":
+            return
 
-            object_name = object_obj.NameInfo.Name.v(
-                vm=self.kernel_address_space)
+        object_name = object_obj.NameInfo.Name.v(
+            vm=self.kernel_address_space)
 
-            link_obj = pool_obj.get_object(
-                "_OBJECT_SYMBOLIC_LINK", self.allocation)
+        link_obj = pool_obj.get_object(
+            "_OBJECT_SYMBOLIC_LINK", self.allocation)
 
-            yield object_obj, link_obj, object_name
+        return object_obj, link_obj, object_name
 
     def render(self, renderer):
         """ Renders text-based output """
@@ -282,24 +280,24 @@ class MutantScan(FileScan):
         super(MutantScan, self).__init__(**kwargs)
         self.silent = silent
 
-    def generate_hits(self):
-        scanner = PoolScanMutant(profile=self.profile, session=self.session,
-                                 address_space=self.address_space)
+    def make_scanner(self):
+        return PoolScanMutant(profile=self.profile, session=self.session,
+                              address_space=self.address_space)
 
-        for pool_obj in scanner.scan():
-            object_obj = pool_obj.get_object("_OBJECT_HEADER", self.allocation)
-            if object_obj.get_object_type(
-                self.kernel_address_space) != "Mutant":
-                continue
+    def process_pool_hit(self, pool_obj):
+        object_obj = pool_obj.get_object("_OBJECT_HEADER", self.allocation)
+        if object_obj.get_object_type(
+            self.kernel_address_space) != "Mutant":
+            return
 
-            object_name = object_obj.NameInfo.Name.v(
-                vm=self.kernel_address_space)
+        object_name = object_obj.NameInfo.Name.v(
+            vm=self.kernel_address_space)
 
-            if self.silent and not object_name:
-                continue
+        if self.silent and not object_name:
+            return
 
-            mutant = pool_obj.get_object("_KMUTANT", self.allocation)
-            yield (object_obj, mutant, object_name)
+        mutant = pool_obj.get_object("_KMUTANT", self.allocation)
+        return (object_obj, mutant, object_name)
 
     def render(self, renderer):
         """Renders the output"""
@@ -383,18 +381,6 @@ class PoolScanProcess(common.PoolScanner):
             ('CheckProcess', {}),
             ]
 
-    def scan(self, **_):
-        for pool_obj in super(PoolScanProcess, self).scan():
-            eprocess = pool_obj.get_object("_EPROCESS", self.allocation)
-
-            if eprocess.Pcb.DirectoryTableBase == 0:
-                continue
-
-            if eprocess.Pcb.DirectoryTableBase % 0x20 != 0:
-                continue
-
-            yield eprocess
-
 
 class PSScan(common.KDBGMixin, common.PoolScannerPlugin):
     """Scan Physical memory for _EPROCESS pool allocations.
@@ -406,14 +392,26 @@ class PSScan(common.KDBGMixin, common.PoolScannerPlugin):
 
     __name = "psscan"
 
-    def scan_processes(self):
-        """Generate possible hits."""
+    def make_scanner(self):
         # Just grab the AS and scan it using our scanner
-        scanner = PoolScanProcess(session=self.session,
-                                  profile=self.profile,
-                                  address_space=self.address_space)
+        return PoolScanProcess(session=self.session,
+                               profile=self.profile,
+                               address_space=self.address_space)
+
+    def process_pool_hit(self, pool_obj):
+        eprocess = pool_obj.get_object("_EPROCESS", PoolScanProcess.allocation)
+
+        if eprocess.Pcb.DirectoryTableBase == 0:
+            return
 
-        return scanner.scan()
+        if eprocess.Pcb.DirectoryTableBase % 0x20 != 0:
+            return
+
+        return eprocess
+
+    def scan_processes(self):
+        """Generate possible hits."""
+        return self.generate_hits()
 
     def render(self, renderer):
         """Render results in a table."""
@@ -60,38 +60,38 @@ class AtomScan(win32k_core.Win32kPluginMixin, common.PoolScannerPlugin):
         super(AtomScan, self).__init__(**kwargs)
         self.sort_by = sort_by
 
-    def generate_hits(self):
-        scanner = PoolScanAtom(
+    def make_scanner(self):
+        return PoolScanAtom(
             profile=self.win32k_profile, session=self.session,
             address_space=self.address_space)
 
-        for pool_header in scanner.scan():
-            # Note: all OS after XP, there are an extra 8 bytes (for 32-bit) or
-            # 16 bytes (for 64-bit) between the _POOL_HEADER and
-            # _RTL_ATOM_TABLE.  This is variable length structure, so we can't
-            # use the bottom-up approach as we do with other object scanners -
-            # because the size of an _RTL_ATOM_TABLE differs depending on the
-            # number of hash buckets.
-
-            version = self.profile.metadata('version')
-            fixup = 0
-
-            if self.profile.metadata('arch') == 'I386':
-                if version > "5.1":
-                    fixup = 8
-            else:
-                if version > "5.1":
-                    fixup = 16
-
-            atom_table = self.win32k_profile._RTL_ATOM_TABLE(
-                offset=pool_header.obj_offset + pool_header.size() + fixup,
-                vm=pool_header.obj_vm)
-
-            # There's no way to tell which session or window station
-            # owns an atom table by *just* looking at the atom table,
-            # so we have to instantiate it from the default kernel AS.
-            if atom_table.is_valid():
-                yield atom_table
+    def process_pool_hit(self, pool_header):
+        # Note: all OS after XP, there are an extra 8 bytes (for 32-bit) or
+        # 16 bytes (for 64-bit) between the _POOL_HEADER and
+        # _RTL_ATOM_TABLE.  This is variable length structure, so we can't
+        # use the bottom-up approach as we do with other object scanners -
+        # because the size of an _RTL_ATOM_TABLE differs depending on the
+        # number of hash buckets.
+
+        version = self.profile.metadata('version')
+        fixup = 0
+
+        if self.profile.metadata('arch') == 'I386':
+            if version > "5.1":
+                fixup = 8
+        else:
+            if version > "5.1":
+                fixup = 16
+
+        atom_table = self.win32k_profile._RTL_ATOM_TABLE(
+            offset=pool_header.obj_offset + pool_header.size() + fixup,
+            vm=pool_header.obj_vm)
+
+        # There's no way to tell which session or window station
+        # owns an atom table by *just* looking at the atom table,
+        # so we have to instantiate it from the default kernel AS.
+        if atom_table.is_valid():
+            return atom_table
 
     def render(self, renderer):
 
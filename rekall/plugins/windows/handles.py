@@ -65,7 +65,9 @@ class Handles(common.WinProcessFilter):
 
     def enumerate_handles(self, task):
         if task.ObjectTable.HandleTableList:
-            for handle in task.ObjectTable.handles():
+            # Handles of other types are skipped without being decoded.
+            for handle in task.ObjectTable.handles(
+                    object_types=self.object_list):
                 name = ""
                 object_type = handle.get_object_type(self.kernel_address_space)
                 if object_type == "File":
@@ -109,9 +111,6 @@ class Handles(common.WinProcessFilter):
                 self.session.report_progress("%s: %s handles" % (
                         task.ImageFileName, count))
 
-                if self.object_list and object_type not in self.object_list:
-                    continue
-
                 if self.silent:
                     if len(utils.SmartUnicode(name).replace("'", "")) == 0:
                         continue
@@ -19,9 +19,9 @@
 #
 
 """A Rekall Memory Forensics scanner which uses yara."""
-import sys
 import yara
 
+from rekall import config
 from rekall import constants
 from rekall import plugin
 from rekall import scan
@@ -30,15 +30,50 @@ from rekall.plugins.windows import common
 from rekall.plugins.windows import vadinfo
 
 
+def _ScanYaraWork(yarascan, work):
+    """Returns all the hits in the unit of work."""
+    return list(yarascan.scan_work(work))
+
+
+def LimitHits(hits, hit_counts, hits_per_rule=None):
+    """Yields the hits until each rule has hits_per_rule hits.
+
+    Args:
+      hits: An iterable of tuples starting with the rule name.
+      hit_counts: A dict of the hits yielded so far for each rule (updated).
+      hits_per_rule: The limit, or None for no limit.
+    """
+    for hit in hits:
+        rule = hit[0]
+        count = hit_counts.get(rule, 0)
+        if hits_per_rule is not None and count >= hits_per_rule:
+            continue
+
+        hit_counts[rule] = count + 1
+        yield hit
+
+
 class BaseYaraASScanner(scan.BaseScanner):
     """An address space scanner for Yara signatures."""
     overlap = 1024
 
-    def __init__(self, rules=None, **kwargs):
+    def __init__(self, rules=None, hits_per_rule=None, hit_counts=None,
+                 **kwargs):
+        """Scan with compiled yara rules.
+
+        Args:
+          rules: The compiled yara rules.
+          hits_per_rule: If set, each rule reports at most this many hits.
+          hit_counts: A dict of the hits reported so far for each rule. This
+            can be shared between scanners to apply the limit across scans.
+        """
         super(BaseYaraASScanner, self).__init__(**kwargs)
         self.rules = rules
-        self.hits = []
-        self.base_offset = None
+        self.hits_per_rule = hits_per_rule
+        if hit_counts is None:
+            hit_counts = {}
+
+        self.hit_counts = hit_counts
 
     def _match_rules(self, buffer_as):
         """Compatibility for yara modules.
@@ -75,26 +110,16 @@ class BaseYaraASScanner(scan.BaseScanner):
                     hit_offset = buffer_offset + buffer_as.base_offset
                     yield (match.rule, hit_offset, name, value)
 
-    def check_addr(self, offset, buffer_as=None):
-        # The buffer was changed - we scan the entire buffer and record the
-        # hits - then we can feed it to the Rekall scan framework.
-        if self.base_offset != buffer_as.base_offset:
-            self.base_offset = buffer_as.base_offset
-            self.hits = []
-
-            for rule, offset, name, value in self._match_rules(buffer_as):
-                self.hits.append((rule, offset, name, value))
-
-        if self.hits and offset == self.hits[0][1]:
-            return self.hits.pop(0)
+    def scan_buffer(self, buffer_as, offset, end):
+        """Yields the hits between offset and end, ordered by offset.
 
-    def skip(self, buffer_as, offset):
-        # Skip the entire buffer.
-        if not self.hits:
-            return len(buffer_as.data)
+        Yara matches the entire buffer at once. Hits past end are in the
+        overlap, and will be found again when the next buffer is matched.
+        """
+        hits = sorted((hit for hit in self._match_rules(buffer_as)
+                       if offset <= hit[1] < end), key=lambda hit: hit[1])
 
-        next_hit = self.hits[0][1]
-        return next_hit - offset
+        return LimitHits(hits, self.hit_counts, self.hits_per_rule)
 
 
 class VadYarraScanner(vadinfo.VadScanner, BaseYaraASScanner):
@@ -102,7 +127,12 @@ class VadYarraScanner(vadinfo.VadScanner, BaseYaraASScanner):
 
 
 class YaraScan(common.WinProcessFilter):
-    """Scan using yara signatures."""
+    """Scan using yara signatures.
+
+    If the scan_workers parameter is larger than 1, the processes (or shards of
+    the physical address space) are scanned by that many worker processes in
+    parallel. The rules are compiled once, before the workers are forked.
+    """
 
     __name = "yarascan"
 
@@ -130,8 +160,14 @@ class YaraScan(common.WinProcessFilter):
         parser.add_argument("--scan_physical", default=False, action="store_true",
                             help="If specified we scan the physcial address space.")
 
+        parser.add_argument("--hits_per_rule", default=None,
+                            action=config.IntParser,
+                            help="If specified, report at most this many hits "
+                            "for each rule.")
+
     def __init__(self, string=None, scan_vads=False, scan_physical=False,
-                 yara_file=None, yara_expression=None, **kwargs):
+                 yara_file=None, yara_expression=None, hits_per_rule=None,
+                 **kwargs):
         """Scan using yara signatures.
 
         Args:
@@ -141,6 +177,7 @@ class YaraScan(common.WinProcessFilter):
           scan_physical: If true we scan the physical address space.
           yara_file: The yara file to read.
           yara_expression: If provided we scan for this yarra expression.
+          hits_per_rule: If set, report at most this many hits for each rule.
         """
         super(YaraScan, self).__init__(**kwargs)
         if yara_expression:
@@ -161,23 +198,91 @@ class YaraScan(common.WinProcessFilter):
 
         self.scan_vads = scan_vads
         self.scan_physical = scan_physical
+        self.hits_per_rule = hits_per_rule
 
-    def generate_hits(self, address_space):
+        # The hits reported so far for each rule.
+        self.hit_counts = {}
+
+    def generate_hits(self, address_space, offset=0, maxlen=None):
         scanner = BaseYaraASScanner(
             profile=self.profile, session=self.session,
             address_space=address_space,
-            rules=self.rules)
+            rules=self.rules, hits_per_rule=self.hits_per_rule,
+            hit_counts=self.hit_counts)
 
-        return scanner.scan()
+        return scanner.scan(offset=offset, maxlen=maxlen)
 
-    def render_scan_physical(self, renderer):
-        """This method scans the process memory using the VAD."""
-        for rule, address, _, hit in self.generate_hits(
-            self.physical_address_space):
-            renderer.format("Rule: {0}\n", rule)
+    def generate_task_hits(self, task):
+        """Yields the hits in the task's VADs or entire address space."""
+        if self.scan_vads:
+            scanner = VadYarraScanner(
+                session=self.session, rules=self.rules, task=task,
+                hits_per_rule=self.hits_per_rule, hit_counts=self.hit_counts)
 
-            context = self.physical_address_space.read(address, 0x40)
-            utils.WriteHexdump(renderer, context, base=address)
+            return scanner.scan()
+
+        return self.generate_hits(task.get_process_address_space())
+
+    def scan_work(self, work):
+        """Yields (rule, address, name, value, context) for a unit of work.
+
+        Args:
+          work: A (task offset, offset, length) tuple. If the task offset is
+            None, the range of the physical address space is scanned, else
+            the entire process.
+        """
+        task_offset, offset, length = work
+        if task_offset is None:
+            address_space = self.physical_address_space
+            hits = self.generate_hits(
+                address_space, offset=offset, maxlen=length)
+        else:
+            task = self.profile._EPROCESS(
+                offset=task_offset, vm=self.kernel_address_space)
+            address_space = task.get_process_address_space()
+            hits = self.generate_task_hits(task)
+
+        for rule, address, name, value in hits:
+            yield (rule, address, name, value,
+                   address_space.read(address, 0x40))
+
+    def generate_work_hits(self, work_items, address_space):
+        """Yields (work, hits) for each unit of work, in order.
+
+        The work is done in worker processes if requested, and each unit's
+        hits are yielded as soon as they are ready.
+        """
+        workers = min(self.session.GetParameter("scan_workers", 1),
+                      len(work_items))
+        image = scan.ImageAddressSpace(address_space)
+
+        if workers <= 1 or image is None:
+            for work in work_items:
+                yield work, self.scan_work(work)
+
+            return
+
+        with scan.ForkPool(self, image, workers) as pool:
+            # imap() returns the results in the order of the work.
+            for work, hits in zip(
+                    work_items, pool.imap(_ScanYaraWork, work_items)):
+                # Workers count their own hits, so apply the limit to all
+                # the workers' hits here.
+                yield work, LimitHits(
+                    hits, self.hit_counts, self.hits_per_rule)
+
+    def render_scan_physical(self, renderer):
+        """This method scans the physical address space."""
+        scanner = scan.BaseScanner(
+            session=self.session, address_space=self.physical_address_space)
+        work_items = [(None, offset, length) for offset, length in
+                      scanner.shards(0, 2**64)]
+
+        for _, hits in self.generate_work_hits(
+                work_items, self.physical_address_space):
+            for rule, address, _, _, context in hits:
+                renderer.format("Rule: {0}\n", rule)
+                utils.WriteHexdump(renderer, context, base=address)
 
     def render_kernel_scan(self, renderer):
         modules = self.session.plugins.modules()
@@ -201,32 +306,20 @@ class YaraScan(common.WinProcessFilter):
             context = self.kernel_address_space.read(address, 0x40)
             utils.WriteHexdump(renderer, context, base=address)
 
-    def render_task_scan(self, renderer, task):
-        task_as = task.get_process_address_space()
-
-        for rule, address, _, hit in self.generate_hits(task_as):
-            renderer.format("Rule: {0}\n", rule)
-
-            renderer.format("Owner: {0}\n", task.ImageFileName)
-
-            context = task_as.read(address, 0x40)
-            utils.WriteHexdump(renderer, context, base=address)
+    def render_task_scan(self, renderer):
+        """Scans the processes, in worker processes if requested."""
+        tasks = list(self.filter_processes())
+        owners = dict((task.obj_offset, task.ImageFileName) for task in tasks)
+        work_items = [(task.obj_offset, None, None) for task in tasks]
 
-    def render_task_scan_vad(self, renderer, task):
-        """This method scans the process memory using the VAD."""
-        task_as = task.get_process_address_space()
+        for (task_offset, _, _), hits in self.generate_work_hits(
+                work_items, self.kernel_address_space):
+            for rule, address, _, _, context in hits:
+                renderer.format("Rule: {0}\n", rule)
 
-        scanner = VadYarraScanner(
-            session=self.session, rules=self.rules, task=task)
-
-        for rule, address, _, hit in scanner.scan():
-            renderer.format("Rule: {0}\n", rule)
-
-            renderer.format("Owner: {0}\n", task.ImageFileName)
-
-            context = task_as.read(address, 0x40)
-            utils.WriteHexdump(renderer, context, base=address)
+                renderer.format("Owner: {0}\n", owners[task_offset])
 
+                utils.WriteHexdump(renderer, context, base=address)
 
     def render(self, renderer):
         """Render output."""
@@ -234,11 +327,7 @@ class YaraScan(common.WinProcessFilter):
             return self.render_scan_physical(renderer)
 
         elif self.scan_vads or self.filtering_requested:
-            for task in self.filter_processes():
-                if self.scan_vads:
-                    self.render_task_scan_vad(renderer, task)
-                else:
-                    self.render_task_scan(renderer, task)
+            return self.render_task_scan(renderer)
 
         # We are searching the kernel address space
         else:
@@ -22,7 +22,83 @@
 
 """Tests for the yarascan plugins."""
 
+import re
+import unittest
+
+from rekall import addrspace
+from rekall import session
 from rekall import testlib
+from rekall.plugins.windows.malware import yarascan
+
+
+class FakeMatch(object):
+    def __init__(self, rule, strings):
+        self.rule = rule
+        self.strings = strings
+
+
+class FakeRules(object):
+    """Behaves like compiled yara rules of regular expressions."""
+
+    def __init__(self, **rules):
+        self.rules = rules
+
+    def match(self, data=None):
+        result = []
+        for rule, expression in sorted(self.rules.items()):
+            strings = [(m.start(), "$a", m.group(0))
+                       for m in re.finditer(expression, data)]
+            if strings:
+                result.append(FakeMatch(rule, strings))
+
+        return result
+
+
+class YaraScannerTest(unittest.TestCase):
+    """Test the yara scanner without the yara module."""
+
+    def setUp(self):
+        self.session = session.Session()
+        self.data = ("foo" + "\x00" * 100 + "bar") * 1000
+        self.address_space = addrspace.BufferAddressSpace(
+            session=self.session, data=self.data)
+        self.rules = FakeRules(r1="bar", r2="foo")
+
+    def Scan(self, **kwargs):
+        return list(yarascan.BaseYaraASScanner(
+            session=self.session, address_space=self.address_space,
+            rules=self.rules, **kwargs).scan(maxlen=len(self.data)))
+
+    def testScan(self):
+        hits = self.Scan()
+        self.assertEqual(len(hits), 2000)
+
+        # Hits of all rules are in order, each reported once.
+        self.assertEqual([hit[1] for hit in hits],
+                         [m.start() for m in re.finditer(
+                             "foo|bar", self.data)])
+
+        self.assertEqual(hits[:2], [("r2", 0, "$a", "foo"),
+                                    ("r1", 103, "$a", "bar")])
+
+        # Scanning in shards (like the workers do) finds the same hits, even
+        # when a hit crosses the end of a shard.
+        scanner = yarascan.BaseYaraASScanner(
+            session=self.session, address_space=self.address_space,
+            rules=self.rules)
+        shards = list(scanner.shards(0, 104)) + [(104, len(self.data) - 104)]
+        self.assertEqual(
+            [hit for offset, length in shards
+             for hit in scanner.scan(offset=offset, maxlen=length)], hits)
+
+    def testHitsPerRule(self):
+        hit_counts = {}
+        hits = self.Scan(hits_per_rule=3, hit_counts=hit_counts)
+        self.assertEqual([hit[0] for hit in hits], ["r2", "r1"] * 3)
+        self.assertEqual(hit_counts, dict(r1=3, r2=3))
+
+        # The counts are shared between scans.
+        self.assertEqual(self.Scan(hits_per_rule=3, hit_counts=hit_counts), [])
 
 
 class TestYara(testlib.RekallBaseUnitTestCase):
@@ -57,15 +57,13 @@ class ModScan(filescan.FileScan):
 
     __name = "modscan"
 
-    def generate_hits(self):
-        scanner = PoolScanModuleFast(profile=self.profile, session=self.session,
-                                     address_space=self.address_space)
+    def make_scanner(self):
+        return PoolScanModuleFast(profile=self.profile, session=self.session,
+                                  address_space=self.address_space)
 
-        for offset in scanner.scan():
-            ldr_entry = self.profile._LDR_DATA_TABLE_ENTRY(
-                vm=self.address_space, offset=offset.obj_offset + offset.size())
-
-            yield ldr_entry
+    def process_pool_hit(self, pool_obj):
+        return self.profile._LDR_DATA_TABLE_ENTRY(
+            vm=self.address_space, offset=pool_obj.obj_offset + pool_obj.size())
 
     def render(self, renderer):
         renderer.table_header([("Offset(P)", "offset", "[addrpad]"),
@@ -108,26 +106,25 @@ class ThrdScan(ModScan):
 
     allocation = ['_POOL_HEADER', '_OBJECT_HEADER', "_ETHREAD"]
 
-    def generate_hits(self):
-        scanner = PoolScanThreadFast(profile=self.profile, session=self.session,
-                                     address_space=self.address_space)
-
-        for found in scanner.scan():
-            thread = found.get_object("_ETHREAD", self.allocation)
+    def make_scanner(self):
+        return PoolScanThreadFast(profile=self.profile, session=self.session,
+                                  address_space=self.address_space)
 
-            if (thread.Cid.UniqueProcess.v() != 0 and
-                thread.StartAddress == 0):
-                continue
+    def process_pool_hit(self, pool_obj):
+        thread = pool_obj.get_object("_ETHREAD", self.allocation)
 
-            # Check the Semaphore Type.
-            if thread.Tcb.SuspendSemaphore.Header.Type != 0x05:
-                continue
+        if (thread.Cid.UniqueProcess.v() != 0 and
+            thread.StartAddress == 0):
+            return
 
-            if thread.KeyedWaitSemaphore.Header.Type != 0x05:
-                continue
+        # Check the Semaphore Type.
+        if thread.Tcb.SuspendSemaphore.Header.Type != 0x05:
+            return
 
-            yield thread
+        if thread.KeyedWaitSemaphore.Header.Type != 0x05:
+            return
 
+        return thread
 
     def render(self, renderer):
         renderer.table_header([("Offset(P)", "offset", "[addrpad]"),
@@ -78,10 +78,18 @@ class Modules(common.WindowsCommandPlugin):
 
         return sorted(self.mod_lookup.keys())
 
+    @plugin.MemoizeResults()
+    def list_modules(self):
+        """Lists all the modules in the PsLoadedModuleList.
+
+        The results are memoized in the session.
+        """
+        return self.session.GetParameter("PsLoadedModuleList").list_of_type(
+            "_LDR_DATA_TABLE_ENTRY", "InLoadOrderLinks")
+
     def _make_cache(self):
         self.mod_lookup = {}
-        for l in self.session.GetParameter("PsLoadedModuleList").list_of_type(
-            "_LDR_DATA_TABLE_ENTRY", "InLoadOrderLinks"):
+        for l in self.list_modules():
             self.mod_lookup[l.DllBase.v()] = l
 
         self.modlist = sorted(self.mod_lookup.keys())
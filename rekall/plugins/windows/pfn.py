@@ -30,6 +30,7 @@ from rekall import config
 from rekall import testlib
 from rekall import obj
 from rekall import plugin
+from rekall.plugins.addrspaces import dtb_scanner
 from rekall.plugins.windows import common
 from rekall.plugins.overlays import basic
 
@@ -589,9 +590,9 @@ class PtoV(common.WinProcessFilter):
 class DTBScan2(common.WindowsCommandPlugin):
     """A Fast scanner for hidden DTBs.
 
-    This scanner uses the fact that the virtual address of the DTB is always the
-    same. We walk over all the physical pages, assume each page is a DTB and try
-    to resolve the constant to a physical address.
+    This scanner uses the fact that the kernel is mapped into every process at
+    the same virtual address. We treat every physical page as a DTB and check
+    that it translates the kernel base to its known physical address.
     """
 
     name = "dtbscan2"
@@ -599,24 +600,23 @@ class DTBScan2(common.WindowsCommandPlugin):
     def render(self, renderer):
         kernel_base = self.session.GetParameter("kernel_base")
         physical_kernel_base = self.kernel_address_space.vtop(kernel_base)
-        phys_as = self.physical_address_space
 
         renderer.table_header([("DTB", "dtb", "[addrpad]"),
                                ("Base", "dtb", "[addrpad]"),
                                ("Phys", "dtb", "[addrpad]"),
                                ])
 
-        # On 64 bit images DTBs are aligned to page boundaries.
-        dtb_step = 0x1000
+        mode = dtb_scanner.GetPagingMode(self.kernel_address_space.__class__)
+        if mode is None:
+            raise plugin.PluginError(
+                "Unable to scan for DTBs in %s" % self.kernel_address_space)
 
-        for start, _, length in phys_as.get_available_addresses():
-            for page in range(start, start+length, dtb_step):
-                test_as = self.session.kernel_address_space.__class__(
-                    dtb=page, base=phys_as)
+        scanner = dtb_scanner.DTBScanner(
+            address_space=self.physical_address_space, mode=mode,
+            session=self.session)
 
-                if test_as.vtop(kernel_base) == physical_kernel_base:
-                    renderer.table_row(
-                        page, kernel_base, test_as.vtop(kernel_base))
+        for dtb, paddr in scanner.scan(kernel_base, paddr=physical_kernel_base):
+            renderer.table_row(dtb, kernel_base, paddr)
 
 
 class DTBScan(common.WinProcessFilter):
@@ -32,18 +32,6 @@ from rekall.plugins.windows.registry import registry
 class PoolScanHive(common.PoolScanner):
     checks = [ ('PoolTagCheck', dict(tag = "CM10")) ]
 
-    def scan(self):
-        for pool_obj in super(PoolScanHive, self).scan():
-            # The _HHIVE is immediately after the pool header.
-            hhive = self.profile._CMHIVE(
-                offset=pool_obj.obj_offset + pool_obj.size(),
-                vm=self.address_space)
-
-            if hhive.Hive.Signature != 0xbee0bee0:
-                continue
-
-            yield hhive
-
 
 class HiveScan(common.PoolScannerPlugin):
     """ Scan Physical memory for _CMHIVE objects (registry hives)
@@ -69,14 +57,27 @@ class HiveScan(common.PoolScannerPlugin):
         # Install our specific implementation of registry support.
         self.profile = registry.RekallRegisteryImplementation(self.profile)
 
-    def generate_hits(self, address_space=None):
-        """Yields potential _HHIVE objects."""
-        # Scan for these in the kernel address space.
+    def make_scanner(self, address_space=None):
+        # Scan for these in the physical address space.
         address_space = address_space or self.physical_address_space
-        scanner = PoolScanHive(profile=self.profile, address_space=address_space,
-                               session=self.session)
+        return PoolScanHive(profile=self.profile, address_space=address_space,
+                            session=self.session)
 
-        return scanner.scan()
+    def process_pool_hit(self, pool_obj):
+        # The _HHIVE is immediately after the pool header.
+        hhive = self.profile._CMHIVE(
+            offset=pool_obj.obj_offset + pool_obj.size(),
+            vm=pool_obj.obj_vm)
+
+        if hhive.Hive.Signature == 0xbee0bee0:
+            return hhive
+
+    def generate_hits(self, address_space=None):
+        """Yields potential _HHIVE objects."""
+        for pool_obj in self.make_scanner(address_space).scan():
+            hhive = self.process_pool_hit(pool_obj)
+            if hhive is not None:
+                yield hhive
 
     def list_hives(self, address_space=None):
         """Scans the address space for potential hives."""
@@ -261,6 +261,9 @@ class HiveDump(registry.RegistryPlugin):
                 kernel_address_space=self.kernel_address_space,
                 profile=self.profile)
 
+            # We visit every key so it is faster to copy the whole hive first.
+            reg.address_space.flatten()
+
             renderer.section()
             renderer.format("Hive {0}\n\n", reg.Name)
 
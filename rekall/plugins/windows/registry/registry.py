@@ -40,6 +40,12 @@ from rekall import utils
 from rekall.plugins.windows import common
 
 
+config.DeclareOption(
+    "--flatten_hives", default=False, action="store_true",
+    help="Copy the stable storage of registry hives into memory when they "
+    "are opened, so reading keys does not need to translate cell indexes.")
+
+
 registry_overlays = {
     '_CM_KEY_NODE': [None, {
             'Parent': [None, ['pointer', ['_CM_KEY_NODE']]],
@@ -130,8 +136,42 @@ class HiveAddressSpace(HiveBaseAddressSpace):
         self.flat = self.hive.Hive.Flat.v() > 0
         self.storage = self.hive.Hive.Storage
 
-        # This is a quick lookup for blocks.
-        self.block_cache = utils.FastStore(max_size=1000)
+        # The block addresses of each cell map table, keyed by the type and
+        # table bits of the cell index (see _load_table()).
+        self.tables = {}
+
+        # A copy of the stable storage (see flatten()).
+        self.flat_buffer = None
+        if self.session.GetParameter("flatten_hives"):
+            self.flatten()
+
+    def _load_table(self, table_index):
+        """Reads the block addresses of an entire cell map table at once.
+
+        Returns:
+          A list with the address of each block in the table (None for blocks
+          which are not mapped).
+        """
+        ci_type = table_index >> (self.CI_TYPE_SHIFT - self.CI_TABLE_SHIFT)
+        ci_table = table_index & (self.CI_TABLE_MASK >> self.CI_TABLE_SHIFT)
+        table = self.storage[ci_type].Map.Directory[ci_table].Table
+
+        blocks = []
+        if table:
+            entry = table[0]
+            field_size = entry.BlockAddress.size()
+            field_offset = self.profile.get_obj_offset(
+                "_HMAP_ENTRY", "BlockAddress")
+
+            data = self.base.read(table.obj_offset, table.size())
+            for i in xrange(table.count):
+                block = struct.unpack_from(
+                    field_size == 8 and "<Q" or "<I", data,
+                    i * table.target_size + field_offset)[0]
+                blocks.append(block or None)
+
+        self.tables[table_index] = blocks
+        return blocks
 
     def vtop(self, vaddr):
         # If the hive is listed as "flat", it is all contiguous in memory
@@ -139,20 +179,42 @@ class HiveAddressSpace(HiveBaseAddressSpace):
         if self.flat:
             return self.baseblock + vaddr + self.BLOCK_SIZE + 4
 
-        ci_type = (vaddr & self.CI_TYPE_MASK) >> self.CI_TYPE_SHIFT
-        ci_table = (vaddr & self.CI_TABLE_MASK) >> self.CI_TABLE_SHIFT
-        ci_block = (vaddr & self.CI_BLOCK_MASK) >> self.CI_BLOCK_SHIFT
-        ci_off = (vaddr & self.CI_OFF_MASK) >> self.CI_OFF_SHIFT
+        table_index = vaddr >> self.CI_TABLE_SHIFT
+        blocks = self.tables.get(table_index)
+        if blocks is None:
+            blocks = self._load_table(table_index)
 
         try:
-            block = self.block_cache.Get((ci_type, ci_table, ci_block))
-        except KeyError:
-            block = self.storage[ci_type].Map.Directory[ci_table].Table[
-                ci_block].BlockAddress
+            block = blocks[(vaddr & self.CI_BLOCK_MASK) >> self.CI_BLOCK_SHIFT]
+        except IndexError:
+            return
+
+        if block is not None:
+            return block + (vaddr & self.CI_OFF_MASK) + 4
 
-            self.block_cache.Put((ci_type, ci_table, ci_block), block)
+    def flatten(self):
+        """Copies the stable storage of the hive into a local buffer.
 
-        return block + ci_off + 4
+        Reads of stable cells are then served from the buffer at memory speed.
+        Volatile cells are still read through the cell map.
+        """
+        if self.flat_buffer is None:
+            self.flat_buffer = addrspace.BufferAddressSpace(
+                data="".join(self.save()), session=self.session)
+
+    def read(self, vaddr, length):
+        if self.flat_buffer is not None and not vaddr & self.CI_TYPE_MASK:
+            return self.flat_buffer.read(vaddr + self.BLOCK_SIZE + 4, length)
+
+        return super(HiveAddressSpace, self).read(vaddr, length)
+
+    def read_into(self, vaddr, buf, offset=0, length=None):
+        if self.flat_buffer is not None and not vaddr & self.CI_TYPE_MASK:
+            return self.flat_buffer.read_into(
+                vaddr + self.BLOCK_SIZE + 4, buf, offset, length)
+
+        return super(HiveAddressSpace, self).read_into(
+            vaddr, buf, offset, length)
 
     def save(self):
         """A generator of registry data in linear form.
@@ -200,10 +262,10 @@ class HiveAddressSpace(HiveBaseAddressSpace):
         for i in range(0, length, self.BLOCK_SIZE):
             i = ci(i)
             data = None
-            paddr = self.vtop(i) - 4
+            paddr = self.vtop(i)
 
             if paddr:
-                data = self.base.read(paddr, self.BLOCK_SIZE)
+                data = self.base.read(paddr - 4, self.BLOCK_SIZE)
             else:
                 bad_blocks_reg += 1
                 continue
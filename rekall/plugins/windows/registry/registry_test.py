@@ -0,0 +1,134 @@
+import random
+import struct
+import unittest
+
+from rekall import addrspace
+from rekall import obj
+from rekall import session
+
+# Import and register all the plugins.
+from rekall import plugins  # pylint: disable=unused-import
+from rekall.plugins.windows.registry import registry
+
+
+class HiveTestProfile(obj.Profile.classes['Profile32Bits']):
+    """Just enough of the kernel structs to translate cell indexes."""
+
+    @classmethod
+    def Initialize(cls, profile):
+        super(HiveTestProfile, cls).Initialize(profile)
+        profile.add_types({
+            '_CMHIVE': [0x100, {
+                'Hive': [0x0, ['_HHIVE']],
+                }],
+            '_HHIVE': [0x40, {
+                'BaseBlock': [0x0, ['Pointer', dict(target='unsigned char')]],
+                'Flat': [0x4, ['unsigned char']],
+                'Storage': [0x8, ['Array', dict(count=2, target='_DUAL')]],
+                }],
+            '_DUAL': [0x10, {
+                'Length': [0x0, ['unsigned int']],
+                'Map': [0x4, ['Pointer', dict(target='_HMAP_DIRECTORY')]],
+                }],
+            '_HMAP_DIRECTORY': [0x1000, {
+                'Directory': [0x0, ['Array', dict(
+                    count=1024, target='Pointer',
+                    target_args=dict(target='_HMAP_TABLE'))]],
+                }],
+            '_HMAP_TABLE': [0x2000, {
+                'Table': [0x0, ['Array', dict(
+                    count=512, target='_HMAP_ENTRY')]],
+                }],
+            '_HMAP_ENTRY': [0x10, {
+                'BlockAddress': [0x4, ['unsigned int']],
+                }],
+            })
+
+
+class HiveAddressSpaceTest(unittest.TestCase):
+    """Test the hive address space against walking the cell map directly."""
+
+    HIVE = 0x1000
+    DIRECTORY = 0x2000
+    TABLES = 0x4000
+    BLOCKS = 0x10000
+
+    # The number of blocks in the stable storage.
+    LENGTH = 600
+
+    def setUp(self):
+        self.session = session.Session()
+        self.profile = HiveTestProfile(session=self.session)
+
+        rand = random.Random(1)
+        memory = bytearray(self.BLOCKS + (self.LENGTH + 2) * 0x1000)
+
+        # The stable storage uses two tables, and its blocks are scattered.
+        struct.pack_into("<II", memory, self.HIVE + 0x8,
+                         self.LENGTH * 0x1000, self.DIRECTORY)
+        for table in range(2):
+            struct.pack_into("<I", memory, self.DIRECTORY + table * 4,
+                             self.TABLES + table * 0x2000)
+
+        pages = range(self.LENGTH + 1)
+        rand.shuffle(pages)
+        for block in range(self.LENGTH):
+            address = self.BLOCKS + pages[block] * 0x1000
+            struct.pack_into("<I", memory, self.TABLES + block * 0x10 + 4,
+                             address)
+            memory[address:address + 0x1000] = struct.pack(
+                "<1024I", *[block << 16 | i for i in range(1024)])
+
+        # One block is not mapped.
+        struct.pack_into("<I", memory, self.TABLES + 10 * 0x10 + 4, 0)
+
+        # The base block.
+        struct.pack_into("<I", memory, self.HIVE,
+                         self.BLOCKS + pages[-1] * 0x1000)
+
+        self.kernel_as = addrspace.BufferAddressSpace(
+            session=self.session, data=str(memory))
+
+    def MakeHive(self):
+        return registry.HiveAddressSpace(
+            base=self.kernel_as, hive_addr=self.HIVE, profile=self.profile,
+            session=self.session)
+
+    def testVtop(self):
+        hive = self.MakeHive()
+        storage = hive.storage
+        for vaddr in range(0, self.LENGTH * 0x1000, 0x2345):
+            expected = storage[0].Map.Directory[vaddr >> 21].Table[
+                (vaddr >> 12) & 0x1ff].BlockAddress
+
+            if expected == 0:
+                self.assertEqual(hive.vtop(vaddr), None)
+            else:
+                self.assertEqual(hive.vtop(vaddr),
+                                 expected + vaddr % 0x1000 + 4)
+
+        self.assertEqual(hive.vtop(0xa010), None)
+
+        # Volatile storage is not mapped at all.
+        self.assertEqual(hive.vtop(0x80000000), None)
+
+    def testFlatten(self):
+        hive = self.MakeHive()
+        flat = self.MakeHive()
+        flat.flatten()
+
+        for vaddr in range(0, self.LENGTH * 0x1000, 0x1234):
+            # Reads through the cell map are shifted by 4 bytes within the
+            # block, so do not compare reads across the end of a block.
+            if vaddr % 0x1000 > 0x1000 - 0x24:
+                continue
+
+            self.assertEqual(flat.read(vaddr, 0x20), hive.read(vaddr, 0x20))
+
+            buf = bytearray(0x20)
+            flat.read_into(vaddr, buf)
+            self.assertEqual(str(buf), hive.read(vaddr, 0x20))
+
+
+if __name__ == "__main__":
+    unittest.main()
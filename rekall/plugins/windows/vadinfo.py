@@ -29,6 +29,7 @@
 # the following reference:
 # "The VAD Tree: A Process-Eye View of Physical Memory," Brendan Dolan-Gavitt
 
+import bisect
 import os.path
 
 from rekall import scan
@@ -37,6 +38,97 @@ from rekall.plugins import core
 from rekall.plugins.windows import common
 
 
+def GetVadFilename(vad):
+    """Returns the name of the file mapped by the vad (or "")."""
+    filename = ""
+    try:
+        file_obj = vad.ControlArea.FilePointer
+        if file_obj:
+            filename = file_obj.FileName or "Pagefile-backed section"
+    except AttributeError:
+        pass
+
+    return unicode(filename)
+
+
+class VadIndex(object):
+    """An interval index of the VADs of a process.
+
+    VADs never overlap, so the VAD containing an address is found by bisecting
+    the sorted start addresses.
+    """
+
+    def __init__(self):
+        self.starts = utils.AddressArray()
+
+        # A list of (start, end, protection, filename, vad offset) sorted by
+        # start. The end is inclusive.
+        self.vads = []
+
+    @classmethod
+    def Build(cls, task):
+        """Builds the index by walking the VAD tree of the task once."""
+        vads = []
+        for vad in task.RealVadRoot.traverse():
+            try:
+                vads.append((vad.Start, vad.End,
+                             str(vad.u.VadFlags.ProtectionEnum),
+                             GetVadFilename(vad), vad.obj_offset))
+            except AttributeError:
+                pass
+
+        vads.sort()
+        result = cls()
+        for vad in vads:
+            result.starts.append(vad[0])
+            result.vads.append(vad)
+
+        return result
+
+    def Lookup(self, address):
+        """Returns the (start, end, protection, filename, vad offset) of the
+        VAD containing address, or None.
+        """
+        i = bisect.bisect_right(self.starts, address) - 1
+        if i >= 0:
+            vad = self.vads[i]
+            if address <= vad[1]:
+                return vad
+
+    def __iter__(self):
+        return iter(self.vads)
+
+    def __len__(self):
+        return len(self.vads)
+
+
+class VadIndexCache(dict):
+    """The VAD indexes stored in the session."""
+
+    def __str__(self):
+        return "<%d vad indexes>" % len(self)
+
+
+def GetVadIndex(task):
+    """Returns the VadIndex for the task, building it if needed.
+
+    The index is shared by all plugins through the session.
+    """
+    session = task.obj_session
+    if session.vad_indexes is None:
+        session.vad_indexes = VadIndexCache()
+
+    key = (task.obj_offset, task.Pcb.DirectoryTableBase.v())
+    result = session.vad_indexes.get(key)
+    if result is None:
+        session.report_progress(
+            " Enumerating VADs in %s (%s)", task.name, task.pid)
+
+        result = session.vad_indexes[key] = VadIndex.Build(task)
+
+    return result
+
+
 class VADInfo(common.WinProcessFilter):
     """Dump the VAD info"""
 
@@ -278,46 +370,19 @@ class VAD(common.WinProcessFilter):
 
     PAGE_SIZE = 12
 
-    def __init__(self, *args, **kwargs):
-        super(VAD, self).__init__(*args, **kwargs)
-        self._cache = {}
-
     def find_file(self, addr):
         """Finds the file mapped at this address."""
         for task in self.filter_processes():
             yield self.find_file_in_task(addr, task)
 
     def find_file_in_task(self, addr, task):
-        resolver = self._cache.get(task)
-        if resolver is None:
-            resolver = self._cache[task] = self._make_cache(task)
-
-        try:
-            return resolver.find_le(addr)
-        except ValueError:
-            return None
-
-    def _make_cache(self, task):
-        result = utils.SortedCollection(key=lambda x: x[0])
-        self.session.report_progress(
-            " Enumerating VADs in %s (%s)", task.name, task.pid)
-
-        for vad in task.RealVadRoot.traverse():
-            result.insert(
-                (vad.Start, vad.End, self._get_filename(vad)))
-
-        return result
+        """Returns (start, end, filename) of the VAD containing addr."""
+        vad = GetVadIndex(task).Lookup(addr)
+        if vad:
+            return vad[0], vad[1], vad[3]
 
     def _get_filename(self, vad):
-        filename = ""
-        try:
-            file_obj = vad.ControlArea.FilePointer
-            if file_obj:
-                filename = file_obj.FileName or "Pagefile-backed section"
-        except AttributeError:
-            pass
-
-        return unicode(filename)
+        return GetVadFilename(vad)
 
     def render_vadroot(self, renderer, vad_root):
         renderer.table_header([('VAD', 'offset', '[addrpad]'),
@@ -22,7 +22,81 @@
 
 """Tests for the vadinfo plugins."""
 
+import unittest
+
+from rekall import session
 from rekall import testlib
+from rekall import utils
+from rekall.plugins.windows import vadinfo
+
+
+class FakeVadRoot(object):
+    def __init__(self, vads):
+        self.vads = vads
+        self.traversals = 0
+
+    def traverse(self):
+        self.traversals += 1
+        return iter(self.vads)
+
+
+class FakeTask(utils.AttributeDict):
+    """Just enough of an _EPROCESS to index its VADs."""
+
+    def __init__(self, vads, **kwargs):
+        super(FakeTask, self).__init__(
+            RealVadRoot=FakeVadRoot(vads), name="test.exe", pid=1,
+            Pcb=utils.AttributeDict(
+                DirectoryTableBase=utils.AttributeDict(v=lambda: 0x1000)),
+            **kwargs)
+
+
+def FakeVad(start, end, protection, filename=None):
+    vad = utils.AttributeDict(
+        Start=start, End=end, obj_offset=start * 2,
+        u=utils.AttributeDict(VadFlags=utils.AttributeDict(
+            ProtectionEnum=protection)))
+
+    if filename is not None:
+        vad.ControlArea = utils.AttributeDict(
+            FilePointer=utils.AttributeDict(FileName=filename))
+
+    return vad
+
+
+class VadIndexTest(unittest.TestCase):
+    """Test the VAD interval index."""
+
+    def setUp(self):
+        self.session = session.Session()
+        self.task = FakeTask([
+            FakeVad(0x50000, 0x5ffff, "EXECUTE_WRITECOPY", u"foo.dll"),
+            FakeVad(0x10000, 0x10fff, "READWRITE"),
+            FakeVad(0x20000, 0x2ffff, "READONLY", u"")],
+                             obj_session=self.session, obj_offset=0x8000)
+
+    def testLookup(self):
+        index = vadinfo.GetVadIndex(self.task)
+        self.assertEqual(len(index), 3)
+        self.assertEqual([x[0] for x in index], [0x10000, 0x20000, 0x50000])
+
+        self.assertEqual(index.Lookup(0xffff), None)
+        self.assertEqual(index.Lookup(0x10000),
+                         (0x10000, 0x10fff, "READWRITE", u"", 0x20000))
+        self.assertEqual(index.Lookup(0x10fff)[0], 0x10000)
+        self.assertEqual(index.Lookup(0x11000), None)
+        self.assertEqual(index.Lookup(0x2abcd)[3], u"Pagefile-backed section")
+        self.assertEqual(index.Lookup(0x5ffff)[2:4],
+                         ("EXECUTE_WRITECOPY", u"foo.dll"))
+        self.assertEqual(index.Lookup(0x60000), None)
+
+        # The index is built once and shared through the session.
+        self.assertTrue(vadinfo.GetVadIndex(self.task) is index)
+        self.assertEqual(self.task.RealVadRoot.traversals, 1)
+
+        self.session.Reset()
+        self.assertFalse(vadinfo.GetVadIndex(self.task) is index)
+        self.assertEqual(self.task.RealVadRoot.traversals, 2)
 
 
 class TestVadInfo(testlib.SimpleTestCase):
@@ -49,3 +123,4 @@ class TestVad(testlib.RekallBaseUnitTestCase):
     def testVad(self):
         for x, y in zip(self.baseline['output'], self.current['output']):
             self.assertTableRowsEqual(x, y)
+
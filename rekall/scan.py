@@ -21,19 +21,97 @@
 __author__ = "Michael Cohen <scudette@gmail.com>"
 
 import ahocorasick
+import multiprocessing
 import re
+import sys
 
 from rekall import addrspace
 from rekall import constants
 from rekall import registry
 
 
+def ImageAddressSpace(address_space):
+    """Returns the file backed address space at the bottom of the stack.
+
+    Returns None if the image can not be reopened by forked worker processes.
+    """
+    # Workers rely on inheriting their state through fork().
+    if sys.platform.startswith("win"):
+        return
+
+    while address_space.base not in (None, address_space):
+        address_space = address_space.base
+
+    if (getattr(address_space, "fhandle", None) is not None and
+            getattr(address_space, "fname", None) and
+            not getattr(address_space, "writeable", False)):
+        return address_space
+
+
+# The object worked on by a ForkPool worker process.
+_FORK_WORKER = None
+
+
+def _InitForkWorker(worker, image):
+    """Prepares a forked worker process."""
+    global _FORK_WORKER  # pylint: disable=global-statement
+
+    # The file handle is shared with the parent after the fork, so each worker
+    # needs its own to seek independently.
+    image.fhandle = open(image.fname, "rb")
+
+    # Progress is reported by the parent.
+    worker.session.progress = None
+    _FORK_WORKER = worker
+
+
+def _RunForkWork(args):
+    function, item = args
+    return function(_FORK_WORKER, item)
+
+
+class ForkPool(object):
+    """A pool of forked worker processes sharing an object with the parent.
+
+    Each worker inherits the object (e.g. a scanner or plugin) through fork(),
+    and reopens the image (see ImageAddressSpace()) for itself:
+
+    with ForkPool(scanner, image, workers=4) as pool:
+        for result in pool.imap(_ScanShard, shards):
+            ...
+
+    The workers are killed when leaving the block, even if some work remains.
+    """
+
+    def __init__(self, worker, image, workers):
+        self.pool = multiprocessing.Pool(
+            workers, initializer=_InitForkWorker, initargs=(worker, image))
+
+    def imap(self, function, items):
+        """Yields function(worker, item) for each item, in order.
+
+        The function must be a module level function, so it can be sent to the
+        workers, and its results must be picklable.
+        """
+        return self.pool.imap(_RunForkWork, [(function, x) for x in items])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, unused_type, unused_value, unused_traceback):
+        self.pool.terminate()
+
+
 class BaseScanner(object):
     """ A more thorough scanner which checks every byte """
 
     __metaclass__ = registry.MetaclassRegistry
 
     checks = []
+
+    # The amount of mapped data each shard covers (see shards()).
+    SHARD_SIZE = 64 * 1024 * 1024
+
     def __init__(self, profile=None, address_space=None, window_size=8,
                  session=None):
         """The base scanner.
@@ -53,6 +131,46 @@ class BaseScanner(object):
         self.scan_buffer_offset = None
         self.buffer_as = addrspace.BufferAddressSpace(session=self.session)
 
+    def image_address_space(self):
+        """Returns the file backed address space at the bottom of the stack.
+
+        Returns None if the image can not be reopened by worker processes.
+        """
+        return ImageAddressSpace(self.address_space)
+
+    def shards(self, offset, end):
+        """Splits the address ranges between offset and end into shards.
+
+        Yields:
+          (offset, length) tuples, each covering about SHARD_SIZE bytes of
+          mapped data. Hits near the end of a shard are still found since the
+          scanner reads its overlap past the end of each chunk.
+        """
+        shard_start = None
+        shard_data = 0
+        position = offset
+        for range_start, _, length in self.address_space.get_address_ranges(
+                offset, end):
+            position = max(range_start, offset)
+            range_end = min(range_start + length, end)
+
+            while position < range_end:
+                if shard_start is None:
+                    shard_start = position
+
+                available = min(range_end - position,
+                                self.SHARD_SIZE - shard_data)
+                position += available
+                shard_data += available
+
+                if shard_data >= self.SHARD_SIZE:
+                    yield shard_start, position - shard_start
+                    shard_start = None
+                    shard_data = 0
+
+        if shard_start is not None:
+            yield shard_start, position - shard_start
+
     def build_constraints(self):
         self.constraints = []
         for class_name, args in self.checks:
@@ -63,6 +181,14 @@ class BaseScanner(object):
         self.skippers = [c for c in self.constraints if hasattr(c, "skip")]
         self.hits = None
 
+        # The first check able to enumerate all its candidate offsets in a
+        # buffer at once drives the bulk scanning engine (see scan_buffer()).
+        self.bulk_check = None
+        for check in self.constraints:
+            if check.bulk:
+                self.bulk_check = check
+                break
+
     def check_addr(self, offset, buffer_as=None):
         """Calls our constraints on the offset and returns if any contraints did
         not match.
@@ -100,6 +226,37 @@ class BaseScanner(object):
 
         return skip
 
+    def scan_buffer(self, buffer_as, offset, end):
+        """Yields all the hits in buffer_as between offset and end.
+
+        If one of our checks can enumerate its candidate offsets in bulk, we
+        only need to validate those candidates with the full set of checks. This
+        avoids calling into every check (and skipper) at each offset from
+        Python.
+
+        Otherwise we fall back to walking the buffer offset by offset, skipping
+        as much data as the skippers tell us to.
+        """
+        if self.bulk_check is not None:
+            for candidate in self.bulk_check.candidates(
+                buffer_as, offset, end):
+                res = self.check_addr(candidate, buffer_as=buffer_as)
+                if res is not None:
+                    yield res
+
+            return
+
+        scan_offset = offset
+        while scan_offset < end:
+            # Check the current offset for a match.
+            res = self.check_addr(scan_offset, buffer_as=buffer_as)
+            if res is not None:
+                yield res
+
+            # Skip as much data as the skippers tell us to.
+            scan_offset += min(end - offset,
+                               self.skip(buffer_as, scan_offset))
+
     overlap = 1024
     def scan(self, offset=0, maxlen=None):
         """Scan the region from offset for maxlen.
@@ -180,18 +337,11 @@ class BaseScanner(object):
 
                     base_offset=chunk_offset)
 
-                scan_offset = chunk_offset
-                while scan_offset < chunk_offset + chunk_size:
-                    # Check the current offset for a match.
-                    res = self.check_addr(scan_offset, buffer_as=buffer_as)
-                    if res is not None:
-                        yield res
-
-                    # Skip as much data as the skippers tell us to.
-                    scan_offset += min(chunk_size,
-                                       self.skip(buffer_as, scan_offset))
+                for res in self.scan_buffer(
+                    buffer_as, chunk_offset, chunk_offset + chunk_size):
+                    yield res
 
-                chunk_offset = scan_offset
+                chunk_offset += chunk_size
 
 
 class PointerScanner(BaseScanner):
@@ -241,6 +391,9 @@ class ScannerCheck(object):
     __metaclass__ = registry.MetaclassRegistry
     __abstract = True
 
+    # Set to True if this check implements candidates().
+    bulk = False
+
     def __init__(self, profile=None, address_space=None, **_kwargs):
         """The profile that this scanner check should use."""
         self.profile = profile
@@ -276,10 +429,41 @@ class ScannerCheck(object):
         _ = offset
         return 0
 
+    def candidates(self, buffer_as, offset, end):
+        """Yields all the offsets between offset and end which may match.
+
+        Checks which can cheaply locate all their possible matches in the entire
+        buffer at once (e.g. using str.find() or a regex) should define this
+        method and set bulk = True. The scanner then only calls the full set of
+        checks on these candidates, instead of on every offset in the buffer.
+
+        Every offset for which check() returns True must be produced, but not
+        every produced offset has to pass check().
+
+        Args:
+          buffer_as: A BufferAddressSpace instance wrapping self.address_space,
+          containing a copy of the data at the specified offset.
+
+          offset: The first offset in the address space to consider.
+
+          end: Candidates must be smaller than this offset.
+
+        Yields:
+          offsets in the address space in increasing order.
+        """
+        _ = buffer_as
+        _ = end
+        return iter(xrange(offset, end))
+
 
 class MultiStringFinderCheck(ScannerCheck):
     """A scanner checker for multiple strings."""
 
+    bulk = True
+
+    # The offset of the needles relative to the offset being checked.
+    needle_offset = 0
+
     def __init__(self, needles=None, **kwargs):
         """
         Args:
@@ -289,6 +473,7 @@ class MultiStringFinderCheck(ScannerCheck):
         if not needles:
             needles = []
 
+        self.needles = needles
         self.tree = ahocorasick.KeywordTree()
 
         for needle in needles:
@@ -320,13 +505,30 @@ class MultiStringFinderCheck(ScannerCheck):
         # Go to the next hit.
         return self.next_hit[0] - data_offset
 
+    def candidates(self, buffer_as, offset, end):
+        data_offset = buffer_as.get_buffer_offset(offset)
+        data_end = buffer_as.get_buffer_offset(end)
+
+        while data_offset < data_end:
+            hit = self.tree.search(buffer_as.data, data_offset)
+            if hit is None or hit[0] >= data_end:
+                return
+
+            yield hit[0] + buffer_as.base_offset
+            data_offset = hit[0] + 1
+
 
 class StringCheck(ScannerCheck):
     maxlen = 100
+    bulk = True
+
+    # The offset of the needle relative to the offset being checked.
+    needle_offset = 0
 
     def __init__(self, needle=None, **kwargs):
         super(StringCheck, self).__init__(**kwargs)
         self.needle = needle
+        self.needles = [needle]
 
     def check(self, buffer_as, offset):
         # Just check the buffer without needing to copy it on slice.
@@ -343,10 +545,26 @@ class StringCheck(ScannerCheck):
         # Skip entire region.
         return buffer_as.end() - offset
 
+    def candidates(self, buffer_as, offset, end):
+        data = buffer_as.data
+        buffer_offset = buffer_as.get_buffer_offset(offset)
+
+        # The needle may extend past end, as long as it starts before it.
+        buffer_end = buffer_as.get_buffer_offset(end) + len(self.needle) - 1
+
+        while True:
+            dindex = data.find(self.needle, buffer_offset, buffer_end)
+            if dindex == -1:
+                return
+
+            yield dindex + buffer_as.base_offset
+            buffer_offset = dindex + 1
+
 
 class RegexCheck(ScannerCheck):
     """This check can be quite slow."""
     maxlen = 100
+    bulk = True
 
     def __init__(self, regex=None, **kwargs):
         super(RegexCheck, self).__init__(**kwargs)
@@ -358,6 +576,18 @@ class RegexCheck(ScannerCheck):
 
         return bool(m)
 
+    def candidates(self, buffer_as, offset, end):
+        buffer_offset = buffer_as.get_buffer_offset(offset)
+        buffer_end = buffer_as.get_buffer_offset(end)
+
+        while buffer_offset < buffer_end:
+            m = self.regex.search(buffer_as.data, buffer_offset)
+            if m is None or m.start() >= buffer_end:
+                return
+
+            yield m.start() + buffer_as.base_offset
+            buffer_offset = m.start() + 1
+
 
 class ScannerGroup(BaseScanner):
     """Runs a bunch of scanners in one pass over the image."""
@@ -395,6 +625,100 @@ class ScannerGroup(BaseScanner):
             available_length -= constants.SCAN_BLOCKSIZE
 
 
+class MultiStringScannerGroup(ScannerGroup):
+    """Runs a bunch of scanners in a single pass over the image.
+
+    ScannerGroup reads each block once, but still runs every member scanner over
+    it in turn. Here the string checks which drive the member scanners (see
+    ScannerCheck.candidates()) are merged into a single ahocorasick automaton,
+    so each block is traversed once for all scanners. Every hit of the automaton
+    is then validated by the scanner(s) owning the needle.
+
+    Member scanners without a string check are still supported - they are
+    simply run over the same buffer.
+    """
+
+    def build_constraints(self):
+        self.constraints = []
+        self.bulk_check = None
+
+        # Maps each needle to a list of (name, scanner, needle_offset) tuples.
+        self.owners = {}
+
+        # Scanners which can not be merged into the automaton.
+        self.other_scanners = []
+
+        for name, scanner in sorted(self.scanners.items()):
+            scanner.build_constraints()
+            self.overlap = max(self.overlap, scanner.overlap)
+
+            needles = getattr(scanner.bulk_check, "needles", None)
+            if not needles:
+                self.other_scanners.append((name, scanner))
+                continue
+
+            for needle in needles:
+                self.owners.setdefault(needle, []).append(
+                    (name, scanner, scanner.bulk_check.needle_offset))
+
+        self.tree = ahocorasick.KeywordTree()
+        for needle in self.owners:
+            self.tree.add(needle)
+
+        self.tree.make()
+
+        # The automaton only reports a single needle at each offset so we need
+        # to check for other needles starting at the same place.
+        self.needle_lengths = sorted(set(len(x) for x in self.owners))
+
+        offsets = [x[2] for owners in self.owners.values() for x in owners]
+        self.min_needle_offset = min(offsets or [0])
+        self.max_needle_offset = max(offsets or [0])
+
+    def _automaton_hits(self, buffer_as, offset, end):
+        """Yields (hit, name) for all scanners merged in the automaton."""
+        data = buffer_as.data
+        data_offset = buffer_as.get_buffer_offset(
+            offset + self.min_needle_offset)
+        data_end = buffer_as.get_buffer_offset(end + self.max_needle_offset)
+
+        while data_offset < data_end:
+            hit = self.tree.search(data, data_offset)
+            if hit is None or hit[0] >= data_end:
+                return
+
+            for length in self.needle_lengths:
+                owners = self.owners.get(data[hit[0]:hit[0] + length])
+                for name, scanner, needle_offset in owners or []:
+                    candidate = (buffer_as.base_offset + hit[0] -
+                                 needle_offset)
+
+                    if (offset <= candidate < end and
+                            scanner.check_addr(
+                                candidate, buffer_as=buffer_as) is not None):
+                        yield candidate, name
+
+            data_offset = hit[0] + 1
+
+    def scan_buffer(self, buffer_as, offset, end):
+        hits = []
+        if self.owners:
+            hits.extend(self._automaton_hits(buffer_as, offset, end))
+
+        for name, scanner in self.other_scanners:
+            for hit in scanner.scan_buffer(buffer_as, offset, end):
+                hits.append((hit, name))
+
+        # Keep the output ordered by offset.
+        for hit, name in sorted(hits):
+            yield name, hit
+
+    def scan(self, offset=0, maxlen=None):
+        """Yields tuples of (scanner name, hit offset) in a single pass."""
+        for match in BaseScanner.scan(self, offset=offset, maxlen=maxlen):
+            yield match
+
+
 class DiscontigScannerGroup(ScannerGroup):
     """A scanner group which works over a virtual address space."""
 
@@ -0,0 +1,78 @@
+import unittest
+
+from rekall import addrspace
+from rekall import scan
+from rekall import session
+
+
+class StringScanner(scan.BaseScanner):
+    checks = [("StringCheck", dict(needle="needle"))]
+
+
+class RegexScanner(scan.BaseScanner):
+    checks = [("RegexCheck", dict(regex="ne+dle"))]
+
+
+class MultiStringScanner(scan.BaseScanner):
+    checks = [("MultiStringFinderCheck", dict(needles=["needle", "dlex"]))]
+
+
+class BulkScannerTest(unittest.TestCase):
+    """Test the bulk candidate scanning engine."""
+
+    def setUp(self):
+        self.session = session.Session()
+        self.data = "xxneedlexxxneedleneedle" + "x" * 100 + "needle"
+
+    def _scan(self, scanner_cls, bulk):
+        address_space = addrspace.BufferAddressSpace(
+            data=self.data, session=self.session)
+        scanner = scanner_cls(address_space=address_space,
+                              session=self.session)
+        scanner.build_constraints()
+        if not bulk:
+            scanner.bulk_check = None
+
+        return list(scanner.scan(maxlen=len(self.data)))
+
+    def testStringCheck(self):
+        expected = [2, 11, 17, 123]
+        self.assertEqual(self._scan(StringScanner, True), expected)
+        self.assertEqual(self._scan(StringScanner, False), expected)
+
+    def testRegexCheck(self):
+        expected = [2, 11, 17, 123]
+        self.assertEqual(self._scan(RegexScanner, True), expected)
+        self.assertEqual(self._scan(RegexScanner, False), expected)
+
+    def testCandidatesBounds(self):
+        check = scan.StringCheck(needle="needle")
+        buffer_as = addrspace.BufferAddressSpace(
+            data=self.data, base_offset=0x1000, session=self.session)
+
+        # Hits may only start before the end, but may extend past it.
+        self.assertEqual(
+            list(check.candidates(buffer_as, 0x1002, 0x1012)),
+            [0x1002, 0x100b, 0x1011])
+
+    def testMultiStringScannerGroup(self):
+        address_space = addrspace.BufferAddressSpace(
+            data=self.data, session=self.session)
+
+        group = scan.MultiStringScannerGroup(
+            address_space=address_space, session=self.session,
+            scanners=dict(
+                string=StringScanner(session=self.session),
+                regex=RegexScanner(session=self.session),
+                multi=MultiStringScanner(session=self.session)))
+
+        self.assertEqual(
+            list(group.scan(maxlen=len(self.data))),
+            [("multi", 2), ("regex", 2), ("string", 2),
+             ("multi", 5), ("multi", 11), ("regex", 11), ("string", 11),
+             ("multi", 17), ("regex", 17), ("string", 17), ("multi", 20),
+             ("multi", 123), ("regex", 123), ("string", 123)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -34,6 +34,7 @@ import sys
 import time
 
 from rekall import addrspace
+from rekall import cache
 from rekall import config
 from rekall import constants
 from rekall import io_manager
@@ -68,6 +69,16 @@ config.DeclareOption(
     help="The maximum size of buffers we are allowed to read. "
     "This is used to control Rekall memory usage.")
 
+config.DeclareOption(
+    "--memoize_structs", default=False, action="store_true",
+    help="Cache struct members and their values once read. This speeds up "
+    "analysis of static images but must not be used on live memory.")
+
+config.DeclareOption(
+    "--cache_compiled_types", default=False, action="store_true",
+    help="Keep the profile types compiled by each session in the disk cache "
+    "so later sessions using the same profile start faster.")
+
 
 class Container(object):
     """Just a container."""
@@ -183,10 +194,10 @@ class Session(object):
         self.profile = obj.NoneObject("Set this to a valid profile "
                                       "(e.g. type profiles. and tab).")
 
-        # Cache the profiles we get from LoadProfile() below.
-        # TODO: This should probably be also done on disk somewhere to avoid
-        # having to hit the profile repository all the time.
+        # Cache the profiles we get from LoadProfile() below. The decoded
+        # profile data is also cached on disk in the disk_cache.
         self.profile_cache = {}
+        self.disk_cache = cache.DiskCache(session=self)
 
         self.entities = entity.EntityCache(session=self)
 
@@ -198,8 +209,28 @@ class Session(object):
     def Reset(self):
         self.physical_address_space = None
         self.kernel_address_space = None
+        self.image_state = None
+        self.plugin_results = None
+        self.block_caches = None
+        self.vad_indexes = None
+        self.reverse_maps = None
         self.state.cache.clear()
 
+    def GetImageState(self):
+        """Returns the cache.ImageState for the current image (or None)."""
+        if self.image_state is None:
+            filename = self.state.filename
+            if not filename or self.GetParameter("no_image_state"):
+                return
+
+            fingerprint = cache.ImageFingerprint(filename)
+            if fingerprint is None:
+                return
+
+            self.image_state = cache.ImageState(self.disk_cache, fingerprint)
+
+        return self.image_state
+
     def UpdateFromConfigObject(self):
         """This method is called whenever the config object was updated.
 
@@ -278,7 +309,20 @@ class Session(object):
     def _RunParameterHook(self, name):
         hook = self._parameter_hooks.get(name)
         if hook:
-            result = hook.calculate()
+            image_state = hook.persistent and self.GetImageState()
+            result = None
+            if image_state:
+                try:
+                    result = hook.Deserialize(image_state.Get(name))
+                except KeyError:
+                    pass
+
+            if result is None:
+                result = hook.calculate()
+                if image_state and not (
+                        result is None or isinstance(result, obj.NoneObject)):
+                    image_state.Put(name, hook.Serialize(result))
+
             if result is None:
                 # Set a NoneObject here so that the hook does not get called
                 # again - this effectively caches the failure of the hook in
@@ -373,6 +417,8 @@ class Session(object):
             finally:
                 ui_renderer.end()
 
+            self.StoreCompiledTypes()
+
             # If there was too much data and a pager is specified, simply pass
             # the data to the pager:
             if (ui_renderer.isatty and pager and
@@ -437,9 +483,8 @@ class Session(object):
         # The filename is a path we try to open it directly:
         if filename.startswith("/") or filename.startswith("."):
             container = io_manager.Factory(os.path.dirname(filename))
-            result = obj.Profile.LoadProfileFromData(
-                container.GetData(os.path.basename(filename)),
-                self, name=canonical_name)
+            result = self._LoadProfileFromContainer(
+                container, os.path.basename(filename), canonical_name)
 
         # Traverse the profile path until one works.
         else:
@@ -453,9 +498,8 @@ class Session(object):
 
                 try:
                     manager = io_manager.Factory(path)
-                    result = obj.Profile.LoadProfileFromData(
-                        manager.GetData(filename), self,
-                        name=canonical_name)
+                    result = self._LoadProfileFromContainer(
+                        manager, filename, canonical_name)
                     logging.info(
                         "Loaded profile %s from %s", filename, manager)
 
@@ -468,6 +512,13 @@ class Session(object):
 
                     continue
 
+        if result and self.GetParameter("cache_compiled_types"):
+            try:
+                result.precompiled_types = self.disk_cache.Get(
+                    "compiled_types", canonical_name)
+            except KeyError:
+                pass
+
         # Cache it for later. Note that this also caches failures so we do not
         # retry again.
         self.profile_cache[canonical_name] = result
@@ -477,6 +528,51 @@ class Session(object):
 
         return result
 
+    def _LoadProfileFromContainer(self, container, name, canonical_name):
+        """Loads the profile stored in the container member.
+
+        The profile's state is cached on disk under the container's cache key
+        for the member, so an unchanged profile is neither fetched nor parsed
+        again.
+        """
+        key = container.CacheKey(name)
+        if key is not None:
+            try:
+                return obj.Profile.LoadProfileFromState(
+                    self.disk_cache.Get("profiles", key, use_json=True),
+                    self, name=canonical_name)
+            except KeyError:
+                pass
+
+        data = container.GetData(name)
+        result = obj.Profile.LoadProfileFromData(
+            data, self, name=canonical_name)
+
+        # Symlink profiles return the target profile, which is cached under
+        # its own name.
+        if (key is not None and isinstance(result, obj.Profile) and
+                data["$METADATA"].get("Type") != "Symlink"):
+            state = result.GetSetupState()
+            if state is not None:
+                self.disk_cache.Put("profiles", key, state, use_json=True)
+
+        return result
+
+    def StoreCompiledTypes(self):
+        """Stores the types compiled by the current profile in the disk cache.
+
+        The next session loading the profile can then skip applying the
+        overlays to these types (see obj.Profile.GetCompiledTypes()).
+        """
+        profile = self.profile
+        if not profile or not self.GetParameter("cache_compiled_types"):
+            return
+
+        compiled_types = profile.GetCompiledTypes()
+        if len(compiled_types) > len(profile.precompiled_types):
+            self.disk_cache.Put("compiled_types", profile.name, compiled_types)
+            profile.precompiled_types = compiled_types
+
     def __unicode__(self):
         return u"Session"
 
@@ -55,10 +55,12 @@ import subprocess
 import pdb
 import os
 import shutil
+import struct
 import sys
 import tempfile
 import unittest
 
+from rekall import addrspace
 from rekall import plugin
 from rekall import registry
 from rekall import session as rekall_session
@@ -404,3 +406,98 @@ class HashChecker(RekallBaseUnitTestCase):
 
     def testHashes(self):
         self.assertEqual(self.baseline['hashes'], self.current['hashes'])
+
+
+class SyntheticPageTables(object):
+    """Builds page tables in a buffer of fake physical memory.
+
+    This allows paged address spaces to be exercised without an image:
+
+    tables = SyntheticPageTables("amd64")
+    tables.map(0xfffff80000001000, 0x5000)
+    tables.write(0x5000, "hello")
+
+    kernel_as = amd64.AMD64PagedMemory(
+        base=tables.address_space(session), dtb=tables.dtb, session=session)
+
+    Page tables are allocated from table_base upwards, so data pages should be
+    mapped below it.
+    """
+
+    # For each paging mode: the size of an entry and the (shift, bits) of the
+    # virtual address used to index each level of the tables.
+    LAYOUTS = {
+        "ia32": (4, [(22, 10), (12, 10)]),
+        "pae": (8, [(30, 2), (21, 9), (12, 9)]),
+        "amd64": (8, [(39, 9), (30, 9), (21, 9), (12, 9)]),
+        }
+
+    PRESENT = 0x3
+    PAGE_SIZE_FLAG = 0x80
+
+    def __init__(self, mode="amd64", table_base=0x1000000):
+        self.entry_size, self.levels = self.LAYOUTS[mode]
+        self.mode = mode
+        self.memory = bytearray()
+        self.next_table = table_base
+        self.dtb = self._allocate_table()
+
+    def _allocate_table(self):
+        result = self.next_table
+        self.next_table += 0x1000
+        self.write(result, "\x00" * 0x1000)
+        return result
+
+    def write(self, paddr, data):
+        """Writes data into physical memory, growing it as needed."""
+        end = paddr + len(data)
+        if end > len(self.memory):
+            self.memory.extend("\x00" * (end - len(self.memory)))
+
+        self.memory[paddr:end] = data
+
+    def _read_entry(self, addr):
+        data = str(self.memory[addr:addr + self.entry_size])
+        return struct.unpack(
+            "<I" if self.entry_size == 4 else "<Q",
+            data.ljust(self.entry_size, "\x00"))[0]
+
+    def _write_entry(self, addr, value):
+        self.write(addr, struct.pack(
+            "<I" if self.entry_size == 4 else "<Q", value))
+
+    def map(self, vaddr, paddr, page_size=0x1000, flags=None):
+        """Maps the virtual page at vaddr to the physical page at paddr.
+
+        page_size may also be a large page size supported by the mode (e.g.
+        0x200000 or 0x40000000 for amd64). flags overrides the flags of the
+        final entry (e.g. to create transition or invalid entries).
+        """
+        table = self.dtb
+        for i, (shift, bits) in enumerate(self.levels):
+            entry_addr = table + ((vaddr >> shift) & ((1 << bits) - 1)) * (
+                self.entry_size)
+
+            if 1 << shift == page_size:
+                if flags is None:
+                    flags = self.PRESENT
+                    if i < len(self.levels) - 1:
+                        flags |= self.PAGE_SIZE_FLAG
+
+                self._write_entry(entry_addr, paddr | flags)
+                return
+
+            # Replace anything which is not a table with a new table.
+            entry = self._read_entry(entry_addr)
+            if not entry & 1 or entry & self.PAGE_SIZE_FLAG:
+                entry = self._allocate_table() | self.PRESENT
+                self._write_entry(entry_addr, entry)
+
+            table = entry & ~0xfff
+
+        raise ValueError("Page size %#x not supported." % page_size)
+
+    def address_space(self, session):
+        """Returns the physical memory as an address space."""
+        return addrspace.BufferAddressSpace(
+            data=str(self.memory), session=session)
@@ -56,7 +56,7 @@ config.DeclareOption(
 config.DeclareOption(
     "--renderer", default="TextRenderer", group="Interface",
     help="The renderer to use. e.g. (TextRenderer, "
-    "JsonRenderer).")
+    "JsonRenderer, StreamingJsonRenderer).")
 
 config.DeclareOption(
     "--nocolors", default=False, action="store_true", group="Interface",
@@ -814,11 +814,15 @@ class JsonTable(TextTable):
     def get_header(self, renderer):
         return [c.render_header() for c in self.columns]
 
-    def render_row(self, renderer, row=None, **_):
+    def get_row(self, row):
         data = {}
         for c, obj in zip(self.columns, row):
             data[c.cname] = c.render_cell(obj)
-        renderer.table_data.append(data)
+
+        return data
+
+    def render_row(self, renderer, row=None, **_):
+        renderer.table_data.append(self.get_row(row))
 
 
 class JsonRenderer(TextRenderer):
@@ -866,6 +870,82 @@ class JsonRenderer(TextRenderer):
         self.data['data'].append(data)
 
 
+class StreamingJsonRenderer(JsonRenderer):
+    """Render the output as a stream of json objects, one per line (NDJSON).
+
+    The JsonRenderer keeps all the output in memory until the plugin is done.
+    This renderer writes every row as soon as it is produced, so memory use
+    does not grow with the output and other tools can read the results while
+    the plugin is still running.
+
+    Each line is a json object with a "type" of metadata, table_header, row,
+    format, section, text or end.
+    """
+
+    # The output is flushed after this many lines or seconds.
+    FLUSH_LINES = 100
+    FLUSH_INTERVAL = 1.0
+
+    started = False
+
+    def start(self, plugin_name=None, kwargs=None):
+        self.formatter = JsonFormatter()
+        self.table = None
+        self.rows = 0
+        self.pending_lines = 0
+        self.last_flush = time.time()
+
+        # Skip JsonRenderer.start() - we do not collect the data.
+        TextRenderer.start(self, plugin_name=plugin_name, kwargs=kwargs)
+
+        if plugin_name is not None:
+            self.started = True
+            self.write_record(
+                "metadata", plugin_name=plugin_name, tool_name="rekall-ng",
+                tool_version=constants.VERSION,
+                kwargs=self.formatter.format_dict(kwargs or {}))
+
+    def end(self):
+        TextRenderer.end(self)
+
+        # Some plugins end the renderer themselves.
+        if self.started:
+            self.started = False
+            self.write_record("end", rows=self.rows)
+            self.flush()
+
+    def write_record(self, record_type, **record):
+        """Writes a single json object on its own line."""
+        record["type"] = record_type
+        self.fd.write(json.dumps(record) + "\n")
+
+        self.pending_lines += 1
+        now = time.time()
+        if (self.pending_lines >= self.FLUSH_LINES or
+                now - self.last_flush >= self.FLUSH_INTERVAL):
+            self.fd.flush()
+            self.pending_lines = 0
+            self.last_flush = now
+
+    def format(self, formatstring, *args):
+        self.write_record("format", data=[formatstring] + [
+            self.formatter.format_field(arg, "s") for arg in args])
+
+    def section(self, name=None, width=50):
+        self.write_record("section", name=name)
+
+    def table_header(self, columns=None, **kwargs):
+        self.table = JsonTable(columns=columns)
+        self.write_record("table_header", headers=self.table.get_header(self))
+
+    def table_row(self, *args, **kwargs):
+        self.rows += 1
+        self.write_record("row", data=self.table.get_row(args))
+
+    def write(self, data):
+        self.write_record("text", data=data)
+
+
 class TestRenderer(TextRenderer):
     """A special renderer which makes parsing the output of tables easier."""
 
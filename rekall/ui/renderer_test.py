@@ -0,0 +1,72 @@
+import json
+import StringIO
+import unittest
+
+from rekall import obj
+from rekall import session
+from rekall.ui import renderer
+
+
+class FlushCountingFD(StringIO.StringIO):
+    flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+
+
+class StreamingJsonRendererTest(unittest.TestCase):
+    """Test the NDJSON renderer."""
+
+    def setUp(self):
+        self.fd = FlushCountingFD()
+        self.renderer = renderer.StreamingJsonRenderer(
+            session=session.Session(), fd=self.fd)
+        self.renderer.FLUSH_LINES = 3
+
+    def GetRecords(self):
+        return [json.loads(x) for x in self.fd.getvalue().splitlines()]
+
+    def testRender(self):
+        self.renderer.start()
+        self.renderer.start(plugin_name="test", kwargs=dict(pid=4))
+        self.renderer.section("Pid 4")
+        self.renderer.format("Process {0}\n", "System")
+        self.renderer.table_header([("Offset", "offset", "[addrpad]"),
+                                    ("Name", "name", "")])
+
+        for i in range(5):
+            self.renderer.table_row(i * 0x10, u"file%d" % i)
+
+            # Rows are written out as they are produced.
+            self.assertEqual(len(self.GetRecords()), 4 + i + 1)
+
+        self.renderer.table_row(0, obj.NoneObject("Invalid"))
+
+        # Some plugins end the renderer themselves.
+        self.renderer.end()
+        self.renderer.end()
+
+        records = self.GetRecords()
+        self.assertEqual([x["type"] for x in records],
+                         ["metadata", "section", "format", "table_header"] +
+                         ["row"] * 6 + ["end"])
+
+        self.assertEqual(records[0]["plugin_name"], "test")
+        self.assertEqual(records[0]["kwargs"]["pid"], dict(value=4))
+        self.assertEqual(records[1]["name"], "Pid 4")
+        self.assertEqual(records[2]["data"],
+                         ["Process {0}\n", dict(value="System")])
+        self.assertEqual(records[3]["headers"], ["offset", "name"])
+        self.assertEqual(records[6]["data"], dict(
+            offset=dict(value=0x20), name=dict(value="file2")))
+        self.assertEqual(records[9]["data"]["name"]["rekall_reason"],
+                         "Invalid")
+        self.assertEqual(records[-1]["rows"], 6)
+
+        # Nothing is kept in memory, and the output is flushed as we go.
+        self.assertEqual(self.renderer.data, [])
+        self.assertTrue(self.fd.flushes >= len(records) / 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -21,6 +21,7 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 
 """These are various utilities for rekall."""
+import array
 import bisect
 import importlib
 import itertools
@@ -48,6 +49,20 @@ def SmartUnicode(string, encoding="utf8"):
         return str(string).decode(encoding, "ignore")
 
 
+def AddressArray(data=""):
+    """A compact array of 64 bit addresses.
+
+    The array module has no portable 64 bit type, so we fall back to a list on
+    platforms where a long is only 32 bits.
+    """
+    if array.array("L").itemsize == 8:
+        result = array.array("L")
+        result.fromstring(data)
+        return result
+
+    return list(data or [])
+
+
 def Hexdump(data, width=16):
     """ Hexdump function shared by various plugins """
     for offset in xrange(0, len(data), width):
@@ -118,6 +133,7 @@ class LinkedList(object):
         last_node.next = node
         node.prev = last_node
         node.next = self
+        self.prev = node
 
         return node
 
@@ -135,7 +151,7 @@ class LinkedList(object):
         if self.prev is self:
             raise IndexError("Pop from empty list.")
 
-        last_node = self.tail
+        last_node = self.prev
         self.Unlink(last_node)
         return last_node.data
 
@@ -29,6 +29,9 @@ try:
 except ImportError:
     from distutils.core import find_packages, setup
 
+from distutils.command.build_ext import build_ext
+from distutils.core import Extension
+
 # Change PYTHONPATH to include rekall so that we can get the version.
 sys.path.insert(0, '.')
 
@@ -40,6 +43,26 @@ __author__ = "Michael Cohen <scudette@gmail.com>"
 
 rekall_description = "Rekall Memory Forensic Framework"
 
+
+class OptionalBuildExt(build_ext):
+    """Do not fail the installation if the C extensions can not be built.
+
+    The C support module only accelerates some address spaces - Rekall falls
+    back to the pure python implementations when it is missing.
+    """
+
+    def run(self):
+        try:
+            build_ext.run(self)
+        except Exception as e:  # pylint: disable=broad-except
+            print "Unable to build the C support module: %s" % e
+
+    def build_extension(self, ext):
+        try:
+            build_ext.build_extension(self, ext)
+        except Exception as e:  # pylint: disable=broad-except
+            print "Unable to build %s: %s" % (ext.name, e)
+
 setup(
     name="rekall",
     version=constants.VERSION,
@@ -59,6 +82,12 @@ setup(
     package_dir={'rekall': 'rekall'},
     packages=find_packages('.'),
     package_data={},
+    ext_modules=[
+        Extension("rekall.support",
+                  sources=["src/support.c"],
+                  depends=["src/support.h"]),
+        ],
+    cmdclass={"build_ext": OptionalBuildExt},
 
     entry_points={
         "console_scripts": [
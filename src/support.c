@@ -8,43 +8,64 @@
 #include "support.h"
 
 
-static int _read_from_python_base(AMD64PagedMemory *self,
-                                  uint64_t offset,
-                                  uint64_t length, char *out) {
-  PyObject *buffer = PyObject_CallMethod(self->base, "read", "Ki", offset,
-                                         length);
-  char *data;
-  Py_ssize_t buffer_length;
-
-  if (!buffer) goto error;
-
-  PyString_AsStringAndSize(buffer, &data, &buffer_length);
-
-  memcpy(out, data, MIN(length, buffer_length));
-
-  Py_DecRef(buffer);
-
-  return buffer_length;
+static paging_mode paging_modes[] = {
+  // Bits 31:22 index the page directory, bits 21:12 the page table.
+  {"ia32", 4, 2, 0xfffff000ULL, 0xfffff000ULL, false,
+   {{22, 10, 0xffc00000ULL},
+    {12, 10, 0}}},
+
+  // Bits 31:30 index the page directory pointer table, which is 32 byte
+  // aligned.
+  {"pae", 8, 3, 0xffffffe0ULL, 0xffffffffff000ULL, false,
+   {{30, 2, 0},
+    {21, 9, 0xfffffffe00000ULL},
+    {12, 9, 0}}},
+
+  {"amd64", 8, 4, 0xffffffffff000ULL, 0xffffffffff000ULL, false,
+   {{39, 9, 0},
+    {30, 9, 0xfffffc0000000ULL},
+    {21, 9, 0xfffffffe00000ULL},
+    {12, 9, 0}}},
+
+  {"ept", 8, 4, 0xffffffffff000ULL, 0xffffffffff000ULL, true,
+   {{39, 9, 0},
+    {30, 9, 0xfffffc0000000ULL},
+    {21, 9, 0xfffffffe00000ULL},
+    {12, 9, 0}}},
+
+  {NULL}
+};
 
- error:
-  return 0;
-}
 
+static int PagedMemory_init(PagedMemory *self, PyObject *args,
+                            PyObject *kwds) {
+  static char *kwlist[] = {"base", "dtb", "mode", NULL};
+  PyObject *base = NULL;
+  char *mode = "amd64";
+  paging_mode *i;
 
-static int AMD64PagedMemory_init(AMD64PagedMemory *self, PyObject *args,
-                                 PyObject *kwds) {
-  static char *kwlist[] = {"base", "dtb", NULL};
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "OK|s", kwlist,
+                                  &base, &self->dtb, &mode))
+    goto error;
 
-  self->base = NULL;
-  self->dtb = 0;
+  self->mode = NULL;
+  for (i = paging_modes; i->name; i++) {
+    if (!strcmp(i->name, mode)) {
+      self->mode = i;
+      break;
+    }
+  }
 
-  if(!PyArg_ParseTupleAndKeywords(args, kwds, "OK", kwlist,
-                                  &self->base, &self->dtb))
+  if (!self->mode) {
+    PyErr_Format(PyExc_ValueError, "Unknown paging mode %s.", mode);
     goto error;
+  }
 
-  self->_read = _read_from_python_base;
+  Py_XDECREF(self->base);
+  Py_INCREF(base);
+  self->base = base;
 
-  Py_IncRef(self->base);
+  memset(self->table_valid, 0, sizeof(self->table_valid));
 
   return 0;
 
@@ -53,460 +74,328 @@ static int AMD64PagedMemory_init(AMD64PagedMemory *self, PyObject *args,
 };
 
 
-static uint64_t _unpack_uint64(unsigned char *str) {
-  uint64_t decoded = 0;
-  int i;
-
-  // Little endian decoding: 8 bytes for 64 bits.
-  for (i=0; i < 8; i++) {
-    decoded |= ((uint64_t)str[i]) << (8*i);
-  }
-
-  return decoded;
+static void PagedMemory_dealloc(PagedMemory *self) {
+  Py_XDECREF(self->base);
+  self->ob_type->tp_free((PyObject *)self);
 }
 
-/* Read a single 64 bit int from the image.
 
- */
-static uint64_t _read_long_long_phys(AMD64PagedMemory *self, uint64_t address) {
-  unsigned char result[sizeof(uint64_t)];
+/* Read a page of physical memory from the base address space.
 
-  // Read directly into the buffer.
-  if (!self->_read(self, address, sizeof(result), (char *)result))
-    goto error;
+   Returns false if the entire page could not be read.
+ */
+static bool _read_page(PagedMemory *self, uint64_t addr, unsigned char *out) {
+  PyObject *buffer = PyObject_CallMethod(self->base, "read", "KI", addr,
+                                         PAGE_SIZE);
+  bool result = false;
+
+  if (!buffer) {
+    // An error occured in the base address space. We ignore the error and
+    // treat the page as unreadable.
+    PyErr_Clear();
+    return false;
+  }
 
-  // Decode as a uint64_t.
-  return _unpack_uint64(result);
+  if (PyString_Check(buffer) && PyString_GET_SIZE(buffer) == PAGE_SIZE) {
+    memcpy(out, PyString_AS_STRING(buffer), PAGE_SIZE);
+    result = true;
+  }
 
-  error:
-    // An error occured in the base address space. We ignore the error and just
-    // return 0.
-    PyErr_Clear();
-    return 0;
-};
+  Py_DECREF(buffer);
 
-static uint64_t get_two_meg_paddr(uint64_t vaddr, uint64_t pde) {
-  return (pde & 0xfffffffe00000) | (vaddr & 0x1fffff);
+  return result;
 }
 
-static uint64_t get_one_gig_paddr(AMD64PagedMemory *self, uint64_t vaddr,
-                                  uint64_t pdpte) {
 
-  return (pdpte & 0xfffffc0000000) | (vaddr & 0x3fffffff);
-}
+static uint64_t _unpack(unsigned char *str, int size) {
+  uint64_t decoded = 0;
+  int i;
 
-static uint64_t get_phys_addr(uint64_t vaddr, uint64_t pte_value) {
+  // Little endian decoding.
+  for (i=0; i < size; i++) {
+    decoded |= ((uint64_t)str[i]) << (8*i);
+  }
 
-  return (pte_value & 0xfffff000) | (vaddr & 0xfff);
+  return decoded;
 }
 
-static bool entry_present(uint64_t entry) {
-  if (entry & 1) {
-    return true;
 
-    // The page is in transition and not a prototype.
-    // Thus, we will treat it as present.
-  } else if ((entry & (1 << 11)) && !(entry & (1 << 10))) {
-    return true;
+/* Read the page table entry at addr for the level.
+
+   The entire page table page is read and kept, so the next lookup in the same
+   table is free.
+ */
+static bool _read_entry(PagedMemory *self, int level, uint64_t addr,
+                        uint64_t *entry) {
+  uint64_t page = addr & ~(uint64_t)(PAGE_SIZE - 1);
+  unsigned char *table = self->table[level];
+
+  if (!self->table_valid[level] || self->table_addr[level] != page) {
+    self->table_valid[level] = false;
+    if (!_read_page(self, page, table))
+      return false;
+
+    self->table_addr[level] = page;
+    self->table_valid[level] = true;
   }
 
-  return false;
-}
+  *entry = _unpack(table + (addr & (PAGE_SIZE - 1)), self->mode->entry_size);
 
-static bool page_size_flag(uint64_t entry) {
-  return (entry & (1 << 7));
+  return true;
 }
 
-static void _add_range(PyObject *result,
-                       uint64_t virt_addr, uint64_t length, uint64_t phys_addr,
-                       uint64_t *last_virt_address, uint64_t *last_length,
-                       uint64_t *last_physical_address) {
-  if(*last_virt_address + *last_length == virt_addr &&
-     *last_physical_address + *last_length == phys_addr) {
-    *last_length += length;
-  } else {
-
-    // Skip zero length regions.
-    if (*last_length > 0) {
-      // Flush the last entry to the result list.
-      PyObject *list=PyTuple_New(3);
-      PyTuple_SET_ITEM(list, 0,
-                       PyLong_FromUnsignedLongLong(*last_virt_address));
-
-      PyTuple_SET_ITEM(list, 1,
-                       PyLong_FromUnsignedLongLong(*last_length));
-
-      PyTuple_SET_ITEM(list, 2,
-                       PyLong_FromUnsignedLongLong(*last_physical_address));
-
-      PyList_Append(result, list);
-    };
-
-    *last_virt_address = virt_addr;
-    *last_length = length;
-    *last_physical_address = phys_addr;
-  }
-};
 
+static bool _entry_present(PagedMemory *self, uint64_t entry) {
+  // A page entry being present depends only on bits 2:0 for EPT translation.
+  if (self->mode->ept)
+    return entry & 0x7;
 
-static PyObject *_get_memory_map(AMD64PagedMemory *self, uint64_t start,
-                                 Py_ssize_t length) {
-  PyObject *result = PyList_New(0);
-  page_table_lookup lookup;
-  uint64_t pml4e_addr, pml4e_value, pdpte_addr, pdpte_value;
-  uint64_t pde_addr, pde_value, pte_addr, pte_table_addr;
-  uint64_t last_virt_address = 0;
-  uint64_t last_physical_address = 0;
-  uint64_t last_length = 0;
-  uint64_t total_length = 0;
+  if (entry & 1)
+    return true;
 
-  unsigned char pte_table[0x1000];
-  uint64_t pml4e_start, vaddr;
+  // The page is in transition and not a prototype.
+  // Thus, we will treat it as present.
+  if ((entry & (1 << 11)) && !(entry & (1 << 10)))
+    return true;
 
-  memset(&lookup, 0, sizeof(lookup));
+  return false;
+}
 
-  /* Even if the initial memory range is invalid, the lookup should contain
-     partial data.
-  */
-  _vtop(self, start, &lookup);
 
-  pml4e_start = lookup.pml4e_addr;
-  if (pml4e_start == 0) {
-    pml4e_start = self->dtb & 0xffffffffff000;
-  }
+/* Walk the page tables to translate vaddr.
 
-  // Pages that hold PDEs and PTEs are 0x1000 bytes each.
-  // Each PDE and PTE is eight bytes. Thus there are 0x1000 / 8 = 0x200
-  // PDEs and PTEs we must test.
-  for (pml4e_addr = pml4e_start;
-       pml4e_addr < (self->dtb & 0xffffffffff000) + 0x1000; // Last entry in pml4e.
-       pml4e_addr += 8) {
-    uint64_t pdpte_start = lookup.pdpte_addr;
+   Returns false if the address is not mapped.
+ */
+static bool _vtop(PagedMemory *self, uint64_t vaddr, uint64_t *paddr) {
+  paging_mode *mode = self->mode;
+  uint64_t table_addr = self->dtb & mode->root_mask;
+  uint64_t entry;
+  int i;
 
-    pml4e_value = _read_long_long_phys(self, pml4e_addr);
+  for (i = 0; i < mode->levels; i++) {
+    paging_level *level = &mode->level[i];
+    uint64_t index = (vaddr >> level->shift) & ((1ULL << level->bits) - 1);
 
-    if (!entry_present(pml4e_value))
-      continue;
+    if (!_read_entry(self, i, table_addr | (index * mode->entry_size), &entry)
+        || !_entry_present(self, entry))
+      return false;
 
-    if (pdpte_start == 0) {
-      pdpte_start = pml4e_value & 0xffffffffff000;
+    // The last level maps a 4kb page.
+    if (i == mode->levels - 1) {
+      *paddr = (entry & mode->table_mask) | (vaddr & (PAGE_SIZE - 1));
+      return true;
     }
 
-    for (pdpte_addr=pdpte_start;
-         pdpte_addr<(pml4e_value & 0xffffffffff000) + 0x1000;
-         pdpte_addr+=8) {
-      uint64_t pde_start = lookup.pde_addr;
-
-      pdpte_value = _read_long_long_phys(self, pdpte_addr);
-      if (!entry_present(pdpte_value))
-        continue;
-
-      // One gig pages.
-      if (page_size_flag(pdpte_value)) {
-        vaddr = ((pml4e_addr & 0xff8) << 36 |
-                 (pdpte_addr & 0xff8) << 27);
-
-        _add_range(result, vaddr, 0x40000000,
-                   get_one_gig_paddr(self, vaddr, pdpte_value),
-                   &last_virt_address, &last_length, &last_physical_address);
-
-        total_length += 0x40000000;
-        if (length && total_length > length) goto done;
-        continue;
-      };
-
-      if (pde_start == 0) {
-        pde_start = pdpte_value & 0xffffffffff000;
-      }
-
-      for (pde_addr=pde_start;
-           pde_addr<(pdpte_value & 0xffffffffff000) + 0x1000;
-           pde_addr+=8) {
-        uint64_t pte_start = lookup.pte_addr;
-
-        pde_value = _read_long_long_phys(self, pde_addr);
-        if (!entry_present(pde_value))
-          continue;
-
-        // 2mb pages.
-        if (page_size_flag(pde_value)) {
-          vaddr = ((pml4e_addr & 0xff8) << 36 |
-                   (pdpte_addr & 0xff8) << 27 |
-                   (pde_addr   & 0xff8) << 18);
-
-          _add_range(result, vaddr, 0x200000, get_two_meg_paddr(vaddr, pde_value),
-                     &last_virt_address, &last_length, &last_physical_address);
-          total_length += 0x200000;
-          if (length && total_length > length) goto done;
-
-          continue;
-        };
-
-
-        // This reads the entire PTE table at once - On windows where IO is
-        // extremely expensive, its about 10 times more efficient than reading
-        // it one value at the time - and this loop is HOT!
-        pte_table_addr = pde_value & 0xffffffffff000;
-        if(!self->_read(self, pte_table_addr, sizeof(pte_table),
-                        (char *)pte_table))
-          goto error;
-
-        if (pte_start == 0) {
-          pte_start = pde_value & 0xffffffffff000;
-        }
-
-        for (pte_addr=pte_start;
-             pte_addr<(pde_value & 0xffffffffff000) + 0x1000;
-             pte_addr+=8) {
-
-          uint64_t pte_value = _unpack_uint64(pte_table +
-                                              (pte_addr - pte_table_addr));
-
-          if (entry_present(pte_value)) {
-            vaddr = ((pml4e_addr & 0xff8) << 36 |
-                     (pdpte_addr & 0xff8) << 27 |
-                     (pde_addr   & 0xff8) << 18 |
-                     (pte_addr   & 0xff8) << 9);
-
-            _add_range(result, vaddr, 0x1000,
-                       get_phys_addr(vaddr, pte_value),
-                       &last_virt_address, &last_length, &last_physical_address);
-            total_length += 0x1000;
-            if (length && total_length > length) goto done;
-          }
-        };
-
-        // Next time around the loop - start at the begining.
-        lookup.pte_addr = 0;
-      }
-
-      // Next time around the loop - start at the begining.
-      lookup.pde_addr = 0;
+    // A large page.
+    if (level->large_page_mask && (entry & PAGE_SIZE_FLAG)) {
+      *paddr = ((entry & level->large_page_mask) |
+                (vaddr & ((1ULL << level->shift) - 1)));
+      return true;
     }
 
-    // Next time around the loop - start at the begining.
-    lookup.pdpte_addr = 0;
+    table_addr = entry & mode->table_mask;
   }
 
+  return false;
+}
 
- done:
-  // Include the last range.
-  _add_range(result, -1, -1, -1,
-             &last_virt_address, &last_length, &last_physical_address);
 
-  return result;
+/* Append the pending range to the result.
 
- error:
-  // Delete the result.
-  Py_DecRef(result);
+   Returns 0 on success or -1 on error.
+ */
+static int _flush_range(walk_state *state) {
+  PyObject *range;
+  int error;
 
-  return NULL;
-};
+  if (!state->run_length)
+    return 0;
 
-static PyObject *AMD64PagedMemory_get_available_addresses(AMD64PagedMemory *self,
-                                                          PyObject *args,
-                                                          PyObject *kwds) {
-  static char *kwlist[] = {"start", "length", NULL};
-  uint64_t start = 0;
-  uint64_t length = -1;
+  range = Py_BuildValue("(KKK)", state->run_vaddr, state->run_paddr,
+                        state->run_length);
+  if (!range)
+    return -1;
 
-  if(!PyArg_ParseTupleAndKeywords(args, kwds, "|KK", kwlist, &start, &length))
-    goto error;
+  error = PyList_Append(state->result, range);
+  Py_DECREF(range);
 
-  return _get_memory_map(self, start, length);
+  state->run_length = 0;
 
- error:
-  return NULL;
+  return error;
 }
 
 
-static int _vtop(AMD64PagedMemory *self, uint64_t vaddr,
-                 page_table_lookup *result) {
-
-  result->pml4e_addr = ((self->dtb & 0xffffffffff000) |
-                        ((vaddr & 0xff8000000000) >> 36));
-
-  result->pml4e = _read_long_long_phys(self, result->pml4e_addr);
-  if (!entry_present(result->pml4e)) {
-    goto invalid;
-  }
-
-  result->pdpte_addr = ((result->pml4e & 0xffffffffff000) |
-                        ((vaddr & 0x7fc0000000) >> 27));
-  result->pdpte = _read_long_long_phys(self, result->pdpte_addr);
-  if (!entry_present(result->pdpte)) {
-    goto invalid;
-  }
-
-  if (page_size_flag(result->pdpte)) {
-    result->paddr = get_one_gig_paddr(self, vaddr, result->pdpte);
-    goto ok;
-  }
+/* Add a mapped range to the result.
 
-  result->pde_addr = ((result->pdpte & 0xffffffffff000) |
-                      ((vaddr & 0x3fe00000) >> 18));
-  result->pde = _read_long_long_phys(self, result->pde_addr);
-  if (!entry_present(result->pde)) {
-    goto invalid;
-  }
+   Returns 0 on success or -1 on error. Sets state->stopped if the limit is
+   reached.
+ */
+static int _add_range(walk_state *state, uint64_t vaddr, uint64_t paddr,
+                      uint64_t length) {
+  if (state->run_length) {
+    if (state->coalesce &&
+        state->run_vaddr + state->run_length == vaddr &&
+        state->run_paddr + state->run_length == paddr) {
+      state->run_length += length;
+      return 0;
+    }
 
-  if (page_size_flag(result->pde)) {
-    result->paddr = get_two_meg_paddr(vaddr, result->pde);
-    goto ok;
-  }
+    // The pending range is complete. If it is the last one we may return,
+    // resume from this range next time.
+    if (state->limit &&
+        PyList_GET_SIZE(state->result) + 1 >= state->limit) {
+      state->stopped = true;
+      state->resume = vaddr;
+      return 0;
+    }
 
-  result->pte_addr = ((result->pde & 0xffffffffff000) |
-                      ((vaddr & 0x1ff000) >> 9));
-  result->pte = _read_long_long_phys(self, result->pte_addr);
-  if (!entry_present(result->pte)) {
-    goto invalid;
+    if (_flush_range(state) < 0)
+      return -1;
   }
 
-  result->paddr = ((result->pte & 0xfffff000) |
-                   (vaddr & 0xfff));
-
- ok:
-  return 1;
+  state->run_vaddr = vaddr;
+  state->run_paddr = paddr;
+  state->run_length = length;
 
- invalid:
   return 0;
 }
 
-static PyObject *AMD64PagedMemory_vtop(AMD64PagedMemory *self, PyObject *args,
-                                       PyObject *kwds) {
-  static char *kwlist[] = {"offset", NULL};
-  uint64_t vaddr = 0;
-  page_table_lookup result;
-
-  if(!PyArg_ParseTupleAndKeywords(args, kwds, "K", kwlist, &vaddr))
-    goto error;
-
-  if(!_vtop(self, vaddr, &result))
-    goto invalid;
 
-  PyErr_Clear();
-  return PyLong_FromUnsignedLongLong(result.paddr);
+/* Enumerate the valid pages in the page table at table_addr.
 
- invalid:
-  Py_RETURN_NONE;
+   Returns 0 on success or -1 on error.
+ */
+static int _walk(PagedMemory *self, int level, uint64_t table_addr,
+                 uint64_t vbase, walk_state *state) {
+  paging_mode *mode = self->mode;
+  paging_level *this_level;
+  uint64_t span, count, index, entry;
+  int result;
+
+  if (level < 0 || level >= MAX_LEVELS || level >= mode->levels)
+    return 0;
 
- error:
-  return 0;
-};
+  this_level = &mode->level[level];
+  span = 1ULL << this_level->shift;
+  count = 1ULL << this_level->bits;
 
+  for (index = 0; index < count; index++) {
+    uint64_t vaddr = vbase | (index << this_level->shift);
 
+    // Skip ranges before the start without reading them.
+    if (vaddr + span <= state->start)
+      continue;
 
+    if (!_read_entry(self, level, table_addr | (index * mode->entry_size),
+                     &entry) || !_entry_present(self, entry))
+      continue;
 
+    if (level == mode->levels - 1) {
+      result = _add_range(state, vaddr, entry & mode->table_mask, span);
 
-static PyObject *AMD64PagedMemory_read(AMD64PagedMemory *self, PyObject *args, PyObject *kwds) {
-  static char *kwlist[] = {"offset", "length", NULL};
-  uint64_t offset = 0;
-  Py_ssize_t length = 0;
-  PyObject *result, *map;
-  char *out_buffer;
-  int out_index = 0;
-  int i;
+    } else if (this_level->large_page_mask && (entry & PAGE_SIZE_FLAG)) {
+      result = _add_range(state, vaddr, entry & this_level->large_page_mask,
+                          span);
 
-  if(!PyArg_ParseTupleAndKeywords(args, kwds, "KI", kwlist,
-                                  &offset, &length))
-    goto error;
+    } else {
+      result = _walk(self, level + 1, entry & mode->table_mask, vaddr, state);
+    }
 
-  if (length > MAX_READ_LENGTH) {
-    PyErr_Format(PyExc_IOError, "Read buffer size too large (%lu).", length);
-    goto error;
-  };
+    if (result < 0)
+      return -1;
 
-  // Since we are reading from memory we can never actually fail this read -
-  // even if the pages are not mapped, we just zero pad them. Therefore we just
-  // allocate the entire buffer here and clear it.
-  result = PyString_FromStringAndSize(NULL, length);
-  if (!result) goto error;
+    if (state->stopped)
+      return 0;
+  }
 
-  out_buffer = PyString_AS_STRING(result);
+  return 0;
+}
 
-  // Clear the buffer.
-  memset(out_buffer, 0, length);
 
-  // Get the memory map for the next read.
-  map = _get_memory_map(self, offset, length);
-  if(!map) goto error_with_result;
+static PyObject *PagedMemory_vtop(PagedMemory *self, PyObject *args,
+                                  PyObject *kwds) {
+  static char *kwlist[] = {"offset", NULL};
+  uint64_t vaddr = 0;
+  uint64_t paddr;
 
-  // Use the map to read as much as we need.
-  for(i=0; i<PyList_Size(map); i++) {
-    PyObject *item = PyList_GetItem(map, i);
-    uint64_t virt_addr = PyLong_AsLongLong(PyTuple_GetItem(item, 0));
-    uint64_t range_length = PyLong_AsLongLong(PyTuple_GetItem(item, 1));
-    uint64_t physical_addr = PyLong_AsLongLong(PyTuple_GetItem(item, 2));
-    Py_ssize_t available_to_read;
-    int chunk_offset;
-    int data_read;
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "K", kwlist, &vaddr))
+    return NULL;
 
-    // We are reading before the next available range - we just skip up to it.
-    if(virt_addr > offset) {
-      length -= virt_addr - offset;
-      out_index += virt_addr - offset;
-      offset = virt_addr;
-    };
+  if(!_vtop(self, vaddr, &paddr))
+    Py_RETURN_NONE;
 
-    // We are done reading.
-    if (length <= 0) break;
+  return PyLong_FromUnsignedLongLong(paddr);
+};
 
-    // The relative offset inside the chunk.
-    chunk_offset = offset - virt_addr;
 
-    // How much data is in this memory range?
-    available_to_read = MIN(length, range_length - chunk_offset);
+static PyObject *PagedMemory_get_available_addresses(PagedMemory *self,
+                                                     PyObject *args,
+                                                     PyObject *kwds) {
+  static char *kwlist[] = {"start", "limit", "coalesce", NULL};
+  walk_state state;
+  PyObject *coalesce = Py_False;
 
-    // Read the chunk from the base address space.
-    data_read = self->_read(self, physical_addr + chunk_offset,
-                            available_to_read, out_buffer + out_index);
-    if (!data_read)
-      goto error_with_map;
+  memset(&state, 0, sizeof(state));
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "|KnO", kwlist,
+                                  &state.start, &state.limit, &coalesce))
+    return NULL;
 
-    // Advance the destination buffer pointer.
-    out_index += data_read;
+  state.coalesce = PyObject_IsTrue(coalesce);
+  state.result = PyList_New(0);
+  if (!state.result)
+    return NULL;
 
-    // Adjust the offset and length in the virtual address space.
-    length -= data_read;
-    offset += data_read;
-  };
+  if (_walk(self, 0, self->dtb & self->mode->root_mask, 0, &state) < 0 ||
+      _flush_range(&state) < 0) {
+    Py_DECREF(state.result);
+    return NULL;
+  }
 
-  Py_DecRef(map);
+  if (state.stopped)
+    return Py_BuildValue("(NK)", state.result, state.resume);
 
-  return result;
+  return Py_BuildValue("(NO)", state.result, Py_None);
+}
 
- error_with_map:
-  Py_DecRef(map);
 
- error_with_result:
-  Py_DecRef(result);
+static PyObject *PagedMemory_flush(PagedMemory *self) {
+  memset(self->table_valid, 0, sizeof(self->table_valid));
 
- error:
-  return 0;
-};
+  Py_RETURN_NONE;
+}
 
-static PyMethodDef AMD64PagedMemory_methods[] = {
-  {"read",(PyCFunction)AMD64PagedMemory_read, METH_VARARGS|METH_KEYWORDS,
-   "Read a buffer from the base address space.\n"},
 
-  {"vtop",(PyCFunction)AMD64PagedMemory_vtop, METH_VARARGS|METH_KEYWORDS,
+static PyMethodDef PagedMemory_methods[] = {
+  {"vtop",(PyCFunction)PagedMemory_vtop, METH_VARARGS|METH_KEYWORDS,
    "Converts a virtual offset to a physical offset. Returns None if invalid.\n"},
 
-  {"get_available_addresses",(PyCFunction)AMD64PagedMemory_get_available_addresses,
+  {"get_available_addresses",
+   (PyCFunction)PagedMemory_get_available_addresses,
    METH_VARARGS|METH_KEYWORDS,
-   "Returns a list of lists of available memory ranges.\n"},
+   "get_available_addresses(start=0, limit=0, coalesce=False) -> "
+   "(ranges, resume)\n"
+   "\n"
+   "Returns a list of (virtual address, physical address, length) for the\n"
+   "mapped pages, in order. Pages ending before start are skipped. If\n"
+   "coalesce is set, pages which are contiguous in both the virtual and\n"
+   "physical address spaces are merged into a single range. If limit is\n"
+   "set, at most limit ranges are returned and resume is the address to\n"
+   "continue from (or None if there are no more ranges).\n"},
+
+  {"flush",(PyCFunction)PagedMemory_flush, METH_NOARGS,
+   "Forget the cached page table pages.\n"},
 
   {NULL}  /* Sentinel */
 };
 
 
-static PyTypeObject AMD64PagedMemory_Type = {
+static PyTypeObject PagedMemory_Type = {
     PyObject_HEAD_INIT(NULL)
     0,                         /* ob_size */
-    "support.AMD64PagedMemory",               /* tp_name */
-    sizeof(AMD64PagedMemory),            /* tp_basicsize */
+    "support.PagedMemory",     /* tp_name */
+    sizeof(PagedMemory),       /* tp_basicsize */
     0,                         /* tp_itemsize */
-    (destructor)0,             /* tp_dealloc */
+    (destructor)PagedMemory_dealloc, /* tp_dealloc */
     0,                         /* tp_print */
     0,                         /* tp_getattr */
     0,                         /* tp_setattr */
@@ -522,14 +411,14 @@ static PyTypeObject AMD64PagedMemory_Type = {
     0,                         /* tp_setattro */
     0,                         /* tp_as_buffer */
     Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,        /* tp_flags */
-    AMD64PagedMemory__doc__,   /* tp_doc */
+    PagedMemory__doc__,        /* tp_doc */
     0,	                       /* tp_traverse */
     0,                         /* tp_clear */
     0,                         /* tp_richcompare */
     0,                         /* tp_weaklistoffset */
     (getiterfunc)0,            /* tp_iter */
     (iternextfunc)0,           /* tp_iternext */
-    AMD64PagedMemory_methods,  /* tp_methods */
+    PagedMemory_methods,       /* tp_methods */
     0,                         /* tp_members */
     0,                         /* tp_getset */
     0,                         /* tp_base */
@@ -537,7 +426,7 @@ static PyTypeObject AMD64PagedMemory_Type = {
     0,                         /* tp_descr_get */
     0,                         /* tp_descr_set */
     0,                         /* tp_dictoffset */
-    (initproc)AMD64PagedMemory_init,      /* tp_init */
+    (initproc)PagedMemory_init, /* tp_init */
     0,                         /* tp_alloc */
     0,                         /* tp_new */
 };
@@ -558,12 +447,12 @@ PyMODINIT_FUNC initsupport(void) {
   PyEval_InitThreads();
   gstate = PyGILState_Ensure();
 
-  AMD64PagedMemory_Type.tp_new = PyType_GenericNew;
-  if (PyType_Ready(&AMD64PagedMemory_Type) < 0)
+  PagedMemory_Type.tp_new = PyType_GenericNew;
+  if (PyType_Ready(&PagedMemory_Type) < 0)
     goto exit;
 
-  Py_IncRef((PyObject *)&AMD64PagedMemory_Type);
-  PyModule_AddObject(m, "AMD64PagedMemory", (PyObject *)&AMD64PagedMemory_Type);
+  Py_INCREF((PyObject *)&PagedMemory_Type);
+  PyModule_AddObject(m, "PagedMemory", (PyObject *)&PagedMemory_Type);
 
  exit:
   PyGILState_Release(gstate);
@@ -3,61 +3,115 @@
 #include <stdbool.h>
 
 
-static char AMD64PagedMemory__doc__[] = "Standard AMD 64-bit address space.\n"
+static char PagedMemory__doc__[] = "A native page table walker.\n"
 "\n"
-"    Provides an address space for AMD64 paged memory, aka the x86_64\n"
-"    architecture, which is laid out similarly to Physical Address\n"
-"    Extensions (PAE). Allows callers to map virtual address to\n"
-"    offsets in physical memory.\n"
+"    PagedMemory(base, dtb, mode='amd64')\n"
 "\n"
-"    Create a new AMD64 address space to sit on top of the base address\n"
-"    space and a Directory Table Base (CR3 value) of 'dtb'.\n"
+"    Walks the page tables rooted at 'dtb' in the base address space. The\n"
+"    mode selects the paging mode:\n"
+"\n"
+"    ia32: Standard x86 32 bit paging (with 4mb pages).\n"
+"    pae: x86 32 bit paging with Physical Address Extensions.\n"
+"    amd64: IA-32e paging (with 2mb and 1gb pages).\n"
+"    ept: Intel VT-x Extended Page Tables (dtb is the EPT pointer).\n"
+"\n"
+"    Translations exactly match the python implementations in\n"
+"    rekall.plugins.addrspaces.intel and rekall.plugins.addrspaces.amd64.\n"
 "\n"
 "    Comments in this class mostly come from the Intel(R) 64 and IA-32\n"
 "    Architectures Software Developer's Manual Volume 3A: System Programming\n"
-"    Guide, Part 1, revision 031, pages 4-8 to 4-15. This book is available\n"
+"    Guide, Part 1, revision 031, pages 4-8 to 4-23. This book is available\n"
 "    for free at http://www.intel.com/products/processor/manuals/index.htm.\n"
-"    Similar information is also available from Advanced Micro Devices (AMD)\n"
-"    at http://support.amd.com/us/Processor_TechDocs/24593.pdf.\n"
 "    \n";
 
-// Reads must stay below this size to protect process memory usage.
-#define MAX_READ_LENGTH 100 * 1024 * 1024
 
+#define PAGE_SIZE 0x1000
+
+// The most levels of page tables of any paging mode.
+#define MAX_LEVELS 4
 
-#define MIN(X,Y) ((X) < (Y) ? (X) : (Y))
+// The page size flag of a page directory (or page directory pointer) entry.
+#define PAGE_SIZE_FLAG (1 << 7)
+
+
+/* A level of page tables. */
+typedef struct {
+  // The virtual address bits [shift + bits - 1 : shift] index this table.
+  int shift;
+  int bits;
+
+  // If an entry at this level may map a large page, the mask of the physical
+  // address bits in the entry. Otherwise 0.
+  uint64_t large_page_mask;
+} paging_level;
+
+
+/* Describes the page table layout of a paging mode. */
+typedef struct {
+  const char *name;
+
+  // The size of each page table entry (4 or 8 bytes).
+  int entry_size;
+  int levels;
+
+  // The mask applied to the dtb to find the first table.
+  uint64_t root_mask;
+
+  // The mask applied to an entry to find the next table (or the page frame
+  // in the last level).
+  uint64_t table_mask;
+
+  // EPT entries are present if any of the RWX bits are set.
+  bool ept;
+
+  paging_level level[MAX_LEVELS];
+} paging_mode;
 
 
-/* Looking up a page table may fill all these value. */
 typedef struct {
-  // For each page table entry we collect the address and the value of it.
-  uint64_t pml4e_addr;
-  uint64_t pml4e;
-  uint64_t pdpte_addr;
-  uint64_t pdpte;
-  uint64_t pde_addr;
-  uint64_t pde;
-  uint64_t pte_addr;
-  uint64_t pte;
-  uint64_t paddr;
-} page_table_lookup;
-
-typedef struct AMD64PagedMemory_t {
   PyObject_HEAD
   PyObject *base;
   uint64_t dtb;
-  int (*_read)(struct AMD64PagedMemory_t *self, uint64_t offset,
-               uint64_t length, char *out);
-} AMD64PagedMemory;
+  paging_mode *mode;
+
+  // The last page table page read at each level. Walks of adjacent addresses
+  // mostly hit these.
+  uint64_t table_addr[MAX_LEVELS];
+  bool table_valid[MAX_LEVELS];
+  unsigned char table[MAX_LEVELS][PAGE_SIZE];
+} PagedMemory;
+
+
+/* The state of a get_available_addresses() walk. */
+typedef struct {
+  PyObject *result;
+
+  // Ranges ending before start are skipped.
+  uint64_t start;
+
+  // Stop after this many ranges (0 means no limit).
+  Py_ssize_t limit;
 
-static int AMD64PagedMemory_init(AMD64PagedMemory *self, PyObject *args,
-                                 PyObject *kwds);
+  // Merge ranges which are contiguous in both address spaces.
+  bool coalesce;
 
+  // The range which is not yet added to the result.
+  uint64_t run_vaddr;
+  uint64_t run_paddr;
+  uint64_t run_length;
 
+  // If we stopped early, the virtual address to resume from.
+  bool stopped;
+  uint64_t resume;
+} walk_state;
 
 
+static int PagedMemory_init(PagedMemory *self, PyObject *args,
+                            PyObject *kwds);
+static void PagedMemory_dealloc(PagedMemory *self);
 
-static uint64_t _unpack_uint64(unsigned char *str);
-static uint64_t _read_long_long_phys(AMD64PagedMemory *self, uint64_t address);
-static int _vtop(AMD64PagedMemory *self, uint64_t vaddr,
-                 page_table_lookup *result);
+static bool _read_entry(PagedMemory *self, int level, uint64_t addr,
+                        uint64_t *entry);
+static bool _vtop(PagedMemory *self, uint64_t vaddr, uint64_t *paddr);
+static int _walk(PagedMemory *self, int level, uint64_t table_addr,
+                 uint64_t vbase, walk_state *state);
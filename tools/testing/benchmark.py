@@ -0,0 +1,644 @@
+#!/usr/bin/env python
+
+# Rekall
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+
+"""A benchmark suite to catch performance regressions.
+
+While the test suite (test_suite.py) catches changes in the output of plugins,
+this program catches changes in how long they take and how much memory they
+use.
+
+There are two kinds of benchmarks:
+
+- Micro benchmarks exercise hot code paths (scanning, page table walks, struct
+  member access, profile loading) on small synthetic images which are generated
+  locally - so they need no test images at all.
+
+- Macro benchmarks run plugins on a real image (specified with -f).
+
+Each benchmark is run in its own process and we record:
+
+- time: The best wall clock time of several runs (seconds).
+- rss_kb: The peak resident set size of the process (KB).
+- objects: The number of Rekall objects (obj.BaseObject instances) created in a
+  single run.
+
+No baseline is checked in because timings and memory use depend on the
+machine. To record a baseline, check out the revision to compare against and
+run (on the machine which will run the comparison):
+
+$ benchmark.py --baseline benchmarks.json --update
+
+This runs every benchmark and writes its metrics to benchmarks.json (running
+with --update again only replaces the benchmarks which were run). Then check
+out the new code - later runs compare against the baseline and exit with an
+error if any metric has grown by more than the threshold (default 25%):
+
+$ benchmark.py --baseline benchmarks.json
+Benchmark                      Metric         Baseline      Current  Status
+------------------------------ -------- ------------ ------------ -------
+scan                           time            0.512        0.498  OK
+...
+
+Plugins are benchmarked on an image like this:
+
+$ benchmark.py --baseline xp.json -f xp-laptop.raw --plugins pslist handles
+
+With --memoize_structs each plugin is also run with struct member memoization
+enabled, to measure its effect on the plugin.
+
+A benchmark which fails, crashes or runs for longer than --timeout seconds is
+reported as an error.
+"""
+
+__author__ = "Michael Cohen <scudette@gmail.com>"
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import Queue
+import random
+import resource
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+from rekall import addrspace
+from rekall import obj
+from rekall import registry
+from rekall import session
+from rekall import testlib
+
+# Import and register all the plugins.
+from rekall import plugins  # pylint: disable=unused-import
+from rekall.plugins.addrspaces import dtb_scanner
+from rekall.plugins.overlays import basic
+from rekall.plugins.windows import common
+
+
+# The amount of synthetic memory used by the micro benchmarks.
+SYNTHETIC_SIZE = 16 * 1024 * 1024
+
+# Metrics which are smaller than these are considered noise.
+NOISE = dict(time=0.01, rss_kb=2048, objects=0)
+
+
+class BenchmarkProfile(basic.Profile32Bits, basic.BasicClasses):
+    """A minimal profile for the synthetic images."""
+
+    @classmethod
+    def Initialize(cls, profile):
+        super(BenchmarkProfile, cls).Initialize(profile)
+        profile.add_types({
+            '_POOL_HEADER': [0x8, {
+                'BlockSize': [0x2, ['BitField', dict(
+                    start_bit=0, end_bit=9, native_type="unsigned short")]],
+                'PoolTag': [0x4, ['unsigned int']],
+                }],
+            '_BENCHMARK_STRUCT': [0x20, {
+                'Flags': [0x0, ['unsigned int']],
+                'Size': [0x4, ['unsigned int']],
+                'Next': [0x8, ['Pointer', dict(target="_BENCHMARK_STRUCT")]],
+                'Name': [0x10, ['String', dict(length=16)]],
+                }],
+            })
+        profile.add_constants(PoolAlignment=8, MaxPointer=2**32 - 1)
+
+
+class BenchmarkPoolScanner(common.PoolScanner):
+    checks = [('PoolTagCheck', dict(tag="Bnch")),
+              ('CheckPoolSize', dict(min_size=0x40))]
+
+
+class Benchmark(object):
+    """A single benchmark."""
+
+    __metaclass__ = registry.MetaclassRegistry
+    __abstract = True
+
+    # The name used in the baseline file.
+    name = None
+
+    def __init__(self, flags):
+        self.flags = flags
+        self.session = session.Session(cache_dir="")
+
+    def setup(self):
+        """Prepare for running - this is not timed."""
+
+    def run(self):
+        """The code to benchmark. This may be run several times."""
+        raise NotImplementedError()
+
+    def cleanup(self):
+        """Called when the benchmark is done."""
+
+
+class ScanBenchmark(Benchmark):
+    """Pool scanning of memory with planted pool headers."""
+
+    name = "scan"
+
+    def setup(self):
+        rand = random.Random(1)
+        data = bytearray(rand.getrandbits(8) for _ in xrange(0x10000))
+        data *= SYNTHETIC_SIZE / len(data)
+
+        # Plant a pool allocation every 16kb or so.
+        for offset in xrange(0, SYNTHETIC_SIZE - 0x100, 0x4000):
+            offset += rand.randrange(0, 0x100) * 8
+            data[offset:offset + 8] = struct.pack(
+                "<HH4s", 0, 0x10, "Bnch")
+
+        self.address_space = addrspace.BufferAddressSpace(
+            data=str(data), session=self.session)
+        self.profile = BenchmarkProfile(session=self.session)
+
+    def run(self):
+        scanner = BenchmarkPoolScanner(
+            profile=self.profile, session=self.session,
+            address_space=self.address_space)
+
+        for _ in scanner.scan(maxlen=SYNTHETIC_SIZE):
+            pass
+
+
+class VtopBenchmark(Benchmark):
+    """AMD64 page table walks over synthetic page tables."""
+
+    name = "vtop"
+
+    # Map this many 4kb pages.
+    PAGES = 0x4000
+
+    def setup(self):
+        rand = random.Random(2)
+        tables = testlib.SyntheticPageTables("amd64", table_base=0x100000)
+        physical_pages = range(self.PAGES)
+        rand.shuffle(physical_pages)
+
+        self.addresses = []
+        for i, page in enumerate(physical_pages):
+            # Spread the pages over several page tables.
+            vaddr = 0xf80000000000 + (i / 0x80) * 0x200000 + (i % 0x80) * 0x1000
+            tables.map(vaddr, page * 0x1000)
+            self.addresses.append(vaddr + 0x10)
+
+            # Also translate some unmapped addresses.
+            self.addresses.append(vaddr + 0x100000)
+
+        # The default implementation (the accelerated one if available).
+        as_class = addrspace.BaseAddressSpace.classes["AMD64PagedMemory"]
+        self.address_space = as_class(
+            base=tables.address_space(self.session), dtb=tables.dtb,
+            session=self.session)
+
+    def run(self):
+        # Measure the page table walks, not the translation cache.
+        self.address_space.flush_translation_cache()
+        vtop = self.address_space.vtop
+        for address in self.addresses:
+            vtop(address)
+
+
+class PagedReadBenchmark(VtopBenchmark):
+    """Reading through an AMD64 address space."""
+
+    name = "paged_read"
+
+    def run(self):
+        self.address_space.flush_translation_cache()
+        for offset, _, length in self.address_space.get_address_ranges():
+            for i in xrange(offset, offset + length, 0x10000):
+                self.address_space.read(i, min(0x10000, offset + length - i))
+
+
+class SharedFileReadBenchmark(Benchmark):
+    """Reading kernel pages of an image file through many process spaces."""
+
+    name = "shared_file_read"
+
+    PAGES = 0x1000
+    PROCESSES = 20
+
+    def setup(self):
+        tables = testlib.SyntheticPageTables("amd64", table_base=0x1000000)
+        for i in range(self.PAGES):
+            tables.map(0xf80000000000 + i * 0x1000, i * 0x1000)
+
+        # Processes share the kernel's top level entries.
+        dtbs = []
+        for _ in range(self.PROCESSES):
+            dtb = tables._allocate_table()
+            tables.write(dtb, tables.memory[tables.dtb:tables.dtb + 0x1000])
+            dtbs.append(dtb)
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, "image.raw")
+        with open(self.filename, "wb") as fd:
+            fd.write(tables.memory)
+
+        self.dtbs = dtbs
+
+    def run(self):
+        self.session.block_caches = None
+        file_class = addrspace.BaseAddressSpace.classes["FileAddressSpace"]
+        as_class = addrspace.BaseAddressSpace.classes["AMD64PagedMemory"]
+        for dtb in self.dtbs:
+            # Each process has its own physical address space instance.
+            physical_as = file_class(
+                filename=self.filename, session=self.session)
+            process_as = as_class(
+                base=physical_as, dtb=dtb, session=self.session)
+
+            for i in xrange(0, self.PAGES, 4):
+                process_as.read(0xf80000000000 + i * 0x1000 + 0x10, 0x100)
+
+            physical_as.close()
+
+    def cleanup(self):
+        shutil.rmtree(self.temp_dir, True)
+
+
+class DTBScanBenchmark(Benchmark):
+    """Brute force scanning 64mb of memory for AMD64 DTBs."""
+
+    name = "dtbscan"
+
+    def setup(self):
+        tables = testlib.SyntheticPageTables("amd64", table_base=0x3000000)
+        tables.map(0xf80000001000, 0x5000)
+
+        # Processes share the kernel's top level entries.
+        for _ in range(100):
+            dtb = tables._allocate_table()
+            tables.write(dtb, tables.memory[tables.dtb:tables.dtb + 0x1000])
+
+        tables.write(0x4000000 - 0x1000, "\x00" * 0x1000)
+        self.scanner = dtb_scanner.DTBScanner(
+            address_space=tables.address_space(self.session), mode="amd64")
+
+    def run(self):
+        for _ in self.scanner.scan(0xf80000001000, paddr=0x5000):
+            pass
+
+
+class StructBenchmark(Benchmark):
+    """Struct member access (Struct.m())."""
+
+    name = "struct"
+
+    def setup(self):
+        self.profile = BenchmarkProfile(session=self.session)
+        self.address_space = addrspace.BufferAddressSpace(
+            data="\x01\x00\x00\x00" * 0x4000, session=self.session)
+
+    def run(self):
+        for offset in xrange(0, 0x10000 - 0x20, 0x20):
+            item = self.profile._BENCHMARK_STRUCT(
+                offset=offset, vm=self.address_space)
+            for _ in range(10):
+                _ = item.Flags.v() + item.Size.v() + item.Next.v()
+
+
+class MemoizedStructBenchmark(StructBenchmark):
+    """Struct member access with memoized members."""
+
+    name = "struct_memoized"
+
+    def setup(self):
+        self.session.SetParameter("memoize_structs", True)
+        super(MemoizedStructBenchmark, self).setup()
+
+
+class LoadProfileBenchmark(Benchmark):
+    """Loading and parsing a large JSON profile."""
+
+    name = "load_profile"
+
+    STRUCTS = 2000
+    FIELDS = 20
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        structs = {}
+        for i in range(self.STRUCTS):
+            structs["_STRUCT_%d" % i] = [self.FIELDS * 8, dict(
+                ("Field%d" % j, [j * 8, ["unsigned long long"]])
+                for j in range(self.FIELDS))]
+
+        self.path = os.path.join(self.temp_dir, "profile.json")
+        with open(self.path, "wb") as fd:
+            json.dump({
+                "$METADATA": dict(ProfileClass="Profile32Bits"),
+                "$CONSTANTS": dict(("Constant%d" % i, i * 0x10)
+                                   for i in range(self.STRUCTS)),
+                "$STRUCTS": structs}, fd)
+
+    def run(self):
+        self.session.LoadProfile(self.path, use_cache=False)
+
+    def cleanup(self):
+        shutil.rmtree(self.temp_dir, True)
+
+
+class CachedLoadProfileBenchmark(LoadProfileBenchmark):
+    """Loading a profile which is in the on disk cache."""
+
+    name = "load_profile_cached"
+
+    def setup(self):
+        super(CachedLoadProfileBenchmark, self).setup()
+        self.session = session.Session(
+            cache_dir=os.path.join(self.temp_dir, "cache"))
+
+        # Warm the cache.
+        self.run()
+
+
+class CompileTypesBenchmark(LoadProfileBenchmark):
+    """Compiling every type in a large profile and reading one member."""
+
+    name = "compile_types"
+
+    def setup(self):
+        super(CompileTypesBenchmark, self).setup()
+        self.profile = self.session.LoadProfile(self.path)
+        self.address_space = addrspace.BufferAddressSpace(
+            data="\x00" * self.FIELDS * 8, session=self.session)
+
+    def run(self):
+        self.profile.flush_cache()
+        for i in range(self.STRUCTS):
+            self.profile.Object("_STRUCT_%d" % i, offset=0,
+                                vm=self.address_space).Field1.v()
+
+
+class PluginBenchmark(Benchmark):
+    """Runs a plugin on a real image."""
+
+    __abstract = True
+
+    plugin = None
+
+    memoize_structs = False
+
+    def setup(self):
+        self.session = session.Session(
+            filename=self.flags.filename, profile=self.flags.profile,
+            memoize_structs=self.memoize_structs)
+
+    def run(self):
+        with open(os.devnull, "wb") as fd:
+            self.session.RunPlugin(self.plugin, fd=fd)
+
+
+def MakePluginBenchmark(plugin, filename, memoize_structs=False):
+    name = "plugin:%s@%s" % (plugin, os.path.basename(filename))
+    if memoize_structs:
+        name += "+memoized"
+
+    return type("PluginBenchmark_%s" % plugin, (PluginBenchmark,), dict(
+        name=name, plugin=plugin, memoize_structs=memoize_structs,
+        _PluginBenchmark__abstract=True))
+
+
+def CountObjects(func):
+    """Counts the Rekall objects created while running func."""
+    count = [0]
+    original = obj.BaseObject.__init__
+
+    def CountingInit(self, *args, **kwargs):
+        count[0] += 1
+        original(self, *args, **kwargs)
+
+    obj.BaseObject.__init__ = CountingInit
+    try:
+        func()
+    finally:
+        obj.BaseObject.__init__ = original
+
+    return count[0]
+
+
+def PeakRSS():
+    """The peak resident set size of this process in KB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # OSX reports this in bytes.
+    if sys.platform == "darwin":
+        rss /= 1024
+
+    return rss
+
+
+def RunBenchmark(benchmark_cls, flags, queue):
+    """Runs the benchmark and puts its metrics on the queue.
+
+    This runs in a child process, so the peak RSS is the benchmark's own.
+    """
+    benchmark = None
+    try:
+        benchmark = benchmark_cls(flags)
+        benchmark.setup()
+
+        times = []
+        for _ in range(flags.repeat):
+            gc.collect()
+            start = time.time()
+            benchmark.run()
+            times.append(time.time() - start)
+
+        result = dict(time=min(times), rss_kb=PeakRSS())
+        if not flags.no_objects:
+            result["objects"] = CountObjects(benchmark.run)
+
+        queue.put(result)
+
+    except Exception as e:  # pylint: disable=broad-except
+        queue.put(dict(error="%s: %s" % (e.__class__.__name__, e)))
+
+    finally:
+        if benchmark is not None:
+            benchmark.cleanup()
+
+
+def Measure(benchmark_cls, flags):
+    """Runs the benchmark in a child process and returns its metrics.
+
+    If the child dies without a result, or does not finish within
+    flags.timeout seconds, the result is an error.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=RunBenchmark, args=(benchmark_cls, flags, queue))
+    process.start()
+
+    deadline = time.time() + flags.timeout
+    result = None
+    try:
+        while result is None:
+            try:
+                result = queue.get(timeout=1)
+            except Queue.Empty:
+                if not process.is_alive():
+                    # The child may have put its result just before exiting.
+                    try:
+                        result = queue.get(timeout=1)
+                    except Queue.Empty:
+                        return dict(error="Exited with code %s." %
+                                    process.exitcode)
+
+                elif time.time() > deadline:
+                    return dict(error="Timed out after %s seconds." %
+                                flags.timeout)
+
+        process.join(flags.timeout)
+        if process.exitcode != 0 and "error" not in result:
+            return dict(error="Exited with code %s." % process.exitcode)
+
+        return result
+
+    finally:
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+
+def Compare(name, result, baseline, threshold):
+    """Compares the result with the baseline.
+
+    Returns:
+      A list of (metric, baseline value, current value, status) tuples.
+    """
+    rows = []
+    for metric in ("time", "rss_kb", "objects"):
+        if metric not in result:
+            continue
+
+        current = result[metric]
+        previous = baseline.get(name, {}).get(metric)
+        if previous is None:
+            status = "NEW"
+
+        elif (current > previous * (1 + threshold) and
+              current - previous > NOISE[metric]):
+            status = "REGRESSION"
+
+        else:
+            status = "OK"
+
+        rows.append((metric, previous, current, status))
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument("benchmarks", nargs="*",
+                        help="The benchmarks to run (default all).")
+    parser.add_argument("--baseline", default=None,
+                        help="The JSON file holding the baseline.")
+    parser.add_argument("--update", default=False, action="store_true",
+                        help="Write the results into the baseline file.")
+    parser.add_argument("--threshold", default=0.25, type=float,
+                        help="The allowed relative increase of a metric.")
+    parser.add_argument("--repeat", default=3, type=int,
+                        help="Time this many runs and record the fastest.")
+    parser.add_argument("--no_objects", default=False, action="store_true",
+                        help="Do not count the objects created.")
+    parser.add_argument("--timeout", default=600, type=int,
+                        help="Seconds to wait for each benchmark.")
+    parser.add_argument("-f", "--filename", default=None,
+                        help="The image to run plugin benchmarks on.")
+    parser.add_argument("-p", "--profile", default=None,
+                        help="The profile for the image (default autodetect).")
+    parser.add_argument("--plugins", nargs="+", default=[],
+                        help="The plugins to benchmark on the image.")
+    parser.add_argument("--memoize_structs", default=False,
+                        action="store_true",
+                        help="Also run the plugins with memoized structs.")
+
+    flags = parser.parse_args()
+
+    benchmarks = [cls for cls in Benchmark.classes.values()
+                  if not flags.benchmarks or cls.name in flags.benchmarks]
+    benchmarks.sort(key=lambda cls: cls.name)
+
+    if flags.plugins:
+        if not flags.filename:
+            parser.error("Plugin benchmarks need an image (-f).")
+
+        # Plugins are slow and their runs mostly hit caches when repeated.
+        benchmarks = [MakePluginBenchmark(plugin, flags.filename)
+                      for plugin in flags.plugins]
+
+        if flags.memoize_structs:
+            benchmarks = [
+                cls for plugin, plain in zip(flags.plugins, benchmarks)
+                for cls in (plain, MakePluginBenchmark(
+                    plugin, flags.filename, memoize_structs=True))]
+
+    baseline = {}
+    if flags.baseline and os.path.exists(flags.baseline):
+        with open(flags.baseline, "rb") as fd:
+            baseline = json.load(fd)
+
+    print "%-30s %-8s %12s %12s  %s" % (
+        "Benchmark", "Metric", "Baseline", "Current", "Status")
+    print "%s %s %s %s %s" % ("-" * 30, "-" * 8, "-" * 12, "-" * 12, "-" * 7)
+
+    regressions = 0
+    for benchmark_cls in benchmarks:
+        result = Measure(benchmark_cls, flags)
+        if "error" in result:
+            print "%-30s %s" % (benchmark_cls.name, result["error"])
+            regressions += 1
+            continue
+
+        for metric, previous, current, status in Compare(
+                benchmark_cls.name, result, baseline, flags.threshold):
+            if status == "REGRESSION":
+                regressions += 1
+
+            print "%-30s %-8s %12s %12s  %s" % (
+                benchmark_cls.name, metric,
+                "-" if previous is None else "%.3f" % previous,
+                "%.3f" % current, status)
+
+        if flags.update:
+            baseline[benchmark_cls.name] = result
+
+    if flags.update and flags.baseline:
+        with open(flags.baseline, "wb") as fd:
+            json.dump(baseline, fd, indent=2, sort_keys=True)
+
+    if regressions and not flags.update:
+        print "\n%d regressions or errors." % regressions
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()